@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+'''
+Compares the compiled hidpp20 packet decoders against decoding the
+descriptor dictionary field by field.
+'''
+
+import struct
+import timeit
+
+import logitechd.protocol.hidpp20
+
+
+class GetFwInfo(logitechd.protocol.hidpp20.Function):
+    id = 1
+    request = {'entity': 'B'}
+    response = {
+        'type': 'B',
+        'prefix': '3s',
+        'number': 'B',
+        'revision': 'B',
+        'build': 'H',
+        'active': 'B',
+        'pid': 'H',
+        'extra': '5s',
+    }
+
+
+REPORT = bytes([0x11, 0xff, 0x03, 0x11, 0x00, 0x55, 0x31, 0x32, 0x12, 0x04, 0x00, 0x2a, 0x01, 0xc3, 0x3f, 0, 0, 0, 0, 0])
+
+
+def naive_decode(fields, buffer, offset=4):
+    ret = {}
+    for key, fmt in fields.items():
+        size = struct.calcsize('>' + fmt)
+        if fmt.endswith('s'):
+            ret[key] = bytes(buffer[offset:offset + size])
+        elif not fmt.endswith('x'):
+            ret[key] = int.from_bytes(buffer[offset:offset + size], 'big')
+        offset += size
+    return ret
+
+
+def main(number: int = 200_000) -> None:
+    view = memoryview(REPORT)
+    codec = GetFwInfo.response_codec
+    assert tuple(naive_decode(GetFwInfo.response, view).values()) == tuple(codec.unpack_from(view))
+
+    for name, func in (
+        ('naive', lambda: naive_decode(GetFwInfo.response, view)),
+        ('compiled', lambda: codec.unpack_from(view)),
+    ):
+        elapsed = min(timeit.repeat(func, number=number, repeat=5))
+        print(f'{name:>10}: {number / elapsed / 1e6:6.2f} Mdecodes/s ({elapsed / number * 1e9:7.1f} ns/decode)')
+
+
+if __name__ == '__main__':
+    main()
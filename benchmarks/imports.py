@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+'''
+Import time of the CLI and of each backend.
+
+Every measurement imports the module in a fresh interpreter, and reports the
+median time over the runs, plus the hardware dependencies it pulled in.
+'''
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+import logitechd.backend
+
+
+TARGETS = {
+    'cli': 'logitechd.__main__',
+    'backend registry': 'logitechd.backend',
+    **{f'{name} backend': reference.partition(':')[0] for name, reference in logitechd.backend.BACKENDS.items()},
+}
+DEPENDENCIES = ('pyudev', 'ioctl')
+
+
+def measure(module):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (os.getcwd(), os.environ.get('PYTHONPATH')))))
+    script = (
+        f'import sys, time; start = time.perf_counter(); import {module}; elapsed = time.perf_counter() - start; '
+        f'print(elapsed, *(name for name in {DEPENDENCIES!r} if name in sys.modules))'
+    )
+    elapsed, *dependencies = subprocess.run(
+        [sys.executable, '-c', script], env=env, check=True, capture_output=True, text=True,
+    ).stdout.split()
+    return float(elapsed), dependencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, module in TARGETS.items():
+        samples, dependencies = [], []
+        for _ in range(args.runs):
+            elapsed, dependencies = measure(module)
+            samples.append(elapsed)
+        print(f'{name:>20}: {statistics.median(samples) * 1e3:7.1f} ms ({module}, loads: {", ".join(dependencies) or "-"})')
+
+
+if __name__ == '__main__':
+    main()
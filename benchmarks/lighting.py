@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+'''
+Per-key lighting frames against a simulated keyboard, which acks one report
+per USB polling interval.
+
+Reports the HID++ reports sent per frame and the achievable frame rate for a
+few animations, next to sending every key individually on every frame.
+'''
+
+import asyncio
+import math
+import random
+import time
+
+import logitechd.backend.simulator
+import logitechd.lighting
+
+from logitechd.protocol.features import PerKeyLighting
+
+
+ZONES = 120  # ~full size keyboard
+POLL_INTERVAL = 0.001  # 1000 Hz
+
+
+class Keyboard(logitechd.backend.simulator.SimulatedDevice):
+    '''Simulated keyboard, which replies to one report per USB polling interval'''
+
+    def __init__(self):
+        super().__init__('Simulated Keyboard', features=[PerKeyLighting.id])
+        self.busy_until = 0.0
+
+    def receive(self, request):
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        self.busy_until = max(self.busy_until, loop.time()) + POLL_INTERVAL
+        loop.call_at(self.busy_until, self._send_if_open, self.respond(request))
+
+
+def static(i):
+    return bytes((0x20, 0x80, 0xff)) * ZONES
+
+
+def breathing(i):
+    value = int(127 + 127 * math.sin(i / 10))
+    return bytes((value, 0, value)) * ZONES
+
+
+def wave(i):
+    return b''.join(
+        bytes((0xff, 0, 0)) if (zone - i) % 20 < 4 else bytes((0, 0, 0xff))
+        for zone in range(ZONES)
+    )
+
+
+def typing(i, rng=random.Random(0), state=bytearray(ZONES * 3)):
+    zone = rng.randrange(ZONES)
+    state[zone * 3:zone * 3 + 3] = b'\xff\xff\xff'
+    return bytes(state)
+
+
+def noise(i, rng=random.Random(0)):
+    return bytes(rng.choice((0, 0xff)) for _ in range(ZONES * 3))
+
+
+async def measure(animation, frames):
+    backend = logitechd.backend.simulator.SimulatorBackend([Keyboard()])
+    backend.attach(asyncio.get_running_loop())
+    try:
+        device, = backend.devices
+        pipeline = logitechd.lighting.FramePipeline(device, ZONES)
+
+        await pipeline.render(animation(0))
+        pipeline.frames = pipeline.reports = 0
+        start = time.perf_counter()
+        for i in range(1, frames + 1):
+            await pipeline.render(animation(i))
+        elapsed = time.perf_counter() - start
+    finally:
+        backend.close()
+    return pipeline.reports / frames, frames / elapsed
+
+
+def main(frames: int = 100) -> None:
+    naive = math.ceil(ZONES / 4) + 1
+    print(f'{ZONES} zones, naive: {naive} reports/frame, {1 / (naive * POLL_INTERVAL):7.1f} fps')
+    for animation in (static, breathing, wave, typing, noise):
+        reports, fps = asyncio.run(measure(animation, frames))
+        print(f'{animation.__name__:>10}: {reports:5.1f} reports/frame, {fps:7.1f} fps')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+'''
+Request latency, notification throughput and startup discovery time against
+simulated devices.
+
+The simulated latencies are part of the measurements, compare runs with the
+same parameters to spot regressions.
+'''
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import logitechd.backend.simulator
+import logitechd.protocol.cache
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] for p in (50, 90, 99)}
+
+
+def report(name, samples, unit='µs', scale=1e6):
+    values = ', '.join(f'p{p}={value * scale:8.1f}' for p, value in percentiles(samples).items())
+    print(f'{name:>32}: {values} {unit} (mean={statistics.mean(samples) * scale:.1f})')
+
+
+async def run(backend, func):
+    backend.attach(asyncio.get_running_loop())
+    try:
+        return await func(backend)
+    finally:
+        backend.close()
+
+
+async def request_latency(args):
+    io = logitechd.backend.simulator.SimulatedDevice(latency=args.latency, jitter=args.jitter, seed=0)
+    backend = logitechd.backend.simulator.SimulatorBackend([io])
+
+    async def func(backend):
+        device, = backend.devices
+        samples = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            await device.request(0, 1, b'\x00\x00\x5a')
+            samples.append(time.perf_counter() - start)
+        report('request latency (sequential)', samples)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(device.request(0, 1, b'\x00\x00\x5a') for _ in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        print(f'{"requests (pipelined)":>32}: {args.requests / elapsed:8.0f} requests/s')
+
+    await run(backend, func)
+
+
+async def notification_throughput(args):
+    io = logitechd.backend.simulator.SimulatedDevice(features=[0x1000])
+    backend = logitechd.backend.simulator.SimulatorBackend([io])
+
+    async def func(backend):
+        device, = backend.devices
+        await device.feature_index(0x1000)
+        subscriptions = [
+            backend.notifications.subscribe(device, 0x1000, maxsize=args.notifications)
+            for _ in range(args.subscribers)
+        ]
+        start = time.perf_counter()
+        for i in range(args.notifications):
+            io.notify(0x1000, 0, bytes((i & 0xff,)))
+            if i % 64 == 63:  # let the reader catch up before the socket buffer fills
+                await asyncio.sleep(0)
+        while len(subscriptions[-1]) < args.notifications:
+            await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+        print(
+            f'{"notifications":>32}: {args.notifications / elapsed:8.0f} notifications/s '
+            f'({args.subscribers} subscribers)'
+        )
+
+    await run(backend, func)
+
+
+def topology(args):
+    devices = []
+    for i in range(args.receivers):
+        receiver = logitechd.backend.simulator.SimulatedReceiver(pid=0xc53f)
+        for slot in range(1, args.paired + 1):
+            receiver.pair(logitechd.backend.simulator.SimulatedDevice(
+                f'Device {i}.{slot}', 0x4000 + slot, features=range(0x1000, 0x1000 + args.features),
+                unit_id=bytes((0, 0, i, slot)), latency=args.latency, jitter=args.jitter, seed=i * 8 + slot,
+            ), slot)
+        devices.append(receiver)
+    return devices
+
+
+async def startup(args, cache):
+    backend = logitechd.backend.simulator.SimulatorBackend(topology(args))
+
+    async def func(backend):
+        start = time.perf_counter()
+        await asyncio.gather(*(device.discover(cache) for device in backend.devices))
+        return time.perf_counter() - start
+
+    return await run(backend, func)
+
+
+async def startup_discovery(args, cache_path):
+    devices = args.receivers * (args.paired + 1)
+    cache = logitechd.protocol.cache.FeatureCache(cache_path)
+    cold = await startup(args, cache)
+    cache.flush()
+    warm = await startup(args, logitechd.protocol.cache.FeatureCache(cache_path))
+    print(f'{"startup discovery (cold cache)":>32}: {cold * 1e3:8.1f} ms ({devices} devices)')
+    print(f'{"startup discovery (warm cache)":>32}: {warm * 1e3:8.1f} ms ({devices} devices)')
+
+
+def main() -> None:
+    import tempfile
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.001, help='simulated reply latency (s)')
+    parser.add_argument('--jitter', type=float, default=0.0005, help='simulated reply jitter (s)')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--notifications', type=int, default=50_000)
+    parser.add_argument('--subscribers', type=int, default=4)
+    parser.add_argument('--receivers', type=int, default=2)
+    parser.add_argument('--paired', type=int, default=3)
+    parser.add_argument('--features', type=int, default=24)
+    args = parser.parse_args()
+
+    asyncio.run(request_latency(args))
+    asyncio.run(notification_throughput(args))
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(startup_discovery(args, f'{tmp}/features.json'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,138 @@
 #!/usr/bin/env python
 # SPDX-License-Identifier: MIT
 
+from __future__ import annotations
+
+import argparse
+import sys
+import typing
+
+from typing import List, Optional
+
 import logitechd.backend
 
 
-def main() -> None:
-    backend = logitechd.backend.construct_backend()
+if typing.TYPE_CHECKING:
+    import asyncio
+
+    import logitechd.protocol.state
+    import logitechd.workers
+
+
+# the event loop, the protocol stack and the IPC server are imported by the
+# commands that need them, so that the CLI starts fast
+
+
+def _stop_event() -> asyncio.Event:
+    '''Event set when we get SIGINT or SIGTERM'''
+    import asyncio
+    import signal
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    return stop
+
+
+async def run(
+    backend: logitechd.backend.Backend,
+    path: Optional[str] = None,
+    poller: Optional[logitechd.protocol.state.StatePoller] = None,
+) -> None:
+    '''Serve the backend from the running event loop until we get SIGINT or SIGTERM'''
+    import asyncio
+
+    import logitechd.ipc
+
+    stop = _stop_event()
+    backend.attach(asyncio.get_running_loop())
+    server = logitechd.ipc.Server(backend, path)
+    await server.start()
+    polling = asyncio.ensure_future(poller.run()) if poller else None
+    try:
+        await stop.wait()
+    finally:
+        if polling:
+            polling.cancel()
+        await server.close()
+        backend.close()
+
+
+async def route(pool: logitechd.workers.WorkerPool, path: Optional[str] = None) -> None:
+    '''Route the IPC calls to the (started) worker processes until we get SIGINT or SIGTERM'''
+    import logitechd.workers
 
-    # temporary payload
+    stop = _stop_event()
+    server = logitechd.workers.Router(await pool.connect(), path)
+    await server.start()
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
+
+
+async def stats(path: Optional[str]) -> str:
+    '''Fetch the metrics of a running daemon'''
+    import logitechd.ipc
+
+    async with await logitechd.ipc.Client.connect(path) as client:
+        text: str = await client.call('metrics')
+        return text
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='logitechd')
+    parser.add_argument('--socket', help='IPC socket path (default: $XDG_RUNTIME_DIR/logitechd.sock, or /run/logitechd.sock)')
+    parser.add_argument(
+        '--backend',
+        help=f'backend to use, eg. {", ".join(logitechd.backend.BACKENDS)} (default: from the configuration, or the system)',
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('stats', help='print the metrics of the running daemon, in the Prometheus text format')
+    options = parser.parse_args(args)
+
+    if options.command == 'stats':
+        import asyncio
+
+        try:
+            sys.stdout.write(asyncio.run(stats(options.socket)))
+        except OSError as e:
+            parser.exit(1, f'Could not connect to the daemon: {e}\n')
+        return
+
+    daemon(parser, options)
+
+
+def daemon(parser: argparse.ArgumentParser, options: argparse.Namespace) -> None:
+    '''Run the daemon, in worker processes if configured'''
+    import asyncio
     import logging
+
+    import logitechd.config
+    import logitechd.protocol.state
+    import logitechd.workers
+
     logging.basicConfig(level=logging.DEBUG)
-    import time
-    while True:
-        backend._tree.show()  # type: ignore
-        time.sleep(0.5)
+
+    config = logitechd.config.load()
+    pool = logitechd.workers.WorkerPool.from_config(config)
+    if pool:
+        if (options.backend or config.get('backend', 'name', fallback='hidraw')) != 'hidraw':
+            parser.error('Worker processes are only supported by the hidraw backend')
+        pool.start()
+        try:
+            asyncio.run(route(pool, options.socket))
+        finally:
+            pool.close()
+        return
+
+    try:
+        backend = logitechd.backend.construct_backend(options.backend, config)
+    except ValueError as e:
+        parser.error(str(e))
+    poller = logitechd.protocol.state.StatePoller.from_config(lambda: backend.devices, config)
+    asyncio.run(run(backend, options.socket, poller))
 
 
 def entrypoint() -> None:
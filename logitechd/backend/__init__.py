@@ -1,20 +1,37 @@
 # SPDX-License-Identifier: MIT
+'''
+IO backend abstractions and registry
+
+Only what the ABCs and the registry need is imported here, the backends and
+the protocol stack are imported when a backend is constructed, so that
+commands that do not drive devices start fast.
+'''
+
+from __future__ import annotations
 
 import abc
-import dataclasses
-import platform
+import importlib
+import sys
+import typing
 
 from types import TracebackType
-from typing import Optional, Sequence, Set, Tuple, Type
+from typing import AbstractSet, Any, Callable, Dict, Mapping, NamedTuple, Optional, Sequence, Tuple, Type, Union
+
 
-import logitechd.protocol
+if typing.TYPE_CHECKING:
+    import asyncio
+    import configparser
+
+    import logitechd.metrics
+    import logitechd.protocol
+    import logitechd.protocol.notifications
+    import logitechd.registry
 
 
 # backend helper data
 
 
-@dataclasses.dataclass
-class _DeviceInfo(object):
+class _DeviceInfo(NamedTuple):  # not a dataclass, dataclasses is slow to import
     bus: int = 0x03
     vid: Optional[int] = None
     pid: Optional[int] = None
@@ -45,18 +62,62 @@ _TARGET_DEVICES = [
 ]
 
 
+def _target_devices(config: Optional[configparser.ConfigParser] = None) -> Dict[Tuple[int, int], _DeviceInfo]:
+    '''
+    Target devices keyed by (VID, PID), so that matching is a dictionary lookup
+
+    Includes the devices from the ``devices`` section of the configuration file.
+    '''
+    if config is None:
+        import logitechd.config
+
+        config = logitechd.config.load()
+
+    targets = {target.as_tuple[1:]: target for target in _TARGET_DEVICES}
+    if config.has_section('devices'):
+        for key in config['devices']:
+            try:
+                vid, pid = (int(value, 16) for value in key.split(':'))
+            except ValueError:
+                import logging
+
+                logging.getLogger(__name__).error(f'Invalid device `{key}` in configuration, expecting `VID:PID`')
+                continue
+            targets[vid, pid] = _DeviceInfo(vid=vid, pid=pid)
+    return targets
+
+
 # backend abstractions
 
 
+Buffer = Union[bytes, bytearray, memoryview]
+WritableBuffer = Union[bytearray, memoryview]
+
+
 class IODeviceInterface(metaclass=abc.ABCMeta):
-    '''HID++ IO device reader/writer ABC'''
+    '''
+    HID++ IO device reader/writer ABC
+
+    Reports are exchanged as buffer-protocol objects, so that implementations
+    can avoid allocating on every report. Non-blocking implementations should
+    raise ``BlockingIOError`` when reading with no report pending.
+    '''
+
+    @abc.abstractmethod
+    def read(self) -> memoryview:
+        '''
+        Reads a HID++ report from the device
+
+        The returned view may be backed by a buffer that is reused by the next
+        read, it should be copied if it needs to outlive that.
+        '''
 
     @abc.abstractmethod
-    def read(self) -> Sequence[int]:
-        '''Reads a HID++ report from the device'''
+    def read_into(self, buffer: WritableBuffer) -> int:
+        '''Reads a HID++ report into ``buffer`` and returns its length'''
 
     @abc.abstractmethod
-    def write(self, data: Sequence[int]) -> None:
+    def write(self, data: Union[Buffer, Sequence[int]]) -> None:
         '''Writes a HID++ report to the device'''
 
 
@@ -77,6 +138,39 @@ class IODevice(metaclass=abc.ABCMeta):
     def name(self) -> str:
         '''Device name'''
 
+    @property
+    @abc.abstractmethod
+    def info(self) -> Tuple[int, int, int]:
+        '''Bus type, vendor ID and product ID'''
+
+    @abc.abstractmethod
+    def fileno(self) -> int:
+        '''File descriptor that becomes readable when the device has a report for us'''
+
+    @property
+    def report_lengths(self) -> Mapping[int, int]:
+        '''
+        HID++ report IDs supported by the device and their lengths
+
+        Defaults to the short, long and very long reports, backends should
+        narrow it down when they know the report descriptor.
+        '''
+        import logitechd.protocol.engine
+
+        return logitechd.protocol.engine.REPORT_LENGTHS
+
+    @property
+    def metrics(self) -> logitechd.metrics.DeviceMetrics:
+        '''
+        IO metrics of the device
+
+        Defaults to metrics labeled by the device name, backends should label
+        them by something unique, like the node path.
+        '''
+        import logitechd.metrics
+
+        return logitechd.metrics.REGISTRY.device(self.name)
+
     @abc.abstractmethod
     def __enter__(self) -> IODeviceInterface:
         '''Obtain access to the read/write interface'''
@@ -98,11 +192,16 @@ class Backend(metaclass=abc.ABCMeta):
     Backends must discover devices, call logitechd.protocol.construct_device
     with a IODevice instance for each device, and save the returned Device
     instance, so that it can be returned in the ``device`` property.
+
+    Backends are driven by an asyncio event loop. After being attached to a
+    loop, they should watch their file descriptors with ``loop.add_reader``
+    and pass every incoming report to ``Device.handle_report``, instead of
+    polling or spawning threads.
     '''
 
     @property
     @abc.abstractmethod
-    def devices(self) -> Set[logitechd.protocol.Device]:
+    def devices(self) -> AbstractSet[logitechd.protocol.Device]:
         '''
         Set of connected devices
 
@@ -110,16 +209,102 @@ class Backend(metaclass=abc.ABCMeta):
         included in this set.
         '''
 
+    @property
+    @abc.abstractmethod
+    def registry(self) -> logitechd.registry.DeviceRegistry:
+        '''Registry of the connected devices, indexed by node path, IDs, receiver and serial'''
 
-# helpers
+    @property
+    @abc.abstractmethod
+    def notifications(self) -> logitechd.protocol.notifications.NotificationBus:
+        '''Bus where the devices publish their notifications'''
+
+    @abc.abstractmethod
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        '''Start watching for hotplug events and device reports in the event loop'''
+
+    @abc.abstractmethod
+    def detach(self) -> None:
+        '''Stop watching for events, undoing ``attach``'''
+
+    def close(self) -> None:
+        '''Detach and release the devices, the backend can not be used afterwards'''
+        self.detach()
+
+
+# backend registry
+
+
+BACKENDS = {
+    'hidraw': 'logitechd.backend.hidraw:HidrawBackend',
+    'rawfd': 'logitechd.backend.rawfd:RawBackend',
+    'simulator': 'logitechd.backend.simulator:SimulatorBackend.from_config',
+    'replay': 'logitechd.backend.replay:ReplayBackend.from_config',
+}
+'''Built-in backends, as entry point object references to a factory taking the configuration as ``config``'''
 
+ENTRY_POINT_GROUP = 'logitechd.backends'
+
+
+def available_backends() -> Dict[str, str]:
+    '''
+    Built-in backends and the ones registered by other packages in the
+    ``logitechd.backends`` entry point group, by name
+
+    Only looks the backends up, nothing is imported.
+    '''
+    backends = dict(BACKENDS)
+    if sys.version_info >= (3, 10):
+        import importlib.metadata
+
+        entry_points = importlib.metadata.entry_points(group=ENTRY_POINT_GROUP)
+    elif sys.version_info >= (3, 8):
+        import importlib.metadata
+
+        entry_points = importlib.metadata.entry_points().get(ENTRY_POINT_GROUP, [])
+    else:  # no importlib.metadata, only the built-in backends
+        entry_points = []
+    for entry_point in entry_points:
+        backends.setdefault(entry_point.name, entry_point.value)
+    return backends
+
+
+def _load(reference: str) -> Callable[..., Backend]:
+    '''Import the object an entry point reference (``module:attribute``) points to'''
+    module, _, attributes = reference.partition(':')
+    obj: Any = importlib.import_module(module)
+    for attribute in filter(None, attributes.split('.')):
+        obj = getattr(obj, attribute)
+    return obj  # type: ignore[no-any-return]
+
+
+def default_backend() -> str:
+    '''Name of the backend for this system'''
+    import platform
 
-def construct_backend() -> Backend:
-    '''Instaceates the correct backend for this system'''
     system = platform.uname().system
     if system == 'Linux':
-        import logitechd.backend.hidraw
+        return 'hidraw'
+    raise NotImplementedError('Unsupported operating system')
+
+
+# helpers
 
-        return logitechd.backend.hidraw.HidrawBackend()
-    else:
-        raise NotImplementedError('Unsupported operating system')
+
+def construct_backend(name: Optional[str] = None, config: Optional[configparser.ConfigParser] = None) -> Backend:
+    '''
+    Instantiate a backend by name
+
+    Defaults to ``name`` in the ``backend`` section of the configuration, or
+    to the backend for this system. The backend module is only imported
+    here, so the dependencies of other backends are never loaded.
+    '''
+    if config is None:
+        import logitechd.config
+
+        config = logitechd.config.load()
+    name = name or config.get('backend', 'name', fallback=None) or default_backend()
+    reference = BACKENDS.get(name) or available_backends().get(name)
+    if reference is None:
+        raise ValueError(f'Unknown backend `{name}`, available: {", ".join(sorted(available_backends()))}')
+    return _load(reference)(config=config)
@@ -2,22 +2,39 @@
 
 from __future__ import annotations
 
+import asyncio
+import configparser
 import logging
 import os
 import sys
 import threading
+import time
+import typing
 
 from types import TracebackType
-from typing import List, Optional, Sequence, Set, Type
+from typing import (
+    AbstractSet, Any, Callable, Coroutine, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple, Type, Union,
+)
 
 import ioctl.hidraw
-import pyudev
-import treelib
 
 import logitechd.backend
+import logitechd.capture
+import logitechd.config
+import logitechd.metrics
 import logitechd.protocol
+import logitechd.protocol.cache
+import logitechd.protocol.engine
+import logitechd.protocol.notifications
+import logitechd.protocol.report
+import logitechd.protocol.scheduler
+import logitechd.rdesc
+import logitechd.registry
 
 
+if typing.TYPE_CHECKING:
+    import pyudev  # imported when setting up UDEV, so that it is only needed by the hidraw backend
+
 if sys.version_info >= (3, 8):
     from typing import Literal
 else:
@@ -25,45 +42,174 @@ else:
 
 
 class HidrawInterface(logitechd.backend.IODeviceInterface):
-    '''Linux hidraw read/write interface'''
+    '''
+    Linux hidraw read/write interface
 
-    def __init__(self, hidraw: ioctl.hidraw.Hidraw) -> None:
+    Reads go into a preallocated buffer, ``read`` returns a view of it.
+    '''
+    REPORT_SIZE = 64  # largest HID++ report (very long)
+
+    def __init__(self, hidraw: ioctl.hidraw.Hidraw, metrics: logitechd.metrics.DeviceMetrics) -> None:
         self._hidraw = hidraw
+        self._fd: int = hidraw.fd
+        self._buffer = bytearray(self.REPORT_SIZE)
+        self._view = memoryview(self._buffer)
+        self._metrics = metrics
+
+    def read(self) -> memoryview:
+        return self._view[:self.read_into(self._buffer)]
+
+    def read_into(self, buffer: logitechd.backend.WritableBuffer) -> int:
+        length = os.readv(self._fd, (buffer,))
+        self._metrics.reports_read.value += 1
+        self._metrics.bytes_read.value += length
+        return length
+
+    def write(self, data: Union[logitechd.backend.Buffer, Sequence[int]]) -> None:
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        length = os.write(self._fd, data)
+        self._metrics.reports_written.value += 1
+        self._metrics.bytes_written.value += length
+
+
+class HandlePool(object):
+    '''
+    Open hidraw nodes, by path
 
-    def read(self) -> Sequence[int]:
-        return list(os.read(self._hidraw.fd, 64))
+    Each node is opened once, and the handle is shared by probing (report
+    descriptor, info) and IO. Handles are claimed by their owner (eg. the
+    ``HidrawDevice`` using them), a node can only have one, and are closed
+    when released. A handle whose node was replaced (eg. a missed removal)
+    is detected when the path is opened again, and reopened.
+    '''
 
-    def write(self, data: Sequence[int]) -> None:
-        os.write(self._hidraw.fd, bytes(data))
+    def __init__(self) -> None:
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._handles: Dict[str, ioctl.hidraw.Hidraw] = {}
+        self._owners: Dict[str, object] = {}
+        self._opened = logitechd.metrics.REGISTRY.counter('logitechd_hidraw_opened_total', 'hidraw nodes opened')
+        self._closed = logitechd.metrics.REGISTRY.counter('logitechd_hidraw_closed_total', 'hidraw nodes closed')
+
+    def __len__(self) -> int:
+        return len(self._handles)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._handles
+
+    @staticmethod
+    def _stale(hidraw: ioctl.hidraw.Hidraw) -> bool:
+        try:
+            opened, current = os.fstat(hidraw.fd), os.stat(hidraw.path)
+        except OSError:
+            return True
+        return (opened.st_dev, opened.st_ino, opened.st_rdev) != (current.st_dev, current.st_ino, current.st_rdev)
+
+    def open(self, path: str) -> ioctl.hidraw.Hidraw:
+        '''Handle of a node, opening it if needed'''
+        with self._lock:
+            hidraw = self._handles.get(path)
+            if hidraw is not None and self._stale(hidraw):
+                self._logger.warning(f'Reopening `{path}`, its handle was stale (owner: {self._owners.get(path)!r})')
+                self._close(path)
+                hidraw = None
+            if hidraw is None:
+                hidraw = self._handles[path] = ioctl.hidraw.Hidraw(path)
+                self._opened.value += 1
+            return hidraw
+
+    def adopt(self, hidraw: ioctl.hidraw.Hidraw) -> ioctl.hidraw.Hidraw:
+        '''Manage a handle opened elsewhere, returns the pooled handle of its node'''
+        with self._lock:
+            pooled = self._handles.setdefault(hidraw.path, hidraw)
+            if pooled is hidraw:
+                self._opened.value += 1
+            return pooled
+
+    def claim(self, path: str, owner: object) -> None:
+        '''Take ownership of the handle of a node, raises ``KeyError`` if it already has an owner'''
+        with self._lock:
+            if path not in self._handles:
+                raise KeyError(f'Device `{path}` is not open')
+            if self._owners.get(path, owner) is not owner:
+                raise KeyError(f'Device `{path}` already open')
+            self._owners[path] = owner
+
+    def release(self, path: str) -> None:
+        '''Close the handle of a node'''
+        with self._lock:
+            self._close(path)
+
+    def _close(self, path: str) -> None:
+        hidraw = self._handles.pop(path, None)
+        self._owners.pop(path, None)
+        if hidraw is not None:
+            os.close(hidraw.fd)
+            self._closed.value += 1
+
+    def leaks(self) -> Dict[str, object]:
+        '''Handles still open, and their owner (``None`` for probe handles), eg. after shutting down'''
+        with self._lock:
+            return {path: self._owners.get(path) for path in self._handles}
+
+
+HANDLES = HandlePool()
 
 
 class HidrawDevice(logitechd.backend.IODevice):
-    '''Linux hidraw device'''
-    _hidraw: ioctl.hidraw.Hidraw
+    '''
+    Linux hidraw device
+
+    The node is put in non-blocking mode unless ``blocking`` is set, reads
+    with no report pending will raise ``BlockingIOError``.
 
-    __open_nodes: List[str] = []
+    Its handle comes from, and is owned in, ``HANDLES``: a node can only be
+    used by one device at a time. ``close`` releases it.
+    '''
+    _hidraw: ioctl.hidraw.Hidraw
 
     def __init__(
         self,
         path: Optional[str] = None,
         *,
         hidraw: Optional[ioctl.hidraw.Hidraw] = None,
+        blocking: bool = False,
     ) -> None:
         if path and hidraw:
             raise ValueError('Suplied both `path` and `hidraw` arguments, only one is aceptable.')
         elif path:
-            self._hidraw = ioctl.hidraw.Hidraw(path)
+            self._hidraw = HANDLES.open(path)
         elif hidraw:
-            self._hidraw = hidraw
+            self._hidraw = HANDLES.adopt(hidraw)
         else:
             raise ValueError('Missing arguments: please provide either a `path` or `hidraw` argument')
 
-        if self.path in self.__open_nodes:
-            raise KeyError(f'Device `{self.path}` already open')
-        self.__open_nodes.append(self.path)
+        HANDLES.claim(self.path, self)
 
-        self._interface = HidrawInterface(self._hidraw)
+        os.set_blocking(self._hidraw.fd, blocking)
+        self._report_lengths = (
+            logitechd.rdesc.parse(self._hidraw.report_descriptor).hidpp_reports
+            or logitechd.protocol.engine.REPORT_LENGTHS
+        )
+        self._metrics = logitechd.metrics.REGISTRY.device(self.path)
+        self._interface: logitechd.backend.IODeviceInterface = HidrawInterface(self._hidraw, self._metrics)
         self._lock = threading.Lock()
+        self._closed = False
+
+    def close(self) -> None:
+        '''Close the node, eg. after it went away'''
+        if self._closed:
+            return
+        self._closed = True
+        HANDLES.release(self.path)
+
+    def capture(self, capture: logitechd.capture.CaptureFile, **description: Any) -> None:
+        '''Record the reports of the device in ``capture``, see ``CaptureFile.register``'''
+        number = capture.register(
+            path=self.path, name=self.name, info=self.info, report_lengths=dict(self.report_lengths), **description,
+        )
+        self._interface = logitechd.capture.RecordingInterface(self._interface, capture, number)
 
     @property
     def path(self) -> str:
@@ -75,8 +221,29 @@ class HidrawDevice(logitechd.backend.IODevice):
         assert isinstance(self._hidraw.name, str)  # make mypy happy
         return self._hidraw.name
 
+    @property
+    def info(self) -> Tuple[int, int, int]:
+        info = self._hidraw.info
+        assert isinstance(info, tuple)  # make mypy happy
+        return info
+
+    def fileno(self) -> int:
+        assert isinstance(self._hidraw.fd, int)  # make mypy happy
+        return self._hidraw.fd
+
+    @property
+    def report_lengths(self) -> Mapping[int, int]:
+        return self._report_lengths
+
+    @property
+    def metrics(self) -> logitechd.metrics.DeviceMetrics:
+        return self._metrics
+
     def __enter__(self) -> logitechd.backend.IODeviceInterface:
-        self._lock.acquire()
+        if not self._lock.acquire(blocking=False):  # only time contended acquisitions
+            start = time.perf_counter()
+            self._lock.acquire()
+            self._metrics.lock_wait.observe(time.perf_counter() - start)
         return self._interface
 
     def __exit__(
@@ -89,72 +256,439 @@ class HidrawDevice(logitechd.backend.IODevice):
         return False  # False means we did not handle the exception :)
 
 
+def _usb_devices(context: pyudev.Context, tag: Optional[str]) -> Iterable[pyudev.Device]:
+    devices = context.list_devices(subsystem='usb', DEVTYPE='usb_device')
+    if tag:
+        devices = devices.match_tag(tag)
+    return devices  # type: ignore[no-any-return]
+
+
+def _match(
+    device: pyudev.Device,
+    targets: Mapping[Tuple[int, int], logitechd.backend._DeviceInfo],
+    tag: Optional[str],
+) -> Optional[logitechd.backend._DeviceInfo]:
+    product = device.properties.get('PRODUCT')  # VID/PID/BCD in hex, eg. 46d/c52b/1201
+    if not product or (tag and tag not in device.tags):
+        return None
+    try:
+        vid, pid = product.split('/')[:2]
+        return targets.get((int(vid, 16), int(pid, 16)))
+    except ValueError:
+        return None
+
+
+def target_usb_devices(config: Optional[configparser.ConfigParser] = None) -> List[str]:
+    '''Sys paths of the target USB devices plugged in, from UDEV, without opening their nodes'''
+    import pyudev
+
+    if config is None:
+        config = logitechd.config.load()
+    targets = logitechd.backend._target_devices(config)
+    tag = config.get('udev', 'tag', fallback=None)
+    return sorted(
+        device.sys_path for device in _usb_devices(pyudev.Context(), tag)
+        if device.device_node and _match(device, targets, tag)
+    )
+
+
 class HidrawBackend(logitechd.backend.Backend):
     '''
     Linux hidraw backend
 
-    Looks for devices in UDEV, it monitors UDEV for changes in different thread(s).
+    Looks for devices in UDEV. Once attached to an event loop, the UDEV monitor
+    sockets and the hidraw nodes are watched by the loop, so events and reports
+    are dispatched as soon as they arrive, without any extra threads.
 
     Assumes only one hidraw node with a vendor usage page will be exported by the
     hid-logitech-dj driver.
+
+    By default, devices are discovered lazily: nothing is asked from a device
+    until it is first used, and then only the protocol version and the
+    features being used are resolved, so slow, sleeping or offline devices
+    stay out of startup. Devices are pinged in the background when their
+    receiver reports them waking up.
+
+    With ``lazy`` disabled (``lazy = no`` in the ``discovery`` section of the
+    configuration), the full protocol discovery runs at startup, concurrently
+    for all devices, with at most ``discovery_concurrency`` devices being
+    discovered at once (``concurrency`` in the ``discovery`` section). Startup
+    is considered finished when all devices are discovered or after
+    ``startup_deadline`` seconds (``startup_deadline`` in the ``discovery``
+    section), slower devices keep being discovered in the background, and
+    sleeping devices are discovered when they wake up.
+
+    Hotplug is handled per hidraw node: a new node is attached on its own,
+    under its receiver (or waits for the receiver's node to show up), and a
+    removed node is detached and closed. Events are debounced for
+    ``hotplug_debounce`` seconds (``debounce`` in the ``udev`` section of the
+    configuration), so that bursts, like a dock reconnecting, are applied in
+    a single pass, where a node removed and added again is reopened once.
+
+    Target devices are matched with a dictionary lookup, and the UDEV
+    monitors filter by device type (and by tag, if ``tag`` is set in the
+    ``udev`` section of the configuration) in the kernel, so unrelated
+    events do not even reach us.
+
+    The devices behind each receiver share a ``ReceiverScheduler``, with
+    ``receiver_in_flight`` requests in flight at most (``in_flight`` in the
+    ``scheduler`` section of the configuration).
+
+    If ``path`` is set in the ``capture`` section of the configuration, the
+    traffic of all devices is recorded to that capture file, keeping the
+    last ``records`` reports, to be replayed with the replay backend.
+
+    The feature tables are cached in the file set as ``cache`` in the
+    ``discovery`` section, see ``FeatureCache``.
+
+    With ``shard`` set, only the USB devices whose sys path it accepts are
+    managed, the others are left to the other worker processes, see
+    ``logitechd.workers``.
     '''
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        *,
+        discovery_concurrency: Optional[int] = None,
+        startup_deadline: Optional[float] = None,
+        lazy: Optional[bool] = None,
+        receiver_in_flight: Optional[int] = None,
+        hotplug_debounce: Optional[float] = None,
+        shard: Optional[Callable[[str], bool]] = None,
+        config: Optional[configparser.ConfigParser] = None,
+    ) -> None:
         self.__logger = logging.getLogger(self.__class__.__name__)
-        self._tree = treelib.Tree()
-        self._devices = self._tree.create_node(identifier='devices')
+        if config is None:
+            config = logitechd.config.load()
+        self._targets = logitechd.backend._target_devices(config)
+        self._udev_tag = config.get('udev', 'tag', fallback=None)
+        self._shard = shard
+        if receiver_in_flight is None:
+            receiver_in_flight = config.getint('scheduler', 'in_flight', fallback=4)
+        self._receiver_in_flight = receiver_in_flight
+        if lazy is None:
+            lazy = config.getboolean('discovery', 'lazy', fallback=True)
+        self.lazy = lazy
+        if discovery_concurrency is None:
+            discovery_concurrency = config.getint('discovery', 'concurrency', fallback=8)
+        if startup_deadline is None:
+            startup_deadline = config.getfloat('discovery', 'startup_deadline', fallback=5.0)
+        if hotplug_debounce is None:
+            hotplug_debounce = config.getfloat('udev', 'debounce', fallback=0.1)
+        self.hotplug_debounce = hotplug_debounce
+        # node -> (removed, present, UDEV device) for the events waiting to be applied
+        self._hotplug: Dict[str, Tuple[bool, bool, pyudev.Device]] = {}
+        self._hotplug_timer: Optional[asyncio.TimerHandle] = None
+        self._cache_timer: Optional[asyncio.TimerHandle] = None
+        # USB device -> node and request scheduler of its receiver (or wired device)
+        self._receivers: Dict[str, Tuple[str, logitechd.protocol.scheduler.ReceiverScheduler]] = {}
+        self._orphans: Dict[str, List[ioctl.hidraw.Hidraw]] = {}  # USB device -> nodes waiting for their receiver
+        self._capture = self._open_capture(config)
+        self._registry = logitechd.registry.DeviceRegistry()
+        self._notifications = logitechd.protocol.notifications.NotificationBus()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task[None]] = set()
+        self._feature_cache = logitechd.protocol.cache.FeatureCache(config.get('discovery', 'cache', fallback=None))
+        self.cache_flush_delay = 1.0  # seconds
+        self.discovery_concurrency = discovery_concurrency
+        self.startup_deadline = startup_deadline
+        self._discovery_slots: Optional[asyncio.Semaphore] = None
+        self._monitors: List[Tuple[pyudev.Monitor, Callable[[str, pyudev.Device], None], logitechd.metrics.Counter]] = []
+
+        self._udev_events = {
+            subsystem: logitechd.metrics.REGISTRY.counter(
+                'logitechd_udev_events_total', 'UDEV events handled', subsystem=subsystem,
+            )
+            for subsystem in ('usb', 'hidraw')
+        }
 
         self._setup_udev()
 
     @property
-    def devices(self) -> Set[logitechd.protocol.Device]:
-        return {
-            node.data for node in self._tree.all_nodes_itr()
-            if node.identifier != 'devices'
-        }
+    def devices(self) -> AbstractSet[logitechd.protocol.Device]:
+        return self._registry.devices
+
+    @property
+    def notifications(self) -> logitechd.protocol.notifications.NotificationBus:
+        return self._notifications
+
+    @property
+    def registry(self) -> logitechd.registry.DeviceRegistry:
+        return self._registry
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._loop:
+            raise RuntimeError('Backend already attached to an event loop')
+        self._loop = loop
+
+        for monitor, handler, counter in self._monitors:
+            monitor.start()
+            loop.add_reader(monitor.fileno(), self._drain_monitor, monitor, handler, counter)
+
+        discovery = [self._watch(device) for device in self._registry.devices]
+        self._spawn(self._startup(discovery))
+
+    def detach(self) -> None:
+        if not self._loop:
+            return
+
+        for monitor, _, _ in self._monitors:
+            self._loop.remove_reader(monitor.fileno())
+        if self._hotplug_timer:
+            self._hotplug_timer.cancel()
+            self._hotplug_timer = None
+        if self._cache_timer:
+            self._cache_timer.cancel()
+            self._cache_timer = None
+        self._feature_cache.flush()
+        for task in self._tasks:
+            task.cancel()
+        for device in self._registry.devices:
+            self._unwatch(device)
+
+        self._loop = None
+
+    def close(self) -> None:
+        '''Detach and close all the nodes, reporting the handles left open'''
+        self.detach()
+        for entry in self._registry:
+            assert isinstance(entry.device.io, HidrawDevice)  # make mypy happy
+            entry.device.io.close()
+            logitechd.metrics.REGISTRY.remove_device(entry.device.io.path)
+        for hidraw in list(self._orphaned()):
+            HANDLES.release(hidraw.path)
+        self._orphans.clear()
+        leaks = HANDLES.leaks()
+        if leaks:
+            self.__logger.warning(f'hidraw handles left open: {leaks}')
+
+    def _open_capture(self, config: configparser.ConfigParser) -> Optional[logitechd.capture.CaptureFile]:
+        '''Capture file from the configuration, ``None`` when not configured or it cannot be opened'''
+        path = config.get('capture', 'path', fallback=None)
+        if not path:
+            return None
+        try:
+            return logitechd.capture.CaptureFile(path, config.getint('capture', 'records', fallback=65536))
+        except (OSError, ValueError) as e:  # a diagnostic, never worth failing the startup over
+            self.__logger.warning(f'Not capturing the traffic, could not open `{path}`: {e}')
+            return None
+
+    def _spawn(self, coroutine: Coroutine[Any, Any, None]) -> asyncio.Task[None]:
+        '''Run a coroutine in the event loop, keeping track of it'''
+        assert self._loop
+        task = self._loop.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _watch(self, device: logitechd.protocol.Device) -> Optional[asyncio.Task[None]]:
+        '''Dispatch the reports of a device from the event loop and start its protocol discovery, unless lazy'''
+        if not self._loop:
+            return None
+        assert isinstance(device.io, HidrawDevice)  # make mypy happy
+        reader = logitechd.protocol.report.ReportReader(device.io._interface, device.io.report_lengths)
+        self._loop.add_reader(device.io.fileno(), self._event_handler_report, device, reader)
+        if self.lazy:
+            return None
+        return self._spawn(self._discover(device))
+
+    async def _startup(self, discovery: Sequence[Optional[asyncio.Task[None]]]) -> None:
+        '''Wait for the initial protocol discovery, up to the startup deadline'''
+        tasks = {task for task in discovery if task}
+        start = time.monotonic()
+        pending: Set[asyncio.Task[None]] = set()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.startup_deadline)
+        self.__logger.info(
+            f'Startup finished in {time.monotonic() - start:.3f}s: '
+            f'{len(tasks) - len(pending)} devices discovered, {len(pending)} still pending'
+        )
+
+    def _device_connection(self, device: logitechd.protocol.Device, connected: bool) -> None:
+        '''Wake-up trigger, for devices that were asleep when we first tried them'''
+        self.__logger.info(f'`{device.io.name}` {"connected" if connected else "disconnected"}')
+        if connected and self._loop and device in self._registry.devices:
+            self._spawn(self._discover(device, lazy=self.lazy))
+
+    async def _discover(self, device: logitechd.protocol.Device, *, lazy: bool = False) -> None:
+        '''Full protocol discovery, or just the protocol version if ``lazy``'''
+        if self._discovery_slots is None:
+            self._discovery_slots = asyncio.Semaphore(self.discovery_concurrency)
+        try:
+            async with self._discovery_slots:
+                if lazy:
+                    await device.resolve_protocol()
+                    return
+                await device.discover(self._feature_cache)
+                if self._feature_cache.dirty and self._cache_timer is None and self._loop:
+                    # the devices discovered in the meantime are written along
+                    self._cache_timer = self._loop.call_later(self.cache_flush_delay, self._flush_cache)
+        except (asyncio.TimeoutError, logitechd.protocol.engine.HIDPPError, OSError) as e:
+            self.__logger.warning(f'Protocol discovery failed for `{device.io.name}`: {e!r}')
+            return
+        self.__logger.info(
+            f'Discovered `{device.io.name}`: protocol={device.protocol_version}, features={len(device.features)} '
+            f'(cache hits={self._feature_cache.hits}, misses={self._feature_cache.misses})'
+        )
+
+    def _flush_cache(self) -> None:
+        self._cache_timer = None
+        self._feature_cache.flush()
+
+    def _unwatch(self, device: logitechd.protocol.Device) -> None:
+        if self._loop:
+            self._loop.remove_reader(device.io.fileno())
+
+    def _drain_monitor(
+        self,
+        monitor: pyudev.Monitor,
+        handler: Callable[[str, pyudev.Device], None],
+        counter: logitechd.metrics.Counter,
+    ) -> None:
+        '''Dispatch all events queued in a UDEV monitor socket'''
+        while True:
+            device = monitor.poll(timeout=0)
+            if device is None:
+                break
+            counter.value += 1
+            handler(device.action, device)
+
+    def _event_handler_report(
+        self,
+        device: logitechd.protocol.Device,
+        reader: logitechd.protocol.report.ReportReader,
+    ) -> None:
+        '''
+        Read a report from a readable hidraw node and hand it to the device
+        '''
+        try:
+            report = reader.read()
+        except BlockingIOError:  # spurious wakeup
+            return
+        except OSError as e:  # the node went away, UDEV will tell us the rest
+            self.__logger.debug(f'Could not read from `{device.io.name}`: {e}')
+            self._unwatch(device)
+            return
+        if report:
+            try:
+                device.handle_report(report)
+            finally:
+                report.release()
 
     def _setup_udev(self) -> None:
-        '''Setup UDEV and register observers to look for devices and populate the device tree'''
+        '''Setup UDEV monitors and populate the device tree'''
+        import pyudev
+
         udev_context = pyudev.Context()
 
-        # register parent monitor
+        # parent monitor
         self._monitor_usb = pyudev.Monitor.from_netlink(udev_context)
-        self._monitor_usb.filter_by('usb')
-        self._observer_usb = pyudev.MonitorObserver(self._monitor_usb, self._event_handler_parent)
+        self._monitor_usb.filter_by('usb', device_type='usb_device')
+        if self._udev_tag:
+            self._monitor_usb.filter_by_tag(self._udev_tag)
 
-        # register child monitor
+        # child monitor
         self._monitor_hidraw = pyudev.Monitor.from_netlink(udev_context)
         self._monitor_hidraw.filter_by('hidraw')
-        self._observer_hidraw = pyudev.MonitorObserver(self._monitor_hidraw, self._event_handler_hidraw)
 
-        # trigger the parent event handler manually for initial population
-        for device in udev_context.list_devices(subsystem='usb'):
-            self._event_handler_parent('add', device)
+        self._monitors = [
+            (self._monitor_usb, self._event_handler_parent, self._udev_events['usb']),
+            (self._monitor_hidraw, self._event_handler_hidraw, self._udev_events['hidraw']),
+        ]
+
+        # initial population
+        for device in _usb_devices(udev_context, self._udev_tag):
+            target = self._match(device)
+            if target and device.device_node:
+                self._populate_device_tree(self._open_hidraw_children(device), target, device.sys_path)
 
         self.__logger.info('Device tree populated:')
-        for line in self._tree.show(stdout=False).splitlines():
+        for line in self._registry.format():
             self.__logger.info('\t' + line)
 
-        # start observers
-        self._observer_usb.start()
-        self._observer_hidraw.start()
+    def _match(self, device: pyudev.Device) -> Optional[logitechd.backend._DeviceInfo]:
+        '''Target device info of a USB device, ``None`` if it is not a target (or not in our shard)'''
+        if self._shard and not self._shard(device.sys_path):
+            return None
+        return _match(device, self._targets, self._udev_tag)
 
     def _event_handler_parent(self, action: str, device: pyudev.Device) -> None:
         '''
-        Find devices and populate the tree
+        udev event handler for USB devices, queues the hidraw nodes of new target devices
+
+        The nodes usually show up afterwards, with their own events, this
+        picks up the ones that were created before we got the USB event.
         '''
-        if action == 'add' and device.device_node and 'PRODUCT' in device.properties:
-            for target in logitechd.backend._TARGET_DEVICES:
-                if device.properties['PRODUCT'].startswith(f'{target.vid:x}/{target.pid:x}'):
-                    self._populate_device_tree(device, target)
+        if action != 'add' or not device.device_node or not self._match(device):
+            return
+        for child in self._find_hidraw_children(device):
+            self._queue_hotplug('add', child)
 
     def _event_handler_hidraw(self, action: str, device: pyudev.Device) -> None:
         '''
         udev event handler for node (hidraw devices created by the hid-logitech-dj kernel driver) actions
         '''
-        if action == 'remove' and device.device_node:
-            if device.device_node in self._tree:
-                self._tree.remove_node(device.device_node)
+        if action in ('add', 'remove') and device.device_node:
+            self._queue_hotplug(action, device)
+
+    def _queue_hotplug(self, action: str, device: pyudev.Device) -> None:
+        '''Queue a node event, collapsing it with the queued ones, and (re)start the debounce timer'''
+        node = device.device_node
+        removed = action == 'remove' or (node in self._hotplug and self._hotplug.pop(node)[0])
+        self._hotplug[node] = (removed, action == 'add', device)
+        if not self._loop:
+            return
+        if self._hotplug_timer:
+            self._hotplug_timer.cancel()
+        self._hotplug_timer = self._loop.call_later(self.hotplug_debounce, self._reconcile)
+
+    def _reconcile(self) -> None:
+        '''Apply the queued node events: removals, then additions, receivers first'''
+        self._hotplug_timer = None
+        events, self._hotplug = self._hotplug, {}
+        for node, (removed, _, _) in events.items():
+            if removed:
+                self._remove_node(node)
+
+        added = []
+        for node, (_, present, device) in events.items():
+            if not present or self._registry.get(node) or any(node == hidraw.path for hidraw in self._orphaned()):
+                continue
+            usb_device = device.find_parent('usb', 'usb_device')
+            target = self._match(usb_device) if usb_device is not None else None
+            if not target:
+                continue
+            hidraw = self._open(node)
+            if hidraw:
+                added.append((hidraw, target, usb_device.sys_path))
+        for hidraw, target, key in sorted(added, key=lambda item: item[0].info != item[1].as_tuple):
+            self._add_node(hidraw, target, key)
+
+        if added or any(removed for removed, _, _ in events.values()):
+            self.__logger.info('Device tree updated:')
+            for line in self._registry.format():
+                self.__logger.info('\t' + line)
+
+    def _orphaned(self) -> Iterable[ioctl.hidraw.Hidraw]:
+        for nodes in self._orphans.values():
+            yield from nodes
+
+    def _remove_node(self, node: str) -> None:
+        '''Detach and close a node, and the nodes of the devices paired to it'''
+        for entry in self._registry.remove(node):
+            self._unwatch(entry.device)
+            assert isinstance(entry.device.io, HidrawDevice)  # make mypy happy
+            entry.device.io.close()
+            logitechd.metrics.REGISTRY.remove_device(entry.device.io.path)
+        for key, (path, _) in list(self._receivers.items()):
+            if path == node:
+                del self._receivers[key]
+        for key, nodes in list(self._orphans.items()):
+            for hidraw in [hidraw for hidraw in nodes if hidraw.path == node]:
+                nodes.remove(hidraw)
+                HANDLES.release(hidraw.path)
+            if not nodes:
+                del self._orphans[key]
 
     def _find_hidraw_children(self, device: pyudev.Device) -> pyudev.Device:
         '''Find device children in the hidraw subsystem'''
@@ -162,95 +696,88 @@ class HidrawBackend(logitechd.backend.Backend):
             if 'SUBSYSTEM' in child.properties and child.properties['SUBSYSTEM'] == 'hidraw':
                 yield child
 
+    def _open(self, node: str) -> Optional[ioctl.hidraw.Hidraw]:
+        '''Open a hidraw node, if we can, and if it supports the vendor protocol'''
+        try:
+            hidraw = HANDLES.open(node)
+        except OSError as e:
+            self.__logger.error(f'Could not open device `{node}`, ignoring... ({e})')
+            return None
+        if not logitechd.rdesc.parse(hidraw.report_descriptor).vendor:
+            HANDLES.release(node)  # probe only
+            return None
+        return hidraw
+
+    def _open_hidraw_children(self, device: pyudev.Device) -> List[ioctl.hidraw.Hidraw]:
+        '''Open the vendor hidraw nodes of a USB device'''
+        nodes = (self._open(child.device_node) for child in self._find_hidraw_children(device))
+        return [hidraw for hidraw in nodes if hidraw]
+
     def _populate_device_tree(
         self,
-        usb_device: pyudev.Device,
+        nodes: Iterable[ioctl.hidraw.Hidraw],
         target_info: logitechd.backend._DeviceInfo,
+        key: str,
     ) -> None:
         '''
-        Look at children of the USB device, find the hidraw nodes and populate the tree.
+        Populate the tree with the vendor hidraw nodes of a USB device (``key``), its receiver first
         '''
-        parent: Optional[HidrawDevice] = None
-        children: List[HidrawDevice] = []
+        for hidraw in sorted(nodes, key=lambda hidraw: hidraw.info != target_info.as_tuple):
+            self._add_node(hidraw, target_info, key)
+        if key not in self._receivers:
+            self.__logger.error(
+                f'Could not find the hiraw node for the parent device in `{key}` '
+                f'(children=`{[hidraw.path for hidraw in self._orphans.get(key, [])]}`)'
+            )
 
-        # discover hidraw node of the parent and save the children
-        for child in self._find_hidraw_children(usb_device):
+    def _add_node(self, hidraw: ioctl.hidraw.Hidraw, target_info: logitechd.backend._DeviceInfo, key: str) -> None:
+        '''Register a vendor hidraw node of a USB device, paired devices wait for their receiver'''
+        if hidraw.info == target_info.as_tuple:  # target (parent)
+            parent = HidrawDevice(hidraw=hidraw)
+            # the receiver and its paired devices share the radio link
+            scheduler = logitechd.protocol.scheduler.ReceiverScheduler(self._receiver_in_flight)
+            entry = self._registry.add(
+                logitechd.protocol.construct_device(parent, notifications=self._notifications, scheduler=scheduler),
+                parent.path,
+                name=parent.name,
+                serial=hidraw.uniq,
+            )
+            self._setup(entry.device, 0xff, None)
+            self._receivers[key] = (parent.path, scheduler)
+            for orphan in self._orphans.pop(key, []):
+                self._add_node(orphan, target_info, key)
+        elif key in self._receivers:  # device
+            parent_path, scheduler = self._receivers[key]
+            child = HidrawDevice(hidraw=hidraw)
+            entry = self._registry.add(
+                logitechd.protocol.construct_device(
+                    child, self._hidraw_device_index(child), self._notifications, scheduler,
+                ),
+                child.path,
+                name=child.name,
+                parent=parent_path,
+                serial=hidraw.uniq,
+            )
+            self._setup(entry.device, entry.device.device_index, parent_path)
+        else:
+            self._orphans.setdefault(key, []).append(hidraw)
 
+    def _setup(self, device: logitechd.protocol.Device, device_index: int, parent: Optional[str]) -> None:
+        '''Start recording and watching a newly registered device'''
+        if self._capture:
+            assert isinstance(device.io, HidrawDevice)  # make mypy happy
             try:
-                hidraw = ioctl.hidraw.Hidraw(child.device_node)
-            except PermissionError:
-                self.__logger.error(f'Could not open device `{child.device_node}`, ignoring...')
-                continue
-
-            if self._hidraw_has_vendor_page(hidraw):  # supports vendor protocol
-                if hidraw.info == target_info.as_tuple:  # target (parent)
-                    parent = HidrawDevice(hidraw=hidraw)
-                    self._tree.create_node(
-                        tag=hidraw.name,
-                        identifier=hidraw.path,
-                        parent='devices',
-                        data=logitechd.protocol.construct_device(parent),
-                    )
-                else:  # device
-                    children.append(HidrawDevice(hidraw=hidraw))
-
-        # populate tree
-        if parent:
-            for child in children:
-                self._tree.create_node(
-                    tag=child.name,
-                    identifier=child.path,
-                    parent=parent.path,
-                    data=logitechd.protocol.construct_device(child),
-                )
-        else:
-            self.__logger.error(
-                f'Could not find the hiraw node for the parent device in `{usb_device}` '
-                f'(children=`{children}`)'
-            )
+                device.io.capture(self._capture, device_index=device_index, parent=parent)
+            except (ValueError, OSError) as e:  # the device works without it
+                self.__logger.error(f'Could not capture the traffic of `{device.io.path}`: {e}')
+        device.on_connection(self._device_connection)
+        self._watch(device)
 
-    def _hidraw_has_vendor_page(self, hidraw: ioctl.hidraw.Hidraw) -> bool:
-        '''
-        Whether or not the report descriptor of a hidraw node contains a vendor page
-        Really basic HID report descriptor parser. You can find the documentation
-        in items 5 (Operational Mode) and 6 (Descriptors) of the Device Class
-        Definition for HID
+    def _hidraw_device_index(self, device: HidrawDevice) -> int:
         '''
+        HID++ device index of a hidraw node created by hid-logitech-dj
 
-        class Type(object):
-            MAIN = 0
-            GLOBAL = 1
-            LOCAL = 2
-            RESERVED = 3
-
-        class TagGlobal(object):
-            USAGE_PAGE = 0b0000
-            LOGICAL_MINIMUM = 0b0001
-            LOGICAL_MAXIMUM = 0b0010
-            PHYSICAL_MINIMUM = 0b0011
-            PHYSICAL_MAXIMUM = 0b0100
-            UNIT_EXPONENT = 0b0101
-            UNIT = 0b0110
-            REPORT_SIZE = 0b0111
-            REPORT_ID = 0b1000
-            REPORT_COUNT = 0b1001
-            PUSH = 0b1010
-            POP = 0b1011
-
-        rdesc = hidraw.report_descriptor
-        i = 0
-        while i < len(rdesc):
-            prefix = rdesc[i]
-            tag = (prefix & 0b11110000) >> 4
-            typ = (prefix & 0b00001100) >> 2
-            size = prefix & 0b00000011
-
-            if size == 3:  # 6.2.2.2
-                size = 4
-
-            if typ == Type.GLOBAL and tag == TagGlobal.USAGE_PAGE and rdesc[i+2] == 0xff:  # vendor page
-                return True
-
-            i += size + 1
-
-        return False
+        The driver appends the index to the physical path (eg. ``usb-0000:00:14.0-2/input2:1``).
+        '''
+        index = device._hidraw.phys.rpartition(':')[2]
+        return int(index) if index.isdigit() else 0xff
@@ -0,0 +1,81 @@
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import collections
+import configparser
+import glob
+import logging
+
+from typing import DefaultDict, List, Optional, Sequence
+
+import ioctl.hidraw
+
+import logitechd.backend
+import logitechd.backend.hidraw
+import logitechd.config
+
+
+class RawBackend(logitechd.backend.hidraw.HidrawBackend):
+    '''
+    Backend for a fixed set of hidraw nodes, without UDEV
+
+    Meant for containers and minimal systems, where there is no UDEV and the
+    nodes are bind mounted or passed down. ``nodes`` (``nodes`` in the
+    ``rawfd`` section of the configuration, whitespace separated) are opened
+    directly, defaulting to all ``/dev/hidraw*`` nodes. Inherited file
+    descriptors can be given as ``/proc/self/fd/<fd>``.
+
+    Receivers and wired devices are matched against the target devices, and
+    the nodes hid-logitech-dj creates for the paired devices are put under
+    their receiver by physical path. There is no hotplug: nodes that go away
+    stop being watched, new nodes are not picked up.
+    '''
+
+    def __init__(
+        self,
+        nodes: Optional[Sequence[str]] = None,
+        *,
+        discovery_concurrency: int = 8,
+        startup_deadline: float = 5.0,
+        lazy: Optional[bool] = None,
+        receiver_in_flight: Optional[int] = None,
+        config: Optional[configparser.ConfigParser] = None,
+    ) -> None:
+        if config is None:
+            config = logitechd.config.load()
+        if nodes is None:
+            nodes = config.get('rawfd', 'nodes', fallback='').split() or sorted(glob.glob('/dev/hidraw*'))
+        self._nodes = nodes
+        super().__init__(
+            discovery_concurrency=discovery_concurrency,
+            startup_deadline=startup_deadline,
+            lazy=lazy,
+            receiver_in_flight=receiver_in_flight,
+            config=config,
+        )
+
+    def _setup_udev(self) -> None:
+        '''Populate the device tree from the nodes, grouped by USB interface'''
+        logger = logging.getLogger(self.__class__.__name__)
+        interfaces: DefaultDict[str, List[ioctl.hidraw.Hidraw]] = collections.defaultdict(list)
+        for node in self._nodes:
+            hidraw = self._open(node)
+            if hidraw is None:
+                continue
+            # hid-logitech-dj appends the device index to the physical path of the receiver
+            interface, _, index = hidraw.phys.rpartition(':')
+            interfaces[interface if index.isdigit() else hidraw.phys].append(hidraw)
+
+        for interface, hidraws in interfaces.items():
+            targets = (self._targets.get(hidraw.info[1:]) for hidraw in hidraws)
+            target = next((target for target in targets if target), None)
+            if target:
+                self._populate_device_tree(hidraws, target, interface)
+                continue
+            for hidraw in hidraws:  # not ours
+                logitechd.backend.hidraw.HANDLES.release(hidraw.path)
+
+        logger.info('Device tree populated:')
+        for line in self._registry.format():
+            logger.info('\t' + line)
@@ -0,0 +1,184 @@
+# SPDX-License-Identifier: MIT
+'''
+Replay of captured HID++ traffic
+
+Devices are recreated from a capture file (see ``logitechd.capture``) on top
+of the simulator: requests are answered with the reply the real device gave
+to the same request, after the same delay, and the reports the device sent
+on its own (notifications, connection events) are played back at their
+original time. ``speed`` scales all timings, ``math.inf`` replays as fast as
+possible. This allows profiling the daemon against real traffic, offline.
+'''
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import configparser
+import os
+
+from typing import Any, DefaultDict, Deque, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import logitechd.backend.simulator
+import logitechd.capture
+import logitechd.protocol.engine
+import logitechd.protocol.scheduler
+
+
+_ERRORS = (logitechd.protocol.engine.HIDPP10_ERROR, logitechd.protocol.engine.HIDPP20_ERROR)
+
+
+class ReplayDevice(logitechd.backend.simulator.SimulatedDevice):
+    '''
+    Device replaying its captured traffic
+
+    Requests are matched on everything but the software ID, which is
+    rewritten in the reply. When a request was captured several times, its
+    replies are used in turn. Requests that were not captured are not
+    answered, and are counted in ``unmatched``.
+    '''
+
+    def __init__(
+        self,
+        description: Mapping[str, Any],
+        records: Sequence[logitechd.capture.Record],
+        *,
+        speed: float = 1.0,
+    ) -> None:
+        bus, vid, pid = description['info']
+        super().__init__(description['name'], pid, vid=vid)
+        self._info = (bus, vid, pid)
+        self._report_lengths = {
+            int(report_id): length
+            for report_id, length in description.get('report_lengths', {}).items()
+        } or logitechd.protocol.engine.REPORT_LENGTHS
+        self.speed = speed
+        self.unmatched = 0
+        self.notifications: List[Tuple[float, bytes]] = []  # (timestamp, report)
+        self._replies: DefaultDict[bytes, Deque[Tuple[float, bytes]]] = collections.defaultdict(collections.deque)
+        self._load(records)
+
+    @property
+    def report_lengths(self) -> Mapping[int, int]:
+        return self._report_lengths
+
+    @staticmethod
+    def _key(request: bytes) -> bytes:
+        '''Request without its software ID'''
+        return request[:3] + bytes((request[3] & 0xf0,)) + request[4:]
+
+    def _load(self, records: Sequence[logitechd.capture.Record]) -> None:
+        '''Pair the captured requests with their replies'''
+        pending: Dict[Tuple[int, int, int], Tuple[float, bytes]] = {}  # (device index, feature index, function) -> write
+        for record in records:
+            report = record.report
+            if len(report) < 5:
+                continue
+            if record.direction == logitechd.capture.WRITE:
+                pending[report[1], report[2], report[3]] = (record.timestamp, report)
+                continue
+            if report[2] in _ERRORS:
+                request = pending.pop((report[1], report[3], report[4]), None)
+            else:
+                request = pending.pop((report[1], report[2], report[3]), None)
+            if request is None:
+                self.notifications.append((record.timestamp, report))
+            else:
+                self._replies[self._key(request[1])].append((record.timestamp - request[0], report))
+
+    @staticmethod
+    def _retag(reply: bytes, software_id: int) -> bytes:
+        report = bytearray(reply)
+        position = 4 if report[2] in _ERRORS else 3
+        report[position] = (report[position] & 0xf0) | software_id
+        return bytes(report)
+
+    def receive(self, request: bytes) -> None:
+        self.requests += 1
+        replies = self._replies.get(self._key(request))
+        if not replies:
+            self.unmatched += 1
+            return
+        delay, reply = replies[0]
+        replies.rotate(-1)
+        reply = self._retag(reply, request[3] & 0x0f)
+        if delay / self.speed > 0:
+            asyncio.get_running_loop().call_later(delay / self.speed, self._send_if_open, reply)
+        else:
+            self.send(reply)
+
+
+class ReplayBackend(logitechd.backend.simulator.SimulatorBackend):
+    '''
+    Backend replaying a capture file
+
+    Devices are registered with their captured paths, receivers and device
+    indexes. The playback of unsolicited reports starts when the backend is
+    attached to an event loop, ``playback`` is the task running it.
+    '''
+
+    def __init__(self, path: str, *, speed: float = 1.0, receiver_in_flight: int = 4) -> None:
+        if not speed > 0:
+            raise ValueError(f'Expected a positive `speed` but got `{speed}`')
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'Capture file `{path}` not found')
+        super().__init__((), receiver_in_flight=receiver_in_flight)
+        self.speed = speed
+        self.playback: Optional[asyncio.Task[None]] = None
+        self.played = 0
+
+        with logitechd.capture.CaptureFile(path) as capture:
+            descriptions: Dict[str, Dict[str, Any]] = {}  # path -> description, a device may be registered again
+            for description in capture.devices:
+                descriptions.setdefault(description['path'], description)
+            records: DefaultDict[str, List[logitechd.capture.Record]] = collections.defaultdict(list)
+            for record in capture:
+                records[capture.devices[record.device]['path']].append(record)
+
+        schedulers: Dict[str, logitechd.protocol.scheduler.ReceiverScheduler] = {}
+        self._playlist: List[Tuple[float, ReplayDevice, bytes]] = []
+        for device_path, description in descriptions.items():
+            io = ReplayDevice(description, records[device_path], speed=speed)
+            parent = description.get('parent')
+            scheduler = schedulers.get(parent) if parent else None
+            if scheduler is None:
+                scheduler = logitechd.protocol.scheduler.ReceiverScheduler(receiver_in_flight)
+            schedulers[device_path] = scheduler
+            self._add(io, device_path, description.get('device_index', 0xff), parent, scheduler)
+            self._playlist.extend((timestamp, io, report) for timestamp, report in io.notifications)
+        self._playlist.sort(key=lambda item: item[0])
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser) -> ReplayBackend:
+        '''Replay ``path`` at ``speed``, from the ``replay`` section of the configuration'''
+        path = config.get('replay', 'path', fallback=None)
+        if not path:
+            raise ValueError('Missing capture file to replay, set `path` in the `replay` section of the configuration')
+        return cls(
+            path,
+            speed=config.getfloat('replay', 'speed', fallback=1.0),
+            receiver_in_flight=config.getint('scheduler', 'in_flight', fallback=4),
+        )
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        super().attach(loop)
+        self.playback = loop.create_task(self._play())
+
+    def detach(self) -> None:
+        if self.playback:
+            self.playback.cancel()
+            self.playback = None
+        super().detach()
+
+    async def _play(self) -> None:
+        '''Send the unsolicited reports, keeping their original spacing'''
+        if not self._playlist:
+            return
+        loop = asyncio.get_running_loop()
+        start, first = loop.time(), self._playlist[0][0]
+        for timestamp, io, report in self._playlist:
+            delay = start + (timestamp - first) / self.speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            io._send_if_open(report)
+            self.played += 1
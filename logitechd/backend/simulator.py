@@ -0,0 +1,399 @@
+# SPDX-License-Identifier: MIT
+'''
+Hardware-free HID++ device simulator
+
+Simulated devices answer HID++ 2.0 requests from their feature table, with
+configurable latency, jitter and drop rate, and can be paired to simulated
+receivers. Each device is backed by a ``SOCK_SEQPACKET`` socket pair, so
+that, like a hidraw node, it has a file descriptor that becomes readable
+when a report is pending and reads return whole reports.
+'''
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import configparser
+import os
+import random
+import socket
+import sys
+import threading
+
+from types import TracebackType
+from typing import AbstractSet, Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple, Type, Union
+
+import logitechd.backend
+import logitechd.protocol
+import logitechd.protocol.engine
+import logitechd.protocol.notifications
+import logitechd.protocol.report
+import logitechd.protocol.scheduler
+import logitechd.registry
+
+from logitechd.protocol.features import DeviceInformation, IFeatureSet, IRoot
+
+
+if sys.version_info >= (3, 8):
+    from typing import Literal
+else:
+    from typing_extensions import Literal
+
+
+# HID++ 2.0 error codes
+ERR_INVALID_FEATURE_INDEX = 0x06
+ERR_INVALID_FUNCTION_ID = 0x07
+# HID++ 1.0 error codes
+ERR_INVALID_SUBID = 0x01
+
+Handler = Callable[[bytes], bytes]  # request parameters -> reply parameters
+
+
+class SimulatedInterface(logitechd.backend.IODeviceInterface):
+    '''Host side of a simulated device'''
+
+    def __init__(self, device: SimulatedDevice, sock: socket.socket) -> None:
+        self._device = device
+        self._fd = sock.fileno()
+        self._buffer = bytearray(max(logitechd.protocol.engine.REPORT_LENGTHS.values()))
+        self._view = memoryview(self._buffer)
+        self._metrics = device.metrics
+
+    def read(self) -> memoryview:
+        return self._view[:self.read_into(self._buffer)]
+
+    def read_into(self, buffer: logitechd.backend.WritableBuffer) -> int:
+        length = os.readv(self._fd, (buffer,))
+        self._metrics.reports_read.value += 1
+        self._metrics.bytes_read.value += length
+        return length
+
+    def write(self, data: Union[logitechd.backend.Buffer, Sequence[int]]) -> None:
+        self._metrics.reports_written.value += 1
+        self._metrics.bytes_written.value += len(data)
+        self._device.receive(bytes(data))
+
+
+class SimulatedDevice(logitechd.backend.IODevice):
+    '''
+    Simulated HID++ 2.0 device
+
+    The feature table holds IRoot, IFeatureSet and DeviceInformation,
+    followed by ``features``. Requests to other features are answered by
+    ``handlers``, keyed by (feature ID, function), or with an empty reply.
+
+    Every reply is delayed by ``latency`` seconds plus up to ``jitter``
+    seconds, and is lost with ``drop_rate`` probability. A device that is not
+    ``online`` (eg. asleep) does not reply at all.
+    '''
+
+    def __init__(
+        self,
+        name: str = 'Simulated Device',
+        pid: int = 0xc33f,
+        *,
+        vid: int = 0x046d,
+        features: Sequence[int] = (),
+        handlers: Optional[Dict[Tuple[int, int], Handler]] = None,
+        protocol: Tuple[int, int] = (4, 2),
+        unit_id: bytes = b'\x00\x00\x00\x01',
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self._name = name
+        self._info = (0x03, vid, pid)
+        self.features = [IRoot.id, IFeatureSet.id, DeviceInformation.id, *features]
+        self.handlers = handlers or {}
+        self.protocol = protocol
+        self.unit_id = unit_id
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.online = True
+        self.device_index = 0xff  # set when paired to a receiver
+        self.requests = 0
+        self.dropped = 0
+        self._random = random.Random(seed)
+        self._host, self._device = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self._host.setblocking(False)
+        self._device.setblocking(False)
+        self._outbox: Deque[bytes] = collections.deque()  # reports waiting for room in the socket
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._interface = SimulatedInterface(self, self._host)
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def info(self) -> Tuple[int, int, int]:
+        return self._info
+
+    def fileno(self) -> int:
+        return self._host.fileno()
+
+    def __enter__(self) -> logitechd.backend.IODeviceInterface:
+        self._lock.acquire()
+        return self._interface
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> Literal[False]:
+        self._lock.release()
+        return False
+
+    def close(self) -> None:
+        if self._outbox and self._loop and not self._loop.is_closed():
+            self._loop.remove_writer(self._device.fileno())
+        self._outbox.clear()
+        self._host.close()
+        self._device.close()
+
+    # device side
+
+    def send(self, report: bytes) -> None:
+        '''Send a report to the host'''
+        if not self._outbox:
+            try:
+                self._device.send(report)
+                return
+            except BlockingIOError:  # the host is not keeping up, the socket queue is short
+                self._loop = asyncio.get_running_loop()
+                self._loop.add_writer(self._device.fileno(), self._flush)
+        self._outbox.append(report)
+
+    def _flush(self) -> None:
+        try:
+            while self._outbox:
+                self._device.send(self._outbox[0])
+                self._outbox.popleft()
+        except BlockingIOError:
+            return
+        if self._loop:
+            self._loop.remove_writer(self._device.fileno())
+
+    def notify(self, feature: int, event: int, data: bytes = b'') -> None:
+        '''Send a notification (software ID 0) for ``feature``, which must be in the feature table'''
+        self.send(self._report(self.device_index, self.features.index(feature), event << 4, data))
+
+    def receive(self, request: bytes) -> None:
+        '''Handle a request from the host, scheduling its reply'''
+        self.requests += 1
+        if not self.online:
+            return
+        if self.drop_rate and self._random.random() < self.drop_rate:
+            self.dropped += 1
+            return
+        reply = self.respond(request)
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            asyncio.get_running_loop().call_later(delay, self._send_if_open, reply)
+        else:
+            self.send(reply)
+
+    def _send_if_open(self, report: bytes) -> None:
+        if self._device.fileno() != -1:
+            self.send(report)
+
+    @staticmethod
+    def _report(device_index: int, feature_index: int, function: int, data: bytes) -> bytes:
+        report_id = logitechd.protocol.engine.LONG_REPORT_ID
+        length = logitechd.protocol.engine.REPORT_LENGTHS[report_id]
+        return bytes((report_id, device_index, feature_index, function)) + data[:length - 4].ljust(length - 4, b'\x00')
+
+    @staticmethod
+    def _error(request: bytes, code: int, hidpp10: bool = False) -> bytes:
+        if hidpp10:
+            error = logitechd.protocol.engine.HIDPP10_ERROR
+            report_id, length = logitechd.protocol.engine.SHORT_REPORT_ID, 7
+        else:
+            error = logitechd.protocol.engine.HIDPP20_ERROR
+            report_id, length = logitechd.protocol.engine.LONG_REPORT_ID, 20
+        return bytes((report_id, request[1], error, request[2], request[3], code)).ljust(length, b'\x00')
+
+    def respond(self, request: bytes) -> bytes:
+        '''Build the reply to a request'''
+        feature_index, function, params = request[2], request[3] >> 4, request[4:]
+        if feature_index >= len(self.features):
+            return self._error(request, ERR_INVALID_FEATURE_INDEX)
+        feature = self.features[feature_index]
+        handler = self.handlers.get((feature, function))
+        if handler is not None:
+            data = handler(params)
+        elif feature in (IRoot.id, IFeatureSet.id, DeviceInformation.id):
+            reply = self._respond_builtin(feature, function, params)
+            if reply is None:
+                return self._error(request, ERR_INVALID_FUNCTION_ID)
+            data = reply
+        else:
+            data = b''
+        return self._report(request[1], feature_index, request[3], data)
+
+    def _respond_builtin(self, feature: int, function: int, params: bytes) -> Optional[bytes]:
+        if feature == IRoot.id and function == IRoot.GetFeature.id:
+            feature_id, = IRoot.GetFeature.request_codec.struct.unpack_from(params)
+            index = self.features.index(feature_id) if feature_id in self.features else 0
+            return IRoot.GetFeature.response_codec.pack(index, 0, 0)
+        if feature == IRoot.id and function == IRoot.Ping.id:
+            return IRoot.Ping.response_codec.pack(*self.protocol, params[2])
+        if feature == IFeatureSet.id and function == IFeatureSet.GetCount.id:
+            return IFeatureSet.GetCount.response_codec.pack(len(self.features) - 1)
+        if feature == IFeatureSet.id and function == IFeatureSet.GetFeatureID.id:
+            index = params[0]
+            feature_id = self.features[index] if index < len(self.features) else 0
+            return IFeatureSet.GetFeatureID.response_codec.pack(feature_id, 0, 0)
+        if feature == DeviceInformation.id and function == DeviceInformation.GetDeviceInfo.id:
+            return DeviceInformation.GetDeviceInfo.response_codec.pack(1, self.unit_id, 0, b'', 0, 0)
+        if feature == DeviceInformation.id and function == DeviceInformation.GetFwInfo.id:
+            return DeviceInformation.GetFwInfo.response_codec.pack(0, b'SIM', 1, 0, 0, 1, self._info[2], b'')
+        return None
+
+
+class SimulatedReceiver(SimulatedDevice):
+    '''
+    Simulated HID++ 1.0 receiver
+
+    Rejects HID++ 2.0 requests like a real receiver does. Paired devices get
+    the device index of their slot and report their (dis)connections through
+    HID++ 1.0 connection notifications.
+    '''
+
+    def __init__(self, name: str = 'Simulated Receiver', pid: int = 0xc53f, **kwargs: Any) -> None:
+        super().__init__(name, pid, **kwargs)
+        self.paired: Dict[int, SimulatedDevice] = {}
+
+    def pair(self, device: SimulatedDevice, slot: Optional[int] = None) -> int:
+        '''Pair a device, in the first free slot if none is given'''
+        if slot is None:
+            slot = next((slot for slot in range(1, 7) if slot not in self.paired), None)  # 6 pairing slots
+            if slot is None:
+                raise KeyError('No free slot')
+        if slot in self.paired:
+            raise KeyError(f'Slot {slot} already taken')
+        self.paired[slot] = device
+        device.device_index = slot
+        return slot
+
+    def respond(self, request: bytes) -> bytes:
+        return self._error(request, ERR_INVALID_SUBID, hidpp10=True)
+
+    def set_connected(self, slot: int, connected: bool) -> None:
+        '''Bring a paired device on/offline, sending its connection notification'''
+        device = self.paired[slot]
+        device.online = connected
+        flags = 0x00 if connected else 0x40
+        pid = device.info[2]
+        device.send(bytes((
+            logitechd.protocol.engine.SHORT_REPORT_ID, slot, logitechd.protocol.DEVICE_CONNECTION,
+            0x04, flags, pid & 0xff, pid >> 8,
+        )))
+
+
+class SimulatorBackend(logitechd.backend.Backend):
+    '''
+    Backend for simulated devices
+
+    Receivers and their paired devices share a ``ReceiverScheduler``, like
+    with the hidraw backend. Devices are registered as ``<prefix>/<n>`` and
+    their paired devices as ``<prefix>/<n>/<slot>``.
+    '''
+
+    def __init__(
+        self,
+        devices: Sequence[SimulatedDevice],
+        *,
+        receiver_in_flight: int = 4,
+        prefix: str = 'sim',
+    ) -> None:
+        self._registry = logitechd.registry.DeviceRegistry()
+        self._notifications = logitechd.protocol.notifications.NotificationBus()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._simulated: List[SimulatedDevice] = []
+        for i, io in enumerate(devices):
+            scheduler = logitechd.protocol.scheduler.ReceiverScheduler(receiver_in_flight)
+            self._add(io, f'{prefix}/{i}', 0xff, None, scheduler)
+            if isinstance(io, SimulatedReceiver):
+                for slot, child in io.paired.items():
+                    self._add(child, f'{prefix}/{i}/{slot}', slot, f'{prefix}/{i}', scheduler)
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser) -> SimulatorBackend:
+        '''
+        Backend with ``devices`` simulated devices, from the ``simulator`` section of the configuration
+
+        ``latency``, ``jitter`` and ``drop_rate`` set the behavior of the devices.
+        '''
+        devices = [
+            SimulatedDevice(
+                f'Simulated Device {i}',
+                latency=config.getfloat('simulator', 'latency', fallback=0.0),
+                jitter=config.getfloat('simulator', 'jitter', fallback=0.0),
+                drop_rate=config.getfloat('simulator', 'drop_rate', fallback=0.0),
+            )
+            for i in range(config.getint('simulator', 'devices', fallback=1))
+        ]
+        return cls(devices, receiver_in_flight=config.getint('scheduler', 'in_flight', fallback=4))
+
+    def _add(
+        self,
+        io: SimulatedDevice,
+        path: str,
+        device_index: int,
+        parent: Optional[str],
+        scheduler: logitechd.protocol.scheduler.ReceiverScheduler,
+    ) -> None:
+        device = logitechd.protocol.construct_device(io, device_index, self._notifications, scheduler)
+        self._registry.add(device, path, name=io.name, parent=parent)
+        self._simulated.append(io)
+
+    @property
+    def devices(self) -> AbstractSet[logitechd.protocol.Device]:
+        return self._registry.devices
+
+    @property
+    def registry(self) -> logitechd.registry.DeviceRegistry:
+        return self._registry
+
+    @property
+    def notifications(self) -> logitechd.protocol.notifications.NotificationBus:
+        return self._notifications
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        for device in self._registry.devices:
+            with device.io as interface:
+                reader = logitechd.protocol.report.ReportReader(interface, device.io.report_lengths)
+            loop.add_reader(device.io.fileno(), self._event_handler_report, device, reader)
+
+    def detach(self) -> None:
+        if self._loop:
+            for device in self._registry.devices:
+                self._loop.remove_reader(device.io.fileno())
+            self._loop = None
+
+    def close(self) -> None:
+        '''Detach and close the simulated devices'''
+        self.detach()
+        for io in self._simulated:
+            io.close()
+
+    def _event_handler_report(
+        self,
+        device: logitechd.protocol.Device,
+        reader: logitechd.protocol.report.ReportReader,
+    ) -> None:
+        try:
+            report = reader.read()
+        except BlockingIOError:
+            return
+        if report:
+            try:
+                device.handle_report(report)
+            finally:
+                report.release()
@@ -0,0 +1,172 @@
+# SPDX-License-Identifier: MIT
+'''
+HID++ traffic capture
+
+Reports are appended to a ring file of fixed-size records, memory mapped,
+so recording is a ``struct.pack_into`` and the file never grows past its
+capacity: once full, the oldest records are overwritten.
+
+The file starts with a header page holding the format version, the ring
+geometry and position, and a JSON table of the captured devices, followed by
+the records. Each record holds the time since the capture started, the
+device, the direction and the report.
+'''
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from typing import Any, Dict, Iterator, List, NamedTuple, Sequence, Union
+
+import logitechd.backend
+
+
+MAGIC = b'LGDCAP\x00\x01'
+HEADER_SIZE = 4096
+REPORT_SIZE = 64  # largest HID++ report (very long)
+
+READ = 0  # device -> host
+WRITE = 1  # host -> device
+
+_HEADER = struct.Struct('<8sIIQd')  # magic, record size, capacity, records written, start time
+_TABLE_OFFSET = _HEADER.size + 4  # u32 length of the device table, then the table
+_RECORD = struct.Struct(f'<dHBB4x{REPORT_SIZE}s')  # timestamp, device, direction, length, report
+_RECORD_HEAD = struct.Struct('<dHBB4x')  # the report is copied in place, without packing it
+
+
+class Record(NamedTuple):
+    timestamp: float  # seconds since the capture started
+    device: int
+    direction: int
+    report: bytes
+
+
+class CaptureFile(object):
+    '''
+    Capture ring file
+
+    ``capacity`` is the number of records kept, it is only used when creating
+    a new file, existing files are opened with their own.
+    '''
+
+    def __init__(self, path: str, capacity: int = 65536) -> None:
+        if capacity < 1:
+            raise ValueError(f'Expected a positive `capacity` but got `{capacity}`')
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if exists:
+                with open(path, 'rb') as f:
+                    magic, record_size, capacity, _, _ = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != MAGIC or record_size != _RECORD.size:
+                    raise ValueError(f'`{path}` is not a capture file, or has an unsupported format')
+            else:
+                os.ftruncate(fd, HEADER_SIZE + capacity * _RECORD.size)
+            self._mmap = mmap.mmap(fd, HEADER_SIZE + capacity * _RECORD.size)
+        finally:
+            os.close(fd)
+
+        self.capacity = capacity
+        self.start: float
+        self._written: int
+        self._lock = threading.Lock()
+        if exists:
+            _, _, _, self._written, self.start = _HEADER.unpack_from(self._mmap)
+            length, = struct.unpack_from('<I', self._mmap, _HEADER.size)
+            self._devices: List[Dict[str, Any]] = json.loads(bytes(self._mmap[_TABLE_OFFSET:_TABLE_OFFSET + length]))
+        else:
+            self._written = 0
+            self.start = time.time()
+            self._devices = []
+            self._write_header()
+
+    def _write_header(self) -> None:
+        _HEADER.pack_into(self._mmap, 0, MAGIC, _RECORD.size, self.capacity, self._written, self.start)
+
+    def close(self) -> None:
+        self._mmap.flush()
+        self._mmap.close()
+
+    def __enter__(self) -> CaptureFile:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @property
+    def devices(self) -> Sequence[Dict[str, Any]]:
+        '''Captured devices, indexed by the device number in the records'''
+        return self._devices
+
+    def register(self, **device: Any) -> int:
+        '''
+        Add a device to the device table, returns its number
+
+        Takes any JSON serializable description of the device, the replay
+        backend uses ``path``, ``name``, ``info``, ``device_index``,
+        ``parent`` and ``report_lengths``. A device already in the table
+        (eg. registered before a restart, or before being unplugged) gets its
+        number back. Raises ``ValueError`` when the table is full.
+        '''
+        device = json.loads(json.dumps(device))  # as it reads back from the table, eg. tuples become lists
+        with self._lock:
+            if device in self._devices:
+                return self._devices.index(device)
+            table = json.dumps([*self._devices, device]).encode()
+            if _TABLE_OFFSET + len(table) > HEADER_SIZE:
+                raise ValueError('Capture device table full')
+            self._devices.append(device)
+            struct.pack_into('<I', self._mmap, _HEADER.size, len(table))
+            self._mmap[_TABLE_OFFSET:_TABLE_OFFSET + len(table)] = table
+            return len(self._devices) - 1
+
+    def record(self, device: int, direction: int, report: logitechd.backend.Buffer) -> None:
+        '''Append a report'''
+        timestamp = time.time() - self.start
+        with self._lock:
+            offset = HEADER_SIZE + (self._written % self.capacity) * _RECORD.size
+            _RECORD_HEAD.pack_into(self._mmap, offset, timestamp, device, direction, len(report))
+            self._mmap[offset + _RECORD_HEAD.size:offset + _RECORD_HEAD.size + len(report)] = report
+            self._written += 1
+            struct.pack_into('<Q', self._mmap, 16, self._written)  # records written, in the header
+
+    def __len__(self) -> int:
+        return min(self._written, self.capacity)
+
+    def __iter__(self) -> Iterator[Record]:
+        '''Records, oldest first'''
+        for i in range(self._written - len(self), self._written):
+            offset = HEADER_SIZE + (i % self.capacity) * _RECORD.size
+            timestamp, device, direction, length, report = _RECORD.unpack_from(self._mmap, offset)
+            yield Record(timestamp, device, direction, report[:length])
+
+
+class RecordingInterface(logitechd.backend.IODeviceInterface):
+    '''Records the reports going through an IO interface'''
+
+    def __init__(self, interface: logitechd.backend.IODeviceInterface, capture: CaptureFile, device: int) -> None:
+        self._interface = interface
+        self._capture = capture
+        self._device = device
+
+    def read(self) -> memoryview:
+        data = self._interface.read()
+        self._capture.record(self._device, READ, data)
+        return data
+
+    def read_into(self, buffer: logitechd.backend.WritableBuffer) -> int:
+        length = self._interface.read_into(buffer)
+        self._capture.record(self._device, READ, memoryview(buffer)[:length])
+        return length
+
+    def write(self, data: Union[logitechd.backend.Buffer, Sequence[int]]) -> None:
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        self._interface.write(data)
+        self._capture.record(self._device, WRITE, data)
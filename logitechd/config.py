@@ -0,0 +1,92 @@
+# SPDX-License-Identifier: MIT
+
+import configparser
+import logging
+import os
+
+from typing import Optional
+
+
+def default_path() -> str:
+    '''``$XDG_CONFIG_HOME/logitechd/logitechd.conf``'''
+    config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+    return os.path.join(config_home, 'logitechd', 'logitechd.conf')
+
+
+def parser() -> configparser.ConfigParser:
+    '''Empty configuration, only splitting keys and values on ``=``, so that ``VID:PID`` keys work'''
+    return configparser.ConfigParser(delimiters=('=',))
+
+
+def load(path: Optional[str] = None) -> configparser.ConfigParser:
+    '''
+    Load the configuration file
+
+    It is an INI file, eg.
+
+    .. code-block:: ini
+
+        [devices]
+        # extra devices to manage, as VID:PID = name
+        046d:c339 = G Pro
+
+        [backend]
+        # hidraw, rawfd (no UDEV), simulator, replay or one installed by a package
+        name = hidraw
+
+        [rawfd]
+        # hidraw nodes for the rawfd backend, defaults to all of them
+        nodes = /dev/hidraw3 /dev/hidraw4
+
+        [replay]
+        # capture file for the replay backend, and the playback speed
+        path = /var/tmp/logitechd.cap
+        speed = 1.0
+
+        [udev]
+        # only watch devices with this udev tag
+        tag = logitechd
+        # seconds to wait for hotplug events to settle before applying them
+        debounce = 0.1
+
+        [discovery]
+        # resolve device features on first use, instead of all at startup
+        lazy = yes
+        # with lazy = no, devices discovered at once, and seconds to wait for
+        # the startup discovery before leaving slower devices to the background
+        concurrency = 8
+        startup_deadline = 5
+        # feature table cache, defaults to $XDG_CACHE_HOME/logitechd/features.json
+        # (with worker processes, each keeps its own, suffixed with .<worker>)
+        cache = /var/cache/logitechd/features.json
+
+        [scheduler]
+        # requests in flight per receiver, shared by its paired devices
+        in_flight = 4
+
+        [state]
+        # attributes polled in the background (empty to disable), and how often
+        poll = battery unified_battery
+        interval = 60
+        max_interval = 900
+
+        [workers]
+        # shard the hidraw devices across this many worker processes
+        count = 4
+
+        [capture]
+        # record the HID++ traffic to a ring file, keeping the last records
+        # (with worker processes, each records to its own file, suffixed with .<worker>)
+        path = /var/tmp/logitechd.cap
+        records = 65536
+
+    A missing or invalid file results in an empty configuration.
+    '''
+    config = parser()
+    path = path or default_path()
+    try:
+        config.read(path)
+    except configparser.Error as e:
+        logging.getLogger(__name__).error(f'Ignoring invalid configuration file `{path}`: {e}')
+        config = parser()
+    return config
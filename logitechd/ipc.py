@@ -0,0 +1,430 @@
+# SPDX-License-Identifier: MIT
+'''
+Local IPC over a Unix socket
+
+Messages are UTF-8 JSON documents, each prefixed by its length as a 32-bit
+big endian integer.
+
+Requests are ``{"id": 1, "method": "request", "params": {...}}`` objects.
+They are handled concurrently, so clients can pipeline them, and each gets
+a ``{"id": 1, "result": ...}`` or ``{"id": 1, "error": {"type": ..., "message": ...}}``
+response as soon as it completes, possibly out of order. A list of requests
+is a batch: they are run concurrently and answered with a single list of
+responses, in the same order.
+
+Subscriptions push ``{"subscription": 1, "notification": {...}}`` messages.
+'''
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import struct
+
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import logitechd.backend
+import logitechd.metrics
+import logitechd.protocol
+import logitechd.protocol.notifications
+
+
+_HEADER = struct.Struct('>I')
+MAX_MESSAGE_SIZE = 1 << 20
+
+
+def default_path() -> str:
+    '''``$XDG_RUNTIME_DIR/logitechd.sock``, or ``/run/logitechd.sock``'''
+    return os.path.join(os.environ.get('XDG_RUNTIME_DIR') or '/run', 'logitechd.sock')
+
+
+class IPCError(Exception):
+    '''The server replied with an error'''
+
+    def __init__(self, type: str, message: str) -> None:
+        self.type = type
+        self.message = message
+        super().__init__(f'{type}: {message}')
+
+
+async def _read_message(reader: asyncio.StreamReader) -> Any:
+    size, = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f'Message too big ({size} bytes)')
+    return json.loads(await reader.readexactly(size))
+
+
+def _encode_message(message: Any) -> bytes:
+    data = json.dumps(message, separators=(',', ':')).encode()
+    return _HEADER.pack(len(data)) + data
+
+
+class _Connection(object):
+    def __init__(
+        self,
+        server: BaseServer,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self._server = server
+        self._reader = reader
+        self._writer = writer
+        self._write_lock = asyncio.Lock()
+        self._tasks: Dict[int, asyncio.Task[None]] = {}
+        self._subscriptions: Dict[int, Tuple[Callable[[], None], asyncio.Task[None]]] = {}  # id -> (close, pusher)
+        self._next_subscription = 1
+
+    async def send(self, message: Any) -> None:
+        async with self._write_lock:
+            self._writer.write(_encode_message(message))
+            await self._writer.drain()
+
+    async def serve(self) -> None:
+        try:
+            while True:
+                message = await _read_message(self._reader)
+                task = asyncio.ensure_future(self._handle(message))
+                self._tasks[id(task)] = task
+                task.add_done_callback(lambda task: self._tasks.pop(id(task), None))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as e:
+            self._server._logger.warning(f'Closing client connection: {e}')
+        finally:
+            for task in list(self._tasks.values()):
+                task.cancel()
+            for close, task in self._subscriptions.values():
+                close()
+                task.cancel()
+            self._writer.close()
+
+    async def _handle(self, message: Any) -> None:
+        if isinstance(message, list):  # batch
+            await self.send(await asyncio.gather(*(self._call(request) for request in message)))
+        else:
+            await self.send(await self._call(message))
+
+    async def _call(self, request: Any) -> Dict[str, Any]:
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+                raise ValueError('Invalid request, expecting an object with a `method` string')
+            method = self._server._methods.get(request['method'])
+            if method is None:
+                raise ValueError(f'Unknown method `{request["method"]}`')
+            result = await method(self, **request.get('params', {}))
+        except asyncio.CancelledError:
+            raise
+        except IPCError as e:  # relayed from another server, keep its type
+            return {'id': request_id, 'error': {'type': e.type, 'message': e.message}}
+        except Exception as e:
+            return {'id': request_id, 'error': {'type': e.__class__.__name__, 'message': str(e)}}
+        return {'id': request_id, 'result': result}
+
+    def subscribe(self, notifications: AsyncIterable[Dict[str, Any]], close: Callable[[], None]) -> int:
+        '''Push ``notifications`` to the client until it unsubscribes, then call ``close``'''
+        subscription_id = self._next_subscription
+        self._next_subscription += 1
+        task = asyncio.ensure_future(self._push(subscription_id, notifications))
+        self._subscriptions[subscription_id] = close, task
+        return subscription_id
+
+    def unsubscribe(self, subscription_id: int) -> None:
+        close, task = self._subscriptions.pop(subscription_id)
+        close()
+        task.cancel()
+
+    async def _push(self, subscription_id: int, notifications: AsyncIterable[Dict[str, Any]]) -> None:
+        async for notification in notifications:
+            await self.send({'subscription': subscription_id, 'notification': notification})
+
+
+_Method = Callable[..., Awaitable[Any]]
+
+
+class BaseServer(object):
+    '''
+    IPC server plumbing
+
+    Subclasses register their methods in ``_methods``, as coroutine functions
+    called with the client connection and the request parameters.
+    '''
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.path = path or default_path()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._methods: Dict[str, _Method] = {}
+
+    async def start(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._serve, self.path)
+        self._logger.info(f'Listening on `{self.path}`')
+
+    async def close(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await _Connection(self, reader, writer).serve()
+
+
+class Server(BaseServer):
+    '''
+    IPC server
+
+    Exposes the device registry, HID++ requests and notifications of a
+    backend to local clients.
+    '''
+
+    def __init__(self, backend: logitechd.backend.Backend, path: Optional[str] = None) -> None:
+        super().__init__(path)
+        self.backend = backend
+        self._methods = {
+            'devices': self._devices,
+            'metrics': self._metrics,
+            'request': self._request,
+            'state': self._state,
+            'write': self._write,
+            'subscribe': self._subscribe,
+            'unsubscribe': self._unsubscribe,
+        }
+
+    def _device(self, path: str) -> logitechd.protocol.Device:
+        entry = self.backend.registry.get(path)
+        if entry is None:
+            raise KeyError(f'Unknown device `{path}`')
+        return entry.device
+
+    # methods
+
+    async def _devices(self, connection: _Connection) -> List[Dict[str, Any]]:
+        return [
+            {
+                'path': entry.path,
+                'name': entry.name,
+                'vid': entry.vid,
+                'pid': entry.pid,
+                'device_index': entry.device_index,
+                'serial': entry.serial,
+                'parent': entry.parent.path if entry.parent else None,
+                'protocol': entry.device.protocol_version,
+                'features': {f'{feature:04x}': index for feature, index in entry.device.features.items()},
+            }
+            for entry in self.backend.registry
+        ]
+
+    async def _feature_index(
+        self,
+        device: logitechd.protocol.Device,
+        feature: Optional[int],
+        feature_index: Optional[int],
+    ) -> int:
+        if feature_index is not None:
+            return feature_index
+        if feature is None:
+            raise ValueError('Missing `feature` or `feature_index`')
+        index = await device.feature_index(feature)
+        if not index and feature:
+            raise KeyError(f'Feature {feature:#06x} not supported by `{device.io.name}`')
+        return index
+
+    async def _metrics(self, connection: _Connection) -> str:
+        '''Metrics, in the Prometheus text format'''
+        return logitechd.metrics.REGISTRY.expose()
+
+    async def _request(
+        self,
+        connection: _Connection,
+        device: str,
+        function: int,
+        data: str = '',
+        feature: Optional[int] = None,
+        feature_index: Optional[int] = None,
+    ) -> str:
+        '''Raw HID++ request, by feature ID or index, with hex encoded data'''
+        target = self._device(device)
+        index = await self._feature_index(target, feature, feature_index)
+        return (await target.request(index, function, bytes.fromhex(data))).hex()
+
+    async def _state(self, connection: _Connection, device: str, name: str) -> Optional[Dict[str, Any]]:
+        '''Cached device attribute (eg. ``battery``), ``None`` if not supported, see ``DeviceState``'''
+        value = await self._device(device).state.get(name)
+        return value._asdict() if value is not None else None
+
+    async def _write(
+        self,
+        connection: _Connection,
+        device: str,
+        function: int,
+        data: str = '',
+        feature: Optional[int] = None,
+        feature_index: Optional[int] = None,
+        target: int = 0,
+    ) -> None:
+        '''Coalesced HID++ write, see ``Device.write``'''
+        dev = self._device(device)
+        index = await self._feature_index(dev, feature, feature_index)
+        await dev.write(index, function, bytes.fromhex(data), target=target)
+
+    async def _subscribe(
+        self,
+        connection: _Connection,
+        device: Optional[str] = None,
+        feature: Optional[int] = None,
+        event: Optional[int] = None,
+        maxsize: int = 64,
+    ) -> int:
+        target = self._device(device) if device else None
+        subscription = self.backend.notifications.subscribe(target, feature, event, maxsize=maxsize)
+        return connection.subscribe(self._format(subscription), subscription.close)
+
+    async def _format(
+        self,
+        subscription: logitechd.protocol.notifications.Subscription,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        async for notification in subscription:
+            entry = self.backend.registry.by_device(notification.device)
+            yield {
+                'device': entry.path if entry else None,
+                'feature': notification.feature_id,
+                'feature_index': notification.feature_index,
+                'event': notification.event,
+                'payload': notification.payload.hex(),
+                'data': notification.data._asdict() if notification.data is not None else None,
+            }
+
+    async def _unsubscribe(self, connection: _Connection, subscription: int) -> None:
+        connection.unsubscribe(subscription)
+
+
+class Client(object):
+    '''
+    IPC client
+
+    Calls can be issued concurrently, they are pipelined over the connection.
+    Up to ``max_notifications`` pushed notifications are buffered, when they
+    are not consumed fast enough the oldest are dropped (and counted in
+    ``dropped``), like in the subscriptions of ``NotificationBus``.
+    '''
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        max_notifications: int = 1024,
+    ) -> None:
+        self._reader = reader
+        self._writer = writer
+        self._next_id = 1
+        self._pending: Dict[int, asyncio.Future[Any]] = {}
+        self._batches: List[Tuple[List[int], asyncio.Future[List[Any]]]] = []
+        self._notifications: asyncio.Queue[Tuple[int, Dict[str, Any]]] = asyncio.Queue(max_notifications)
+        self.dropped = 0
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    @classmethod
+    async def connect(cls, path: Optional[str] = None) -> Client:
+        reader, writer = await asyncio.open_unix_connection(path or default_path())
+        return cls(reader, writer)
+
+    async def close(self) -> None:
+        self._dispatcher.cancel()
+        self._writer.close()
+
+    async def __aenter__(self) -> Client:
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+    def _request(self, method: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        request_id = self._next_id
+        self._next_id += 1
+        return request_id, {'id': request_id, 'method': method, 'params': params}
+
+    async def call(self, method: str, **params: Any) -> Any:
+        if self._dispatcher.done():
+            raise ConnectionError('Connection closed')
+        request_id, request = self._request(method, params)
+        future = self._pending[request_id] = asyncio.get_running_loop().create_future()
+        self._writer.write(_encode_message(request))
+        try:
+            response = await future
+        finally:
+            self._pending.pop(request_id, None)  # when cancelled, the response is ignored
+        return self._result(response)
+
+    async def batch(self, calls: Sequence[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+        '''Issue several calls in a single message, returns their results in order'''
+        if self._dispatcher.done():
+            raise ConnectionError('Connection closed')
+        requests = [self._request(method, params) for method, params in calls]
+        future: asyncio.Future[List[Any]] = asyncio.get_running_loop().create_future()
+        batch = ([request_id for request_id, _ in requests], future)
+        self._batches.append(batch)
+        self._writer.write(_encode_message([request for _, request in requests]))
+        try:
+            responses = await future
+        finally:
+            if batch in self._batches:  # cancelled
+                self._batches.remove(batch)
+        return [self._result(response) for response in responses]
+
+    @staticmethod
+    def _result(response: Dict[str, Any]) -> Any:
+        if 'error' in response:
+            raise IPCError(response['error']['type'], response['error']['message'])
+        return response['result']
+
+    async def notifications(self) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        '''Pushed notifications, as (subscription, notification) tuples'''
+        while True:
+            yield await self._notifications.get()
+
+    def _push(self, subscription: int, notification: Dict[str, Any]) -> None:
+        if self._notifications.full():  # drop the oldest
+            self._notifications.get_nowait()
+            self.dropped += 1
+        self._notifications.put_nowait((subscription, notification))
+
+    async def _dispatch(self) -> None:
+        try:
+            while True:
+                message = await _read_message(self._reader)
+                if isinstance(message, dict) and 'subscription' in message:
+                    self._push(message['subscription'], message['notification'])
+                else:
+                    self._resolve(message)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self._disconnected(e)
+
+    def _resolve(self, message: Any) -> None:
+        '''Complete the call, or the batch, a response is for'''
+        future: Optional[asyncio.Future[Any]] = None
+        if isinstance(message, list):
+            ids = [response.get('id') for response in message]
+            batch = next((batch for batch in self._batches if batch[0] == ids), None)
+            if batch is not None:
+                self._batches.remove(batch)
+                future = batch[1]
+        else:
+            future = self._pending.pop(message.get('id'), None)
+        if future is not None and not future.done():  # not cancelled by the caller
+            future.set_result(message)
+
+    def _disconnected(self, error: Exception) -> None:
+        '''Fail the calls waiting for a response'''
+        futures: List[asyncio.Future[Any]] = [*self._pending.values(), *(future for _, future in self._batches)]
+        self._pending.clear()
+        self._batches.clear()
+        for future in futures:
+            if not future.done():  # cancelled by the caller
+                future.set_exception(ConnectionError(f'Connection closed: {error}'))
@@ -0,0 +1,212 @@
+# SPDX-License-Identifier: MIT
+'''
+Frame based per-key RGB lighting
+
+Frames are buffers with the red, green and blue bytes of every zone (key),
+in zone ID order -- ``bytes``, ``bytearray``, ``array('B')`` or a
+C-contiguous ``uint8`` NumPy array of shape (zones, 3) all work. Each frame
+is diffed against the last one committed to the device, and only the zones
+that changed are sent, packed in as few HID++ reports as we can.
+'''
+
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import logitechd.protocol
+import logitechd.protocol.engine
+import logitechd.protocol.hidpp20
+
+from logitechd.protocol.features import PerKeyLighting
+from logitechd.protocol.scheduler import Priority
+
+
+ZONES = 0xff  # zone IDs 0x00-0xfe, 0xff pads the zone lists
+_PADDING = b'\xff'
+
+_INDIVIDUAL_ZONES = 4  # (zone, red, green, blue) per SetIndividualRgbZones
+_RANGES = 3  # (first zone, last zone, red, green, blue) per SetRangeRgbZones
+_SINGLE_VALUE_ZONES = 13  # zones per SetRgbZonesSingleValue
+_MIN_RANGE = 3  # shorter runs are cheaper to send as individual zones
+_MIN_SINGLE_VALUE = 4  # below this, individual zones fill a report just as well
+
+Request = Tuple[Type[logitechd.protocol.hidpp20.Function], bytes]
+
+
+def _pad(data: bytes, size: int) -> bytes:
+    return data + _PADDING * (size - len(data))
+
+
+class FramePacker(object):
+    '''
+    Frame diffing and report packing
+
+    Changed zones are grouped by color. Runs of at least ``_MIN_RANGE``
+    zones with the same color (unchanged zones that already have it included)
+    become ranges, 3 per report; colors shared by enough of the remaining
+    zones are sent with single value reports, 13 zones each; and what is left
+    goes in individual zone reports, 4 per report.
+    '''
+
+    def __init__(self, zones: int = ZONES) -> None:
+        if not 0 < zones <= ZONES:
+            raise ValueError(f'Expected between 1 and {ZONES} zones but got `{zones}`')
+        self.zones = zones
+        self._last: Optional[bytes] = None
+
+    def _frame(self, frame: Any) -> bytes:
+        data = memoryview(frame).cast('B').tobytes()
+        if len(data) != self.zones * 3:
+            raise ValueError(f'Expected a frame of {self.zones * 3} bytes but got {len(data)}')
+        return data
+
+    def reset(self) -> None:
+        '''Forget the last frame, so that the next one is sent in full'''
+        self._last = None
+
+    def commit(self, frame: Any) -> None:
+        '''Record ``frame`` as the frame shown by the device'''
+        self._last = self._frame(frame)
+
+    def pack(self, frame: Any) -> List[Request]:
+        '''Pack the changes from the last committed frame to ``frame`` into requests'''
+        data = self._frame(frame)
+        if data == self._last:
+            return []
+        ranges, loose = self._diff(data, self._last)
+
+        requests: List[Request] = []
+        individual: List[bytes] = []
+        for color, zones in loose.items():
+            for i in range(0, len(zones), _SINGLE_VALUE_ZONES):
+                chunk = zones[i:i + _SINGLE_VALUE_ZONES]
+                if len(chunk) >= _MIN_SINGLE_VALUE:
+                    function: Type[logitechd.protocol.hidpp20.Function] = PerKeyLighting.SetRgbZonesSingleValue
+                    requests.append((function, function.request_codec.pack(
+                        *color, _pad(bytes(chunk), _SINGLE_VALUE_ZONES),
+                    )))
+                else:
+                    individual.extend(bytes((zone,)) + color for zone in chunk)
+
+        function = PerKeyLighting.SetRangeRgbZones
+        for i in range(0, len(ranges), _RANGES):
+            requests.append((function, function.request_codec.pack(
+                _pad(b''.join(ranges[i:i + _RANGES]), _RANGES * 5),
+            )))
+        function = PerKeyLighting.SetIndividualRgbZones
+        for i in range(0, len(individual), _INDIVIDUAL_ZONES):
+            requests.append((function, function.request_codec.pack(
+                _pad(b''.join(individual[i:i + _INDIVIDUAL_ZONES]), _INDIVIDUAL_ZONES * 4),
+            )))
+        return requests
+
+    def _diff(self, data: bytes, last: Optional[bytes]) -> Tuple[List[bytes], Dict[bytes, List[int]]]:
+        '''Changed zones, as ranges and as zones grouped by color'''
+        ranges: List[bytes] = []
+        loose: Dict[bytes, List[int]] = {}
+        # walk runs of zones with the same color, and only the changed zones in them
+        zone = 0
+        while zone < self.zones:
+            color = data[zone * 3:zone * 3 + 3]
+            end = zone + 1
+            while end < self.zones and data[end * 3:end * 3 + 3] == color:
+                end += 1
+            changed = [
+                i for i in range(zone, end)
+                if last is None or last[i * 3:i * 3 + 3] != color
+            ]
+            if changed and changed[-1] - changed[0] + 1 >= _MIN_RANGE:
+                ranges.append(bytes((changed[0], changed[-1])) + color)
+            elif changed:
+                loose.setdefault(color, []).extend(changed)
+            zone = end
+        return ranges, loose
+
+
+class FramePipeline(object):
+    '''
+    Paced per-key lighting frames
+
+    ``submit`` queues a frame and returns immediately, ``run`` sends the
+    frames to the device at up to ``fps`` frames per second. Only the latest
+    frame is kept: frames submitted while the device is still busy with the
+    previous one replace each other, and are counted in ``dropped``.
+
+    The reports of a frame are pipelined by the request engine and the frame
+    is committed with a single ``FrameEnd`` once they have all been acked.
+    They are sent with background priority, so that on a shared receiver the
+    requests from the other devices go first.
+    '''
+
+    def __init__(self, device: logitechd.protocol.Device, zones: int = ZONES, *, fps: float = 60.0) -> None:
+        if fps <= 0:
+            raise ValueError(f'Expected a positive frame rate but got `{fps}`')
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._device = device
+        self._packer = FramePacker(zones)
+        self._interval = 1 / fps
+        self._index: Optional[int] = None
+        self._pending: Optional[bytes] = None
+        self._waiter: Optional[asyncio.Future[None]] = None
+        self.frames = 0
+        self.dropped = 0
+        self.reports = 0
+
+    async def _feature_index(self) -> int:
+        if self._index is None:
+            index = await self._device.feature_index(PerKeyLighting)
+            if not index:
+                raise ValueError(f'{self._device.io.name} does not support per-key lighting')
+            self._index = index
+        return self._index
+
+    def submit(self, frame: Any) -> None:
+        '''Queue a frame, replacing the queued one if it was not sent yet'''
+        data = self._packer._frame(frame)  # copy, the caller may reuse its buffer
+        if self._pending is not None:
+            self.dropped += 1
+        self._pending = data
+        if self._waiter and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def render(self, frame: Any) -> int:
+        '''Send a frame right away and commit it, returns the number of reports sent'''
+        index = await self._feature_index()
+        requests = self._packer.pack(frame)
+        if not requests:
+            return 0
+        try:
+            await asyncio.gather(*(
+                self._device.request(index, function.id, data, priority=Priority.BACKGROUND)
+                for function, data in requests
+            ))
+            await self._device.call(index, PerKeyLighting.FrameEnd, priority=Priority.BACKGROUND)
+        except BaseException:
+            self._packer.reset()  # we do not know which zones were updated
+            raise
+        self._packer.commit(frame)
+        self.frames += 1
+        self.reports += len(requests) + 1
+        return len(requests) + 1
+
+    async def run(self) -> None:
+        '''Send the submitted frames, until cancelled'''
+        loop = asyncio.get_running_loop()
+        while True:
+            while self._pending is None:
+                self._waiter = loop.create_future()
+                try:
+                    await self._waiter
+                finally:
+                    self._waiter = None
+            frame, self._pending = self._pending, None
+
+            start = loop.time()
+            try:
+                await self.render(frame)
+            except (asyncio.TimeoutError, logitechd.protocol.engine.HIDPPError) as e:
+                self._logger.warning(f'{self._device.io.name}: failed to send lighting frame: {e}')
+            await asyncio.sleep(max(0.0, start + self._interval - loop.time()))
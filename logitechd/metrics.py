@@ -0,0 +1,182 @@
+# SPDX-License-Identifier: MIT
+'''
+Hot path counters and histograms
+
+Metrics are created upfront, when a device is set up, and recording into
+them only bumps preallocated slots, so they can be left on in production.
+They are exported in the Prometheus text format, see ``Registry.expose``.
+'''
+
+from __future__ import annotations
+
+import bisect
+import threading
+
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter(object):
+    '''Monotonic counter, bump ``value`` directly on hot paths'''
+    __slots__ = ('value',)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+
+class Histogram(object):
+    '''
+    Histogram with fixed bucket upper bounds
+
+    Observations only increment a preallocated bucket count.
+    '''
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.bounds = tuple(sorted(bounds))
+        self.counts = [0] * (len(self.bounds) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+Metric = Union[Counter, Histogram]
+
+
+class DeviceMetrics(object):
+    '''Metrics of a device's IO, see ``Registry.device``'''
+    __slots__ = (
+        'reports_read', 'bytes_read', 'reports_written', 'bytes_written',
+        'requests', 'request_latency', 'timeouts', 'retries', 'errors', 'lock_wait',
+    )
+
+    def __init__(self, registry: Registry, device: str) -> None:
+        self.reports_read = registry.counter('logitechd_reports_read_total', 'Reports read', device=device)
+        self.bytes_read = registry.counter('logitechd_read_bytes_total', 'Bytes read', device=device)
+        self.reports_written = registry.counter('logitechd_reports_written_total', 'Reports written', device=device)
+        self.bytes_written = registry.counter('logitechd_written_bytes_total', 'Bytes written', device=device)
+        self.requests = registry.counter('logitechd_requests_total', 'HID++ requests', device=device)
+        self.request_latency = registry.histogram(
+            'logitechd_request_latency_seconds', 'HID++ request round-trip time, including retries', device=device,
+        )
+        self.timeouts = registry.counter('logitechd_request_timeouts_total', 'HID++ requests that timed out', device=device)
+        self.retries = registry.counter('logitechd_request_retries_total', 'HID++ request retries', device=device)
+        self.errors = registry.counter('logitechd_request_errors_total', 'HID++ error replies', device=device)
+        self.lock_wait = registry.histogram(
+            'logitechd_lock_wait_seconds', 'Time waiting for a contended IO device lock', device=device,
+        )
+
+
+class Registry(object):
+    '''Metrics, by name and labels'''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._families: Dict[str, Tuple[str, str, Dict[_Labels, Metric]]] = {}  # name -> (type, help, metrics)
+        self._devices: Dict[str, DeviceMetrics] = {}
+        self.labels: Dict[str, str] = {}  # added to every sample, eg. to tell worker processes apart
+
+    def _get(self, kind: str, name: str, help: str, labels: Dict[str, str], factory: type) -> Metric:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help, {}))
+            if family[0] != kind:
+                raise ValueError(f'Metric `{name}` is a {family[0]}, not a {kind}')
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        '''Get or create a counter'''
+        metric = self._get('counter', name, help, labels, Counter)
+        assert isinstance(metric, Counter)
+        return metric
+
+    def histogram(self, name: str, help: str, **labels: str) -> Histogram:
+        '''Get or create a histogram, with the latency buckets'''
+        metric = self._get('histogram', name, help, labels, Histogram)
+        assert isinstance(metric, Histogram)
+        return metric
+
+    def device(self, device: str) -> DeviceMetrics:
+        '''Get or create the metrics of a device, labeled by its path or name'''
+        metrics = self._devices.get(device)
+        if metrics is None:
+            metrics = self._devices[device] = DeviceMetrics(self, device)
+        return metrics
+
+    def remove_device(self, device: str) -> None:
+        '''Drop the metrics of a device that is gone, so its samples are no longer exposed'''
+        label = ('device', device)
+        with self._lock:
+            self._devices.pop(device, None)
+            for _, _, metrics in self._families.values():
+                for labels in [labels for labels in metrics if label in labels]:
+                    del metrics[labels]
+
+    @staticmethod
+    def _labels(labels: _Labels, *extra: Tuple[str, str]) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ''
+        escaped = (
+            (key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for key, value in pairs
+        )
+        return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+    def expose(self) -> str:
+        '''Prometheus text exposition format'''
+        lines: List[str] = []
+        common = tuple(sorted(self.labels.items()))
+        with self._lock:
+            families = [(name, kind, help, dict(metrics)) for name, (kind, help, metrics) in self._families.items()]
+        for name, kind, help, metrics in sorted(families):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, metric in metrics.items():
+                labels = common + labels
+                if isinstance(metric, Counter):
+                    lines.append(f'{name}{self._labels(labels)} {metric.value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip((*metric.bounds, '+Inf'), metric.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{self._labels(labels, ("le", str(bound)))} {cumulative}')
+                lines.append(f'{name}_sum{self._labels(labels)} {metric.sum}')
+                lines.append(f'{name}_count{self._labels(labels)} {metric.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def merge(texts: Iterable[str]) -> str:
+    '''
+    Merge the expositions of several registries (eg. of the worker processes) into one
+
+    The samples of a family are grouped under a single HELP and TYPE header,
+    they should be told apart by their labels, see ``Registry.labels``.
+    '''
+    families: Dict[str, List[str]] = {}  # name -> HELP, TYPE and sample lines
+    for text in texts:
+        lines: List[str] = []
+        for line in text.splitlines():
+            if line.startswith('# '):
+                lines = families.setdefault(line.split(' ', 3)[2], [])
+                if line in lines:
+                    continue
+            lines.append(line)
+    return '\n'.join(line for name in sorted(families) for line in families[name]) + '\n'
+
+
+REGISTRY = Registry()
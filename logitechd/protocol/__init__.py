@@ -3,18 +3,84 @@
 from __future__ import annotations
 
 import abc
+import asyncio
+import logging
 import typing
 
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type, Union
+
+import logitechd.protocol.cache
+import logitechd.protocol.engine
+import logitechd.protocol.hidpp20
+import logitechd.protocol.notifications
+import logitechd.protocol.scheduler
+import logitechd.protocol.state
+
+from logitechd.protocol.features import DeviceInformation, IFeatureSet, IRoot
+from logitechd.protocol.hidpp20 import FEATURES, FUNCTION_IDS, Event
+from logitechd.protocol.scheduler import Priority
+
 
 if typing.TYPE_CHECKING:
     import logitechd.backend
+    import logitechd.protocol.report
+
+
+DEVICE_CONNECTION = 0x41  # HID++ 1.0 notification sent by receivers when a paired device (dis)connects
+
+_Events = Tuple[Optional[Type[Event]], ...]
+_NO_EVENTS: _Events = (None,) * FUNCTION_IDS
+
+
+def _dispatch(feature_id: int) -> Tuple[int, _Events]:
+    '''Dispatch table entry of a feature: its ID and its events from the catalog, by event ID'''
+    feature = FEATURES.get(feature_id)
+    return feature_id, feature.events if feature else _NO_EVENTS
 
 
 class Device(metaclass=abc.ABCMeta):
-    '''Base device class'''
+    '''
+    Base device class
 
-    def __init__(self, io: logitechd.backend.IODevice) -> None:
+    ``device_index`` is the HID++ device index: 0xff for receivers and wired
+    devices, the pairing slot for devices behind a receiver.
+
+    Reports that are not replies to our requests are published as
+    notifications in ``notifications``, if given.
+
+    Devices sharing a receiver should share its ``scheduler``, which limits
+    and orders the requests they have in flight.
+
+    Constructing a device does not touch the hardware. The protocol version
+    and the feature indexes are resolved on first use, feature by feature,
+    and memoized, unless ``discover`` is called to find them all upfront.
+
+    Attributes like the battery level are cached in ``state``.
+    '''
+
+    def __init__(
+        self,
+        io: logitechd.backend.IODevice,
+        device_index: int = 0xff,
+        notifications: Optional[logitechd.protocol.notifications.NotificationBus] = None,
+        scheduler: Optional[logitechd.protocol.scheduler.ReceiverScheduler] = None,
+    ) -> None:
         self._io = io
+        self._device_index = device_index
+        self._notifications = notifications
+        self._scheduler = scheduler
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._engine = logitechd.protocol.engine.RequestEngine(io)
+        self._writes = logitechd.protocol.scheduler.WriteCoalescer(self)
+        self._state = logitechd.protocol.state.DeviceState(self)
+        self._protocol_version: Optional[Tuple[int, int]] = None
+        self._identity: Optional[logitechd.protocol.cache.DeviceIdentity] = None
+        self._features: logitechd.protocol.cache.FeatureTable = {}
+        # feature index -> (feature ID, events), so that decoding a notification is a list lookup
+        self._dispatch: List[Optional[Tuple[int, _Events]]] = [None] * 0x100
+        self._resolving: Dict[Any, asyncio.Future[Any]] = {}
+        self._connected: Optional[bool] = None
+        self._connection_callbacks: List[Callable[[Device, bool], None]] = []
         self._init_protocol()
 
     def _init_protocol(self) -> None:
@@ -25,19 +91,282 @@ class Device(metaclass=abc.ABCMeta):
         '''
         pass
 
+    def handle_report(self, report: logitechd.protocol.report.Report) -> None:
+        '''
+        Handle a report received from the device.
+
+        Called by the backend from the event loop for every incoming HID++
+        report. ``report`` is only valid during the call, as its buffer gets
+        reused by the next read. May be overridden by subclasses.
+        '''
+        if self._engine.feed(report):
+            return
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug(f'{self._io.name}: received report {report.raw.hex()}')
+        connection = report.feature_index == DEVICE_CONNECTION and self._device_index != 0xff
+        if connection and len(report.raw) > 4:
+            self._connection(not report.raw[4] & 0x40)  # bit 6 is set when the link is not established
+        elif report.sw_id == 0:
+            self._state.feed(report)
+        if self._notifications is not None and (report.sw_id == 0 or connection or self._protocol_version == (1, 0)):
+            self._notifications.publish(self._notification(report))
+
+    def _connection(self, connected: bool) -> None:
+        self._connected = connected
+        self._state.invalidate()
+        if connected:
+            self._writes.invalidate()  # it may have lost its settings while asleep
+        for callback in self._connection_callbacks:
+            callback(self, connected)
+
+    def on_connection(self, callback: Callable[[Device, bool], None]) -> None:
+        '''
+        Call ``callback(device, connected)`` when the receiver reports the
+        device connecting or disconnecting, eg. waking up from sleep
+        '''
+        self._connection_callbacks.append(callback)
+
+    def _notification(self, report: logitechd.protocol.report.Report) -> logitechd.protocol.notifications.Notification:
+        '''Decode a notification report, once for all subscribers'''
+        entry = self._dispatch[report.feature_index]
+        feature_id, data = None, None
+        if entry is not None:
+            feature_id, events = entry
+            event = events[report.function]
+            if event and len(report.payload) >= event.data_codec.size:
+                data = event.data_codec.unpack_from(report.raw)
+        return logitechd.protocol.notifications.Notification(
+            self, report.feature_index, feature_id, report.function, bytes(report.payload), data,
+        )
+
+    def _set_features(self, features: logitechd.protocol.cache.FeatureTable) -> None:
+        self._features = features
+        self._dispatch = [None] * 0x100
+        for feature, index in features.items():
+            if index or feature == IRoot.id:
+                self._dispatch[index] = _dispatch(feature)
+
+    async def request(
+        self,
+        feature_index: int,
+        function: int,
+        data: bytes = b'',
+        *,
+        priority: int = Priority.INTERACTIVE,
+    ) -> bytes:
+        '''
+        Send a HID++ request to the device and return the reply parameters
+
+        ``priority`` orders the request against the ones from the other
+        devices on the same receiver, see ``ReceiverScheduler``.
+        '''
+        if self._scheduler is None:
+            return await self._engine.request(self._device_index, feature_index, function, data)
+        async with self._scheduler.slot(self, priority):
+            return await self._engine.request(self._device_index, feature_index, function, data)
+
+    async def write(self, feature_index: int, function: int, data: bytes = b'', *, target: int = 0) -> None:
+        '''
+        Set a value on the device, through the write coalescer
+
+        Only the latest of several writes to the same setting in a short
+        window is sent, and values the device already has are not sent at all.
+        See ``WriteCoalescer.write`` for ``target``.
+        '''
+        await self._writes.write(feature_index, function, data, target=target)
+
+    async def call(
+        self,
+        feature_index: int,
+        function: Type[logitechd.protocol.hidpp20.Function],
+        *values: Any,
+        priority: int = Priority.INTERACTIVE,
+    ) -> Any:
+        '''Call a HID++ 2.0 function, encoding the request and decoding the response with its codecs'''
+        data = function.request_codec.pack(*values) if hasattr(function, 'request_codec') else b''
+        reply = await self.request(feature_index, function.id, data, priority=priority)
+        if not hasattr(function, 'response_codec'):
+            return None
+        codec = function.response_codec
+        if len(reply) < codec.size:  # replied with a shorter report
+            reply += bytes(codec.size - len(reply))
+        return codec.unpack_from(reply, 0)
+
+    async def discover(self, cache: Optional[logitechd.protocol.cache.FeatureCache] = None) -> None:
+        '''
+        Protocol discovery
+
+        Finds the protocol version and, for HID++ 2.0 devices, the feature table.
+        If a cache is given, the feature table of known devices is taken from it
+        after checking the feature count, instead of querying every feature.
+        The identity and the feature count are queried concurrently, the
+        engine pipelines them.
+        '''
+        self._writes.invalidate()  # the device may have been reset
+        self._state.invalidate()
+        if await self.resolve_protocol() == (1, 0):
+            return
+
+        identity, count = await asyncio.gather(self._query_identity(), self._query_feature_count())
+        self._identity = identity
+        if cache is not None:
+            index = self._features[IFeatureSet.id]
+
+            async def validate(features: logitechd.protocol.cache.FeatureTable) -> bool:
+                # the count does not include IRoot
+                return bool(index) and features.get(IFeatureSet.id) == index and count + 1 == len(features)
+
+            features = await cache.lookup(identity, validate)
+            if features is not None:
+                self._set_features(features)
+                return
+
+        await self._enumerate_features(count)
+        if cache is not None:
+            cache.put(identity, self._features)
+
+    async def _once(self, key: Any, func: Callable[[], Awaitable[Any]]) -> Any:
+        '''Run ``func`` once for all concurrent callers, failures are not memoized'''
+        future = self._resolving.get(key)
+        if future is None:
+            future = self._resolving[key] = asyncio.ensure_future(func())
+            future.add_done_callback(lambda _: self._resolving.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def resolve_protocol(self) -> Tuple[int, int]:
+        '''Protocol version, pinging the device on first use'''
+        if self._protocol_version is not None:
+            return self._protocol_version
+        version: Tuple[int, int] = await self._once('protocol', self._ping)
+        return version
+
+    async def _ping(self) -> Tuple[int, int]:
+        try:
+            ping = await self.call(0, IRoot.Ping, 0x5a)
+        except logitechd.protocol.engine.HIDPPError as e:
+            if not e.hidpp10:
+                raise
+            self._protocol_version = (1, 0)  # HID++ 1.0 devices reject the ping
+            return self._protocol_version
+        self._protocol_version = (ping.major, ping.minor)
+        self._features.setdefault(IRoot.id, 0)
+        if self._dispatch[0] is None:
+            self._dispatch[0] = _dispatch(IRoot.id)
+        return self._protocol_version
+
+    async def feature_index(self, feature: Union[int, Type[logitechd.protocol.hidpp20.Feature]]) -> int:
+        '''Index of a feature, asking IRoot on first use, 0 means it is not supported'''
+        feature_id = feature if isinstance(feature, int) else feature.id
+        if feature_id not in self._features:
+            if await self.resolve_protocol() == (1, 0):
+                return 0
+            await self._once(feature_id, lambda: self._query_feature(feature_id))
+        return self._features[feature_id]
+
+    async def _query_feature(self, feature_id: int) -> None:
+        reply = await self.call(0, IRoot.GetFeature, feature_id)
+        self._features[feature_id] = reply.index
+        if reply.index:
+            self._dispatch[reply.index] = _dispatch(feature_id)
+
+    async def _query_identity(self) -> logitechd.protocol.cache.DeviceIdentity:
+        _, vid, pid = self._io.info
+        index = await self.feature_index(DeviceInformation)
+        if not index:
+            return logitechd.protocol.cache.DeviceIdentity(vid, pid, '', '')
+
+        info, fw = await asyncio.gather(
+            self.call(index, DeviceInformation.GetDeviceInfo),
+            self.call(index, DeviceInformation.GetFwInfo, 0),
+        )
+        firmware = f'{fw.prefix.decode(errors="replace")}{fw.number:02x}.{fw.revision:02x}.{fw.build:04x}'
+        return logitechd.protocol.cache.DeviceIdentity(vid, pid, info.unit_id.hex(), firmware)
+
+    async def _query_feature_count(self) -> int:
+        '''Number of features, not counting IRoot, 0 if IFeatureSet is not supported'''
+        index = await self.feature_index(IFeatureSet)
+        if not index:
+            return 0
+        reply = await self.call(index, IFeatureSet.GetCount)
+        count: int = reply.count
+        return count
+
+    async def _enumerate_features(self, count: int) -> None:
+        index = self._features[IFeatureSet.id]
+        if not index:
+            return
+        # the engine pipelines these
+        features = await asyncio.gather(*(
+            self.call(index, IFeatureSet.GetFeatureID, i)
+            for i in range(1, count + 1)
+        ))
+        table = {IRoot.id: 0}
+        table.update({feature.feature: i for i, feature in enumerate(features, start=1)})
+        self._set_features(table)
+
+    @property
+    def protocol_version(self) -> Optional[Tuple[int, int]]:
+        '''HID++ protocol version, ``None`` until discovered'''
+        return self._protocol_version
+
+    @property
+    def connected(self) -> Optional[bool]:
+        '''Whether the device is reachable, as last reported by its receiver, ``None`` if unknown'''
+        return self._connected
+
+    @property
+    def identity(self) -> Optional[logitechd.protocol.cache.DeviceIdentity]:
+        '''Device identity, ``None`` until discovered'''
+        return self._identity
+
+    @property
+    def features(self) -> logitechd.protocol.cache.FeatureTable:
+        '''Discovered HID++ 2.0 features, mapping feature IDs to their index'''
+        return self._features
+
     @property
     def io(self) -> logitechd.backend.IODevice:
         '''IO interface'''
         return self._io
 
+    @property
+    def device_index(self) -> int:
+        '''HID++ device index'''
+        return self._device_index
+
+    @property
+    def engine(self) -> logitechd.protocol.engine.RequestEngine:
+        '''HID++ request/response engine'''
+        return self._engine
+
+    @property
+    def writes(self) -> logitechd.protocol.scheduler.WriteCoalescer:
+        '''Write coalescer'''
+        return self._writes
+
+    @property
+    def state(self) -> logitechd.protocol.state.DeviceState:
+        '''Cached device state'''
+        return self._state
+
+    @property
+    def scheduler(self) -> Optional[logitechd.protocol.scheduler.ReceiverScheduler]:
+        '''Request scheduler of the receiver, if the device shares one'''
+        return self._scheduler
+
 
-def construct_device(io: logitechd.backend.IODevice) -> Device:
+def construct_device(
+    io: logitechd.backend.IODevice,
+    device_index: int = 0xff,
+    notifications: Optional[logitechd.protocol.notifications.NotificationBus] = None,
+    scheduler: Optional[logitechd.protocol.scheduler.ReceiverScheduler] = None,
+) -> Device:
     '''
-    Instanceates a device given the IO interface.
+    Instantiates a device given the IO interface.
 
-    Does the protocol discovery and chooses which class to instanceate. This
-    function is meant to be used by backends to construct devices -- they pass
-    the hardware IO backend, we do the protocol discovery and figure out which
-    protocol class should be instanciated.
+    This function is meant to be used by backends to construct devices --
+    they pass the hardware IO backend, and we figure out which protocol class
+    should be instantiated. Nothing is sent to the device here, the protocol
+    version and the features are resolved on first use, see ``Device``.
     '''
-    return Device(io)
+    return Device(io, device_index, notifications, scheduler)
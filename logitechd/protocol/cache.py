@@ -0,0 +1,150 @@
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+
+
+FeatureTable = Dict[int, int]  # feature ID -> feature index
+
+
+class DeviceIdentity(NamedTuple):
+    '''Identifies a device model and unit, and the firmware it is running'''
+    vid: int
+    pid: int
+    unit_id: str
+    firmware: str
+
+    @property
+    def key(self) -> str:
+        return f'{self.vid:04x}:{self.pid:04x}:{self.unit_id}'
+
+
+def default_path() -> str:
+    '''``$XDG_CACHE_HOME/logitechd/features.json``'''
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'logitechd', 'features.json')
+
+
+class FeatureCache(object):
+    '''
+    Persistent HID++ 2.0 feature table cache
+
+    Entries are keyed by device model and unit ID, and store the firmware
+    version the table was discovered with. An entry for a different firmware
+    is stale and gets evicted, as firmware updates can change the table. The
+    least recently seen entries are evicted when there are more than
+    ``max_entries``.
+
+    Changes are kept in memory until ``flush``, so that discovering many
+    devices rewrites the file once rather than once per device.
+    '''
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 256) -> None:
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.path = path or default_path()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+            if not isinstance(entries, dict):
+                raise ValueError(f'Expected a dictionary but got `{entries}`')
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self._logger.warning(f'Ignoring invalid feature cache `{self.path}`: {e}')
+            return {}
+        for key in [key for key, entry in entries.items() if not self._valid(entry)]:
+            self._logger.warning(f'Ignoring invalid feature cache entry `{key}`')
+            del entries[key]
+        return entries
+
+    @staticmethod
+    def _valid(entry: Any) -> bool:
+        '''Whether ``entry`` (from the cache file) has the layout written by ``put``'''
+        if not isinstance(entry, dict) or not isinstance(entry.get('firmware'), str):
+            return False
+        features, seen = entry.get('features'), entry.get('seen', 0)
+        if not isinstance(features, dict) or not isinstance(seen, (int, float)):
+            return False
+        try:
+            return all(int(feature, 16) >= 0 and type(index) is int for feature, index in features.items())
+        except ValueError:
+            return False
+
+    def flush(self) -> None:
+        '''Write the changes to the file, if any'''
+        if self.dirty:
+            self._save()
+            self.dirty = False
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(f'{self.path}.tmp', 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(f'{self.path}.tmp', self.path)
+        except OSError as e:
+            self._logger.warning(f'Could not write feature cache `{self.path}`: {e}')
+
+    def get(self, identity: DeviceIdentity) -> Optional[FeatureTable]:
+        '''Cached feature table, evicting it if it belongs to another firmware version'''
+        entry = self._entries.get(identity.key)
+        if entry is None:
+            return None
+        if entry['firmware'] != identity.firmware:
+            self.evict(identity)
+            return None
+        return {int(feature, 16): index for feature, index in entry['features'].items()}
+
+    async def lookup(
+        self,
+        identity: DeviceIdentity,
+        validate: Callable[[FeatureTable], Awaitable[bool]],
+    ) -> Optional[FeatureTable]:
+        '''
+        Cached feature table, if it passes ``validate``
+
+        ``validate`` should do a cheap check against the device (eg. compare
+        the feature count). Entries that fail it are evicted.
+        '''
+        features = self.get(identity)
+        if features is not None and await validate(features):
+            self.hits += 1
+            entry = self._entries.get(identity.key)
+            if entry is not None:  # unless evicted while validating
+                entry['seen'] = time.time()
+                self.dirty = True
+            return features
+        if features is not None:
+            self.evict(identity)
+        self.misses += 1
+        return None
+
+    def put(self, identity: DeviceIdentity, features: FeatureTable) -> None:
+        self._entries[identity.key] = {
+            'firmware': identity.firmware,
+            'features': {f'{feature:04x}': index for feature, index in features.items()},
+            'seen': time.time(),
+        }
+        while len(self._entries) > self.max_entries:
+            del self._entries[min(self._entries, key=lambda key: self._entries[key].get('seen', 0))]
+        self.dirty = True
+
+    def evict(self, identity: DeviceIdentity) -> None:
+        if self._entries.pop(identity.key, None) is not None:
+            self.dirty = True
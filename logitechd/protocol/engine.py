@@ -0,0 +1,185 @@
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import typing
+
+from typing import Dict, Mapping, Optional, Tuple
+
+
+if typing.TYPE_CHECKING:
+    import logitechd.backend
+    import logitechd.protocol.report
+
+
+SHORT_REPORT_ID = 0x10
+LONG_REPORT_ID = 0x11
+VERY_LONG_REPORT_ID = 0x12
+
+REPORT_LENGTHS = {
+    SHORT_REPORT_ID: 7,
+    LONG_REPORT_ID: 20,
+    VERY_LONG_REPORT_ID: 64,
+}
+
+HIDPP10_ERROR = 0x8f
+HIDPP20_ERROR = 0xff
+
+_SW_IDS = 15  # software IDs 0x1-0xf, 0x0 is reserved for notifications
+
+_Key = Tuple[int, int, int, int]  # device index, feature index, function, software ID
+
+
+class HIDPPError(Exception):
+    '''The device replied to a request with an error report'''
+
+    def __init__(self, code: int, hidpp10: bool = False) -> None:
+        self.code = code
+        self.hidpp10 = hidpp10
+        super().__init__(f'HID++ {"1.0" if hidpp10 else "2.0"} error {code:#04x}')
+
+
+def pack_report(
+    device_index: int,
+    feature_index: int,
+    function: int,
+    sw_id: int,
+    data: bytes,
+    lengths: Mapping[int, int] = REPORT_LENGTHS,
+) -> bytearray:
+    '''Pack a request in the smallest HID++ report (out of ``lengths``) that fits ``data``'''
+    for report_id, length in sorted(lengths.items(), key=lambda item: item[1]):
+        if len(data) <= length - 4:
+            break
+    else:
+        raise ValueError(f'Request data too long ({len(data)} bytes)')
+
+    report = bytearray(length)
+    report[0] = report_id
+    report[1] = device_index
+    report[2] = feature_index
+    report[3] = (function << 4) | sw_id
+    report[4:4 + len(data)] = data
+    return report
+
+
+class RequestEngine(object):
+    '''
+    HID++ request/response engine
+
+    Every request is tagged with a rotating software ID (the low nibble of the
+    function byte), and its future is kept in a table keyed by
+    (device index, feature index, function, software ID) until the matching
+    reply is fed back by the report reader. This allows several requests to be
+    in flight per device and to be completed out of order.
+
+    The IODevice lock is only held while writing a request, never while
+    waiting for its reply. Requests that get no reply within ``timeout``
+    seconds are retried up to ``retries`` times with a fresh software ID.
+
+    Requests, round-trip latency, retries, timeouts and error replies are
+    recorded in the IODevice ``metrics``.
+    '''
+
+    def __init__(
+        self,
+        io: logitechd.backend.IODevice,
+        *,
+        timeout: float = 1.0,
+        retries: int = 2,
+    ) -> None:
+        self._io = io
+        self.timeout = timeout
+        self.retries = retries
+        self._pending: Dict[_Key, asyncio.Future[bytes]] = {}
+        self._sw_ids = itertools.cycle(range(1, _SW_IDS + 1))
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._metrics = io.metrics
+
+    @property
+    def in_flight(self) -> int:
+        '''Number of requests waiting for a reply'''
+        return len(self._pending)
+
+    def _sw_id(self, device_index: int, feature_index: int, function: int) -> int:
+        for sw_id in self._sw_ids:
+            if (device_index, feature_index, function, sw_id) not in self._pending:
+                return sw_id
+        raise AssertionError('unreachable')  # pragma: no cover
+
+    async def request(
+        self,
+        device_index: int,
+        feature_index: int,
+        function: int,
+        data: bytes = b'',
+        *,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+    ) -> bytes:
+        '''
+        Send a request and wait for its reply
+
+        Returns the reply parameters (the report after the function byte).
+        Raises ``HIDPPError`` if the device replies with an error and
+        ``asyncio.TimeoutError`` if it does not reply at all.
+        '''
+        if timeout is None:
+            timeout = self.timeout
+        if retries is None:
+            retries = self.retries
+        if self._slots is None:
+            # at most one request per software ID, so there is always a free one
+            self._slots = asyncio.Semaphore(_SW_IDS)
+
+        loop = asyncio.get_running_loop()
+        metrics = self._metrics
+        metrics.requests.value += 1
+        start = loop.time()
+        async with self._slots:
+            for attempt in range(retries + 1):
+                sw_id = self._sw_id(device_index, feature_index, function)
+                key = (device_index, feature_index, function, sw_id)
+                report = pack_report(device_index, feature_index, function, sw_id, data, self._io.report_lengths)
+
+                future: asyncio.Future[bytes] = loop.create_future()
+                self._pending[key] = future
+                try:
+                    with self._io as interface:
+                        interface.write(report)
+                    reply = await asyncio.wait_for(future, timeout)
+                    metrics.request_latency.observe(loop.time() - start)
+                    return reply
+                except asyncio.TimeoutError:
+                    if attempt == retries:
+                        metrics.timeouts.value += 1
+                        raise
+                    metrics.retries.value += 1
+                finally:
+                    del self._pending[key]
+        raise AssertionError('unreachable')  # pragma: no cover
+
+    def feed(self, report: logitechd.protocol.report.Report) -> bool:
+        '''
+        Match an incoming report against the outstanding requests
+
+        Returns whether the report was a reply to one of them.
+        '''
+        if report.feature_index in (HIDPP10_ERROR, HIDPP20_ERROR):
+            raw = report.raw
+            if len(raw) < 6:
+                return False
+            future = self._pending.get((report.device_index, raw[3], raw[4] >> 4, raw[4] & 0x0f))
+            if future is None or future.done():
+                return False
+            self._metrics.errors.value += 1
+            future.set_exception(HIDPPError(raw[5], report.feature_index == HIDPP10_ERROR))
+            return True
+
+        future = self._pending.get((report.device_index, report.feature_index, report.function, report.sw_id))
+        if future is None or future.done():
+            return False
+        future.set_result(bytes(report.payload))
+        return True
@@ -0,0 +1,306 @@
+# SPDX-License-Identifier: MIT
+
+from logitechd.protocol.hidpp20 import Event, Feature, Function
+
+
+class IRoot(Feature):
+    '''Root feature, always at index 0'''
+    id = 0x0000
+
+    class GetFeature(Function):
+        id = 0
+        request = {'feature': 'H'}
+        response = {'index': 'B', 'type': 'B', 'version': 'B'}
+
+    class Ping(Function):
+        id = 1
+        request = {'reserved': '2x', 'data': 'B'}
+        response = {'major': 'B', 'minor': 'B', 'data': 'B'}
+
+
+class IFeatureSet(Feature):
+    '''Feature table enumeration'''
+    id = 0x0001
+
+    class GetCount(Function):
+        id = 0
+        response = {'count': 'B'}
+
+    class GetFeatureID(Function):
+        id = 1
+        request = {'index': 'B'}
+        response = {'feature': 'H', 'type': 'B', 'version': 'B'}
+
+
+class DeviceInformation(Feature):
+    '''Device identity and firmware versions'''
+    id = 0x0003
+
+    class GetDeviceInfo(Function):
+        id = 0
+        response = {
+            'entity_count': 'B',
+            'unit_id': '4s',
+            'transport': 'H',
+            'model_id': '6s',
+            'extended_model_id': 'B',
+            'capabilities': 'B',
+        }
+
+    class GetFwInfo(Function):
+        id = 1
+        request = {'entity': 'B'}
+        response = {
+            'type': 'B',
+            'prefix': '3s',
+            'number': 'B',
+            'revision': 'B',
+            'build': 'H',
+            'active': 'B',
+            'pid': 'H',
+            'extra': '5s',
+        }
+
+
+class DeviceName(Feature):
+    '''Marketing name and type of the device'''
+    id = 0x0005
+
+    class GetDeviceNameCount(Function):
+        id = 0
+        response = {'count': 'B'}  # name length
+
+    class GetDeviceName(Function):
+        id = 1
+        request = {'offset': 'B'}
+        response = {'name': '16s'}  # chunk of the name from offset, 0 padded
+
+    class GetDeviceType(Function):
+        id = 2
+        response = {'type': 'B'}
+
+
+class BatteryStatus(Feature):
+    '''Battery level, in percent, and charging status'''
+    id = 0x1000
+
+    class GetBatteryLevelStatus(Function):
+        id = 0
+        response = {'level': 'B', 'next_level': 'B', 'status': 'B'}
+
+    class GetBatteryCapability(Function):
+        id = 1
+        response = {'levels': 'B', 'flags': 'B', 'nominal_life': 'H', 'critical_level': 'B'}
+
+    class BatteryStatusEvent(Event):
+        id = 0
+        data = {'level': 'B', 'next_level': 'B', 'status': 'B'}
+
+
+class UnifiedBattery(Feature):
+    '''Battery state of charge and status, replaces ``BatteryStatus`` on newer devices'''
+    id = 0x1004
+
+    class GetCapabilities(Function):
+        id = 0
+        response = {'supported_levels': 'B', 'flags': 'B'}
+
+    class GetStatus(Function):
+        id = 1
+        response = {'state_of_charge': 'B', 'level': 'B', 'status': 'B', 'external_power': 'B'}
+
+    class BatteryInfoEvent(Event):
+        id = 0
+        data = {'state_of_charge': 'B', 'level': 'B', 'status': 'B', 'external_power': 'B'}
+
+
+class AdjustableDpi(Feature):
+    '''Sensor resolution'''
+    id = 0x2201
+
+    class GetSensorCount(Function):
+        id = 0
+        response = {'count': 'B'}
+
+    class GetSensorDpiList(Function):
+        id = 1
+        request = {'sensor': 'B'}
+        response = {'sensor': 'B', 'dpi_list': '14s'}  # big endian u16 list, 0 terminated
+
+    class GetSensorDpi(Function):
+        id = 2
+        request = {'sensor': 'B'}
+        response = {'sensor': 'B', 'dpi': 'H', 'default_dpi': 'H'}
+
+    class SetSensorDpi(Function):
+        id = 3
+        request = {'sensor': 'B', 'dpi': 'H'}
+        response = {'sensor': 'B', 'dpi': 'H'}
+
+
+class ReportRate(Feature):
+    '''USB/radio report rate, as the report interval in milliseconds'''
+    id = 0x8060
+
+    class GetReportRateList(Function):
+        id = 0
+        response = {'rates': 'B'}  # bit n set when a (n + 1) ms interval is supported
+
+    class GetReportRate(Function):
+        id = 1
+        response = {'interval': 'B'}
+
+    class SetReportRate(Function):
+        id = 2
+        request = {'interval': 'B'}
+
+
+class ColorLedEffects(Feature):
+    '''Per-zone lighting effects (eg. logo, side strips)'''
+    id = 0x8070
+
+    class GetInfo(Function):
+        id = 0
+        response = {'zone_count': 'B', 'nv_capabilities': 'H', 'ext_capabilities': 'H'}
+
+    class GetZoneInfo(Function):
+        id = 1
+        request = {'zone': 'B'}
+        response = {'zone': 'B', 'location': 'H', 'effect_count': 'B'}
+
+    class GetZoneEffectInfo(Function):
+        id = 2
+        request = {'zone': 'B', 'effect': 'B'}
+        response = {'zone': 'B', 'effect': 'B', 'effect_id': 'H', 'capabilities': 'H', 'period': 'H'}
+
+    class SetZoneEffect(Function):
+        id = 3
+        request = {'zone': 'B', 'effect': 'B', 'params': '10s', 'persistence': 'B'}
+        response = {'zone': 'B', 'effect': 'B', 'params': '10s'}
+
+    class GetZoneEffect(Function):
+        id = 4
+        request = {'zone': 'B'}
+        response = {'zone': 'B', 'effect': 'B', 'params': '10s'}
+
+
+class RgbEffects(Feature):
+    '''Per-cluster lighting effects, and the switch to software controlled lighting'''
+    id = 0x8071
+
+    class GetInfo(Function):
+        id = 0
+        request = {'cluster': 'B', 'effect': 'B', 'info_type': 'B'}  # 0xff for the device/cluster level info
+        response = {'cluster': 'B', 'effect': 'B', 'info': '14s'}
+
+    class SetRgbClusterEffect(Function):
+        id = 1
+        request = {'cluster': 'B', 'effect': 'B', 'params': '10s', 'persistence': 'B'}
+
+    class SetEffectSyncCorrection(Function):
+        id = 2
+        request = {'correction': 'H'}
+
+    class ManageSwControl(Function):
+        id = 5
+        request = {'operation': 'B', 'mode': 'B', 'events': 'B'}  # operation 1 sets, mode 3 is software control
+        response = {'operation': 'B', 'mode': 'B', 'events': 'B'}
+
+    class EffectSyncEvent(Event):
+        id = 0
+        data = {'cluster': 'B', 'effect': 'B', 'counter': 'H'}
+
+
+class PerKeyLighting(Feature):
+    '''
+    Per-key RGB lighting (v2)
+
+    Zone lists that do not fill a report are padded with zone 0xff, which is
+    not a key. Changes only show after ``FrameEnd``.
+    '''
+    id = 0x8081
+
+    class SetIndividualRgbZones(Function):
+        id = 1
+        request = {'zones': '16s'}  # up to 4 (zone, red, green, blue)
+
+    class SetRangeRgbZones(Function):
+        id = 5
+        request = {'ranges': '15s'}  # up to 3 (first zone, last zone, red, green, blue)
+
+    class SetRgbZonesSingleValue(Function):
+        id = 6
+        request = {'red': 'B', 'green': 'B', 'blue': 'B', 'zones': '13s'}
+
+    class FrameEnd(Function):
+        id = 7
+        request = {'reserved': 'x'}
+
+
+class OnboardProfiles(Feature):
+    '''Profiles stored in the device (buttons, DPI levels, lighting), and the switch to host mode'''
+    id = 0x8100
+
+    class GetProfilesDescription(Function):
+        id = 0
+        response = {
+            'memory_model': 'B',
+            'profile_format': 'B',
+            'macro_format': 'B',
+            'profile_count': 'B',
+            'profile_count_oob': 'B',
+            'button_count': 'B',
+            'sector_count': 'B',
+            'sector_size': 'H',
+            'mechanical_layout': 'B',
+            'various_info': 'B',
+        }
+
+    class SetOnboardMode(Function):
+        id = 1
+        request = {'mode': 'B'}  # 1 onboard, 2 host
+
+    class GetOnboardMode(Function):
+        id = 2
+        response = {'mode': 'B'}
+
+    class SetCurrentProfile(Function):
+        id = 3
+        request = {'profile': 'H'}  # sector of the profile
+
+    class GetCurrentProfile(Function):
+        id = 4
+        response = {'profile': 'H'}
+
+    class MemoryRead(Function):
+        id = 5
+        request = {'sector': 'H', 'offset': 'H'}
+        response = {'data': '16s'}
+
+    class MemoryAddrWrite(Function):
+        id = 6
+        request = {'sector': 'H', 'offset': 'H', 'size': 'H'}
+
+    class MemoryWrite(Function):
+        id = 7
+        request = {'data': '16s'}
+
+    class MemoryWriteEnd(Function):
+        id = 8
+        request = {'reserved': 'x'}
+
+    class GetCurrentDpiIndex(Function):
+        id = 11
+        response = {'index': 'B'}
+
+    class SetCurrentDpiIndex(Function):
+        id = 12
+        request = {'index': 'B'}
+
+    class CurrentProfileChanged(Event):
+        id = 0
+        data = {'profile': 'H'}
+
+    class CurrentDpiIndexChanged(Event):
+        id = 1
+        data = {'index': 'B'}
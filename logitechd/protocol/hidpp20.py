@@ -1,8 +1,100 @@
 # SPDX-License-Identifier: MIT
 
+import collections
+import re
+import struct
 import textwrap
 
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Type, Union
+
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+PAYLOAD_OFFSET = 4  # report ID, device index, feature index, function/software ID
+PAYLOAD_MAX_SIZE = 60  # very long report
+FUNCTION_IDS = 16  # the function/event ID is the high nibble of the fourth byte
+_FIELD_FORMAT = re.compile(r'\d*[sx]|[bBhHiIlLqQefd?]')  # a single value, only bytes and padding take a count
+
+FEATURES: Dict[int, Any] = {}  # feature ID -> Feature subclass, filled as features are defined
+
+
+class Codec(object):
+    '''
+    Compiled packet format
+
+    Built from a ``{field: struct format}`` dictionary, eg.
+    ``{'feature': 'H', 'reserved': 'x', 'name': '13s'}``, where each field is
+    a single value (only byte strings and padding take a count, as a field
+    such as ``'2H'`` would decode to several values). Fields are packed
+    in big endian (network) order, as HID++ does, and padding fields (``x``)
+    are skipped when decoding. Encoding and decoding map to a single
+    ``struct.Struct`` call on the report buffer.
+
+    The format is validated upfront, but the named tuple type of the decoded
+    packets is only created on first use, as most of the feature catalog is
+    never decoded by a given daemon.
+    '''
+    __slots__ = ('name', 'fields', 'struct', '_tuple')
+
+    def __init__(self, name: str, fields: Dict[str, str]) -> None:
+        for key, fmt in fields.items():
+            if not isinstance(fmt, str):
+                raise ValueError(f'Expected the format of field `{key}` to be a string but got `{fmt}`')
+            if not _FIELD_FORMAT.fullmatch(fmt):
+                raise ValueError(f'Expected the format of field `{key}` to be a single value but got `{fmt}`')
+        try:
+            self.struct = struct.Struct('>' + ''.join(fields.values()))
+        except struct.error as e:
+            raise ValueError(f'Invalid packet format `{fields}`: {e}') from e
+        if self.struct.size > PAYLOAD_MAX_SIZE:
+            raise ValueError(f'Packet format too big ({self.struct.size} bytes, max is {PAYLOAD_MAX_SIZE})')
+
+        self.name = name
+        self.fields = tuple(key for key, fmt in fields.items() if not fmt.endswith('x'))
+        self._tuple: Optional[Type[NamedTuple]] = None
+
+    @property
+    def tuple(self) -> Type[NamedTuple]:
+        '''Named tuple type of the decoded packets'''
+        if self._tuple is not None:
+            return self._tuple
+        tuple: Type[NamedTuple] = collections.namedtuple(self.name, self.fields)  # type: ignore
+        self._tuple = tuple
+        return tuple
+
+    @property
+    def size(self) -> int:
+        '''Packed size in bytes'''
+        return self.struct.size
+
+    def pack(self, *values: Any) -> bytes:
+        '''Encode the fields'''
+        return self.struct.pack(*values)
+
+    def pack_into(self, buffer: Union[bytearray, memoryview], offset: int, *values: Any) -> None:
+        '''Encode the fields directly into a report buffer'''
+        self.struct.pack_into(buffer, offset, *values)
+
+    def unpack_from(self, buffer: Buffer, offset: int = PAYLOAD_OFFSET) -> Any:
+        '''Decode the fields from a report buffer, returns a named tuple'''
+        return (self._tuple or self.tuple)._make(self.struct.unpack_from(buffer, offset))
+
+
+def _check_id(obj: Any, limit: Optional[int] = None) -> None:
+    if not isinstance(obj, int):
+        raise ValueError(f'Expected value of `id` to be an int but got `{obj}`')
+    if limit is not None and not 0 <= obj < limit:
+        raise ValueError(f'Expected `id` to be in [0, {limit}) but got `{obj}`')
+
+
+def _table(feature: str, members: Iterable[Any]) -> Tuple[Any, ...]:
+    '''Members of a feature indexed by ID, ``None`` for the unused IDs'''
+    table: List[Any] = [None] * FUNCTION_IDS
+    for obj in members:
+        if table[obj.id] is not None:
+            raise ValueError(f'`{feature}` has both `{table[obj.id].__name__}` and `{obj.__name__}` with ID {obj.id}')
+        table[obj.id] = obj
+    return tuple(table)
 
 
 class _FeatureMeta(type):
@@ -10,13 +102,19 @@ class _FeatureMeta(type):
         if len(bases) != 0:  # not the base class - Feature
             if 'id' not in dic:
                 raise ValueError('Missing `id` field')
-            for key, obj in dic.items():
-                if key == 'id':
-                    if not isinstance(obj, int):
-                        raise ValueError(f'Expected value of `id` to be an int but got `{obj}`')
-                elif not key.startswith('_') and not issubclass(obj, Function) and not issubclass(obj, Event):
+            _check_id(dic['id'], 0x10000)
+            if dic['id'] in FEATURES:
+                raise ValueError(f'Feature ID 0x{dic["id"]:04x} already taken by `{FEATURES[dic["id"]].__name__}`')
+            members = {key: obj for key, obj in dic.items() if key != 'id' and not key.startswith('_')}
+            for key, obj in members.items():
+                if not isinstance(obj, type) or not issubclass(obj, (Function, Event)):
                     raise ValueError(f'Expected value of `{key}` to be a Function or Event but got `{obj}`')
-        return super().__new__(mcs, name, bases, dic)
+            dic['functions'] = _table(name, (obj for obj in members.values() if issubclass(obj, Function)))
+            dic['events'] = _table(name, (obj for obj in members.values() if issubclass(obj, Event)))
+        cls = super().__new__(mcs, name, bases, dic)
+        if len(bases) != 0:
+            FEATURES[dic['id']] = cls
+        return cls
 
     def __repr__(self) -> str:
         return f'{self.__name__}(id={getattr(self, "id")})'
@@ -31,13 +129,16 @@ class _FunctionMeta(type):
                 raise ValueError('Expecting at least one of `request` and `response` fields to be present but got none')
             for key, obj in dic.items():
                 if key == 'id':
-                    if not isinstance(obj, int):
-                        raise ValueError(f'Expected value of `id` to be an int but got `{obj}`')
+                    _check_id(obj, FUNCTION_IDS)
                 elif key in ('request', 'response'):
                     if not isinstance(obj, dict):
                         raise ValueError(f'Expected value of `{key}` to be a dictionary but got `{obj}`')
                 elif not key.startswith('_'):
                     raise ValueError(f'Unexpected field `{key}`')
+            dic.update({
+                f'{key}_codec': Codec(f'{name}{key.capitalize()}', dic[key])
+                for key in ('request', 'response') if key in dic
+            })
         return super().__new__(mcs, name, bases, dic)
 
     def __repr__(self) -> str:
@@ -60,13 +161,13 @@ class _EventMeta(type):
                     raise ValueError(f'Missing `{field}` field')
             for key, obj in dic.items():
                 if key == 'id':
-                    if not isinstance(obj, int):
-                        raise ValueError(f'Expected value of `id` to be an int but got `{obj}`')
+                    _check_id(obj, FUNCTION_IDS)
                 elif key == 'data':
                     if not isinstance(obj, dict):
                         raise ValueError(f'Expected value of `data` to be a dictionary but got `{obj}`')
                 elif not key.startswith('_'):
                     raise ValueError(f'Unexpected field `{key}`')
+            dic['data_codec'] = Codec(f'{name}Data', dic['data'])
         return super().__new__(mcs, name, bases, dic)
 
     def __repr__(self) -> str:
@@ -86,7 +187,15 @@ class Feature(metaclass=_FeatureMeta):
     ``Function`` or ``Event``.
 
     ``id`` should be an integer with the ID of the feature.
+
+    Features are validated once, when they are defined, and registered in
+    ``FEATURES`` by ID. Their functions and events are collected in the
+    ``functions`` and ``events`` tables, indexed by ID (with ``None`` for the
+    unused IDs), so that dispatching a report is a tuple lookup.
     '''
+    id: int
+    functions: Tuple[Optional[Type['Function']], ...]
+    events: Tuple[Optional[Type['Event']], ...]
 
 
 class Function(metaclass=_FunctionMeta):
@@ -96,9 +205,13 @@ class Function(metaclass=_FunctionMeta):
     Must have an ``id`` field, and may have ``request`` and/or ``response``
     fields. No other fields are allowed.
 
-    ``id`` should be an integer with the ID of the function.
-    ``request`` and ``response`` should be dictionaries describing the packet format.
+    ``id`` should be an integer with the ID of the function, 0 to 15.
+    ``request`` and ``response`` should be dictionaries describing the packet format,
+    they get compiled into the ``request_codec`` and ``response_codec`` fields.
     '''
+    id: int
+    request_codec: Codec
+    response_codec: Codec
 
 
 class Event(metaclass=_EventMeta):
@@ -107,6 +220,9 @@ class Event(metaclass=_EventMeta):
 
     Must have ``id`` and ``data`` fields.
 
-    ``id`` should be an integer with the ID of the event.
-    ``data`` should be a dictionary describing the packet format.
+    ``id`` should be an integer with the ID of the event, 0 to 15.
+    ``data`` should be a dictionary describing the packet format, it gets
+    compiled into the ``data_codec`` field.
     '''
+    id: int
+    data_codec: Codec
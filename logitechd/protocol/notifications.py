@@ -0,0 +1,206 @@
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import typing
+
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+if typing.TYPE_CHECKING:
+    import logitechd.protocol
+
+
+class Policy(object):
+    '''What to do when a subscription queue is full'''
+    DROP_OLDEST = 0
+    COALESCE = 1  # keep only the latest notification per feature index and event
+
+
+class Notification(object):
+    '''
+    Device notification
+
+    Published once per incoming report and shared between all subscribers.
+    ``feature_id`` is ``None`` when the feature index is unknown (eg. HID++ 1.0
+    notifications, where ``feature_index`` is the sub ID), and ``data`` is
+    ``None`` when there is no ``Event`` describing the notification.
+    '''
+    __slots__ = ('device', 'feature_index', 'feature_id', 'event', 'payload', 'data')
+
+    def __init__(
+        self,
+        device: logitechd.protocol.Device,
+        feature_index: int,
+        feature_id: Optional[int],
+        event: int,
+        payload: bytes,
+        data: Any = None,
+    ) -> None:
+        self.device = device
+        self.feature_index = feature_index
+        self.feature_id = feature_id
+        self.event = event
+        self.payload = payload
+        self.data = data
+
+    def __repr__(self) -> str:
+        feature = f'{self.feature_id:#06x}' if self.feature_id is not None else None
+        return f'Notification({self.device.io.name!r}, feature={feature}, event={self.event}, {self.payload.hex()})'
+
+
+_Key = Tuple[Optional['logitechd.protocol.Device'], Optional[int], Optional[int]]
+
+
+class Subscription(object):
+    '''
+    Bounded notification queue
+
+    With ``Policy.DROP_OLDEST`` it is a ring buffer, once full the oldest
+    notification is dropped. With ``Policy.COALESCE`` a new notification
+    replaces the queued one from the same feature and event, and the oldest
+    one is dropped when full. Either way, publishing never blocks.
+    '''
+    __slots__ = ('_bus', '_key', '_maxsize', '_policy', '_queue', '_latest', '_waiters', 'dropped')
+
+    def __init__(self, bus: NotificationBus, key: _Key, maxsize: int, policy: int) -> None:
+        self._bus = bus
+        self._key = key
+        self._maxsize = maxsize
+        self._policy = policy
+        self._queue: Deque[Notification] = collections.deque(maxlen=maxsize)
+        self._latest: Dict[Tuple[int, int], Notification] = {}
+        self._waiters: Deque[asyncio.Future[None]] = collections.deque()  # concurrent ``get`` calls, oldest first
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._latest) if self._policy == Policy.COALESCE else len(self._queue)
+
+    def _push(self, notification: Notification) -> None:
+        if self._policy == Policy.COALESCE:
+            key = (notification.feature_index, notification.event)
+            if key in self._latest:
+                del self._latest[key]
+                self.dropped += 1
+            elif len(self._latest) >= self._maxsize:
+                del self._latest[next(iter(self._latest))]
+                self.dropped += 1
+            self._latest[key] = notification
+        else:
+            if len(self._queue) == self._maxsize:
+                self.dropped += 1
+            self._queue.append(notification)
+
+        self._wake()
+
+    def _wake(self) -> None:
+        '''Wake the oldest waiting ``get``, one per notification'''
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def get_nowait(self) -> Notification:
+        '''Pop the oldest notification, raises ``IndexError`` if there is none'''
+        if self._policy == Policy.COALESCE:
+            if not self._latest:
+                raise IndexError('No notifications queued')
+            return self._latest.pop(next(iter(self._latest)))
+        return self._queue.popleft()
+
+    async def get(self) -> Notification:
+        '''Wait for a notification and pop it, concurrent callers are served in order'''
+        while not len(self):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                waiter.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                if len(self) and not waiter.cancelled():
+                    self._wake()  # we were woken but will not pop, pass it on
+                raise
+        return self.get_nowait()
+
+    def __aiter__(self) -> Subscription:
+        return self
+
+    async def __anext__(self) -> Notification:
+        return await self.get()
+
+    def close(self) -> None:
+        '''Unsubscribe'''
+        self._bus._unsubscribe(self._key, self)
+
+
+class NotificationBus(object):
+    '''
+    Notification fan-out
+
+    Devices publish their notifications here and each subscriber gets them in
+    its own bounded queue, so a slow subscriber never holds back the device
+    readers or the other subscribers. Subscriptions are indexed by their
+    (device, feature ID, event) filter, where ``None`` matches anything, and
+    publishing only looks up the filter shapes that have subscribers.
+    '''
+
+    def __init__(self) -> None:
+        self._subscriptions: Dict[_Key, List[Subscription]] = {}
+        # which filter fields are set, for every filter with subscribers
+        self._shapes: Dict[Tuple[bool, bool, bool], int] = {}
+
+    def subscribe(
+        self,
+        device: Optional[logitechd.protocol.Device] = None,
+        feature: Optional[int] = None,
+        event: Optional[int] = None,
+        *,
+        maxsize: int = 64,
+        policy: int = Policy.DROP_OLDEST,
+    ) -> Subscription:
+        '''Subscribe to notifications, filtering by device, feature ID and event'''
+        if maxsize < 1:
+            raise ValueError(f'Expected a positive `maxsize` but got `{maxsize}`')
+        key = (device, feature, event)
+        subscription = Subscription(self, key, maxsize, policy)
+        self._subscriptions.setdefault(key, []).append(subscription)
+        shape = self._shape(key)
+        self._shapes[shape] = self._shapes.get(shape, 0) + 1
+        return subscription
+
+    def _unsubscribe(self, key: _Key, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(key, [])
+        if subscription not in subscriptions:
+            return
+        subscriptions.remove(subscription)
+        if not subscriptions:
+            del self._subscriptions[key]
+        shape = self._shape(key)
+        self._shapes[shape] -= 1
+        if not self._shapes[shape]:
+            del self._shapes[shape]
+
+    @staticmethod
+    def _shape(key: _Key) -> Tuple[bool, bool, bool]:
+        return key[0] is not None, key[1] is not None, key[2] is not None
+
+    def __len__(self) -> int:
+        return sum(self._shapes.values())
+
+    def publish(self, notification: Notification) -> None:
+        device, feature_id, event = notification.device, notification.feature_id, notification.event
+        for has_device, has_feature, has_event in self._shapes:
+            if has_feature and feature_id is None:
+                continue
+            key = (
+                device if has_device else None,
+                feature_id if has_feature else None,
+                event if has_event else None,
+            )
+            for subscription in self._subscriptions.get(key, ()):
+                subscription._push(notification)
@@ -0,0 +1,113 @@
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import typing
+
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import logitechd.protocol.engine
+
+
+if typing.TYPE_CHECKING:
+    import logitechd.backend
+
+
+class Report(object):
+    '''
+    HID++ report
+
+    ``raw`` is the whole report and ``payload`` the parameters after the
+    function byte, both are views of the buffer the report was read into.
+    Reports handed out by a ``ReportReader`` are only valid until they are
+    released.
+    '''
+    __slots__ = (
+        'report_id', 'device_index', 'feature_index', 'function', 'sw_id',
+        'raw', 'payload', '_buffer', '_views', '_pool',
+    )
+
+    def __init__(self, size: int, pool: Optional[List[Report]] = None) -> None:
+        self._buffer = bytearray(size)
+        # (raw, payload) views for every report length, so framing does not slice
+        self._views: Dict[int, Tuple[memoryview, memoryview]] = {}
+        self._pool = pool
+        self.report_id = self.device_index = self.feature_index = self.function = self.sw_id = 0
+        self.raw = self.payload = memoryview(self._buffer)[:0]
+
+    @classmethod
+    def from_bytes(cls, data: logitechd.backend.Buffer) -> Report:
+        '''Build a standalone report from raw data'''
+        report = cls(len(data))
+        report._buffer[:] = data
+        report._frame(len(data))
+        return report
+
+    def _frame(self, length: int) -> None:
+        views = self._views.get(length)
+        if views is None:
+            view = memoryview(self._buffer)
+            views = self._views[length] = (view[:length], view[4:length])
+        self.raw, self.payload = views
+
+        buffer = self._buffer
+        self.report_id = buffer[0]
+        self.device_index = buffer[1]
+        self.feature_index = buffer[2]
+        self.function = buffer[3] >> 4
+        self.sw_id = buffer[3] & 0x0f
+
+    def release(self) -> None:
+        '''Return the report to its reader, so that the buffer can be reused'''
+        if self._pool is not None:
+            self._pool.append(self)
+
+    def __repr__(self) -> str:
+        return f'Report({self.raw.hex()})'
+
+
+class ReportReader(object):
+    '''
+    HID++ report framing
+
+    Reads reports from an IO interface into pooled buffers sized for the
+    largest HID++ report the device supports (``lengths`` maps report IDs to
+    their lengths, normally taken from the report descriptor), and frames
+    them into ``Report`` objects. Non HID++ reports and short reads are
+    discarded.
+    '''
+
+    def __init__(
+        self,
+        interface: logitechd.backend.IODeviceInterface,
+        lengths: Optional[Mapping[int, int]] = None,
+    ) -> None:
+        self._interface = interface
+        self._lengths = dict(lengths or logitechd.protocol.engine.REPORT_LENGTHS)
+        self._size = max(self._lengths.values())
+        self._pool: List[Report] = []
+
+    @property
+    def size(self) -> int:
+        '''Buffer size'''
+        return self._size
+
+    def read(self) -> Optional[Report]:
+        '''
+        Read and frame a report, ``None`` if it was not a HID++ report
+
+        The report should be released after use.
+        '''
+        report = self._pool.pop() if self._pool else Report(self._size, self._pool)
+        try:
+            length = self._interface.read_into(report._buffer)
+        except BaseException:
+            report.release()
+            raise
+
+        expected = self._lengths.get(report._buffer[0])
+        if expected is None or length < expected:
+            report.release()
+            return None
+        report._frame(expected)
+        return report
@@ -0,0 +1,177 @@
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import typing
+
+from typing import AsyncIterator, Deque, Dict, Optional, Set, Tuple
+
+
+if typing.TYPE_CHECKING:
+    import logitechd.protocol
+
+
+_Key = Tuple[int, int, bytes]  # feature index, function, target
+
+
+class WriteCoalescer(object):
+    '''
+    Per-device write coalescing
+
+    Writes are held for ``window`` seconds before being sent. A write to the
+    same (feature index, function, target) as a held one replaces it, so only
+    the latest value is sent, and a write of the value the device already
+    has, as far as we know from our last acked write, is not sent at all.
+    The target is given by the number of leading data bytes that select what
+    is being set (eg. the sensor or LED zone index), see ``write``.
+    '''
+
+    def __init__(self, device: logitechd.protocol.Device, *, window: float = 0.01) -> None:
+        self._device = device
+        self.window = window
+        self._state: Dict[_Key, bytes] = {}
+        self._pending: Dict[_Key, Tuple[bytes, asyncio.Future[None]]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._sending: Set[asyncio.Task[None]] = set()
+        self.sent = 0
+        self.coalesced = 0
+        self.skipped = 0
+
+    async def write(self, feature_index: int, function: int, data: bytes = b'', *, target: int = 0) -> None:
+        '''
+        Set a value on the device
+
+        The first ``target`` bytes of ``data`` select what is being set, two
+        writes with the same feature index, function and target are writes to
+        the same setting. Returns once the value has been acked by the device,
+        or replaced by a later write that has been.
+        '''
+        key = (feature_index, function, data[:target])
+        if key in self._pending:
+            _, future = self._pending[key]
+            self._pending[key] = data, future
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        if self._state.get(key) == data:
+            self.skipped += 1
+            return
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[key] = data, future
+        if self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        await asyncio.shield(future)
+
+    def invalidate(self, feature_index: Optional[int] = None) -> None:
+        '''Forget the device state, eg. after a reconnection, for one or every feature'''
+        if feature_index is None:
+            self._state.clear()
+        else:
+            self._state = {key: value for key, value in self._state.items() if key[0] != feature_index}
+
+    def _flush(self) -> None:
+        self._timer = None
+        pending, self._pending = self._pending, {}
+        for key, (data, future) in pending.items():
+            if self._state.get(key) == data:  # set back to the current value while held
+                self.skipped += 1
+                future.set_result(None)
+            else:
+                task = asyncio.ensure_future(self._send(key, data, future))
+                self._sending.add(task)  # the loop only keeps weak references to tasks
+                task.add_done_callback(self._sending.discard)
+
+    async def _send(self, key: _Key, data: bytes, future: asyncio.Future[None]) -> None:
+        feature_index, function, _ = key
+        self.sent += 1
+        try:
+            await self._device.request(feature_index, function, data)
+        except Exception as e:
+            self._state.pop(key, None)
+            future.set_exception(e)
+        else:
+            self._state[key] = data
+            future.set_result(None)
+
+
+class Priority(object):
+    '''Request priority on a shared receiver'''
+    INTERACTIVE = 0  # client requests, settings
+    BACKGROUND = 1  # polling, lighting animations
+
+
+class ReceiverScheduler(object):
+    '''
+    Request scheduling for the devices sharing a receiver
+
+    The devices paired to a receiver share its radio link, so at most
+    ``max_in_flight`` requests from the receiver and all of them are on the air
+    at once. When that limit is reached, requests wait for a slot: interactive
+    ones first, and round-robin between the devices within each priority,
+    so a chatty device only ever gets its turn and cannot starve the others.
+    '''
+
+    def __init__(self, max_in_flight: int = 4) -> None:
+        if max_in_flight < 1:
+            raise ValueError(f'Expected a positive `max_in_flight` but got `{max_in_flight}`')
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        # per priority, devices in round-robin order and their waiting requests
+        self._queues: Tuple[Dict[logitechd.protocol.Device, Deque[asyncio.Future[None]]], ...] = tuple(
+            collections.OrderedDict() for _ in range(Priority.BACKGROUND + 1)
+        )
+
+    def __len__(self) -> int:
+        '''Number of requests waiting for a slot'''
+        return sum(len(waiters) for queue in self._queues for waiters in queue.values())
+
+    @contextlib.asynccontextmanager
+    async def slot(self, device: logitechd.protocol.Device, priority: int = Priority.INTERACTIVE) -> AsyncIterator[None]:
+        '''Hold an in-flight slot for a request from ``device``'''
+        await self._acquire(device, priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, device: logitechd.protocol.Device, priority: int) -> None:
+        if self.in_flight < self.max_in_flight and not len(self):
+            self.in_flight += 1
+            return
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(device, collections.deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():  # granted and cancelled in the same iteration
+                self._release()
+            else:
+                self._discard(device, priority, future)
+            raise
+
+    def _discard(self, device: logitechd.protocol.Device, priority: int, future: asyncio.Future[None]) -> None:
+        waiters = self._queues[priority].get(device)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._queues[priority][device]
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        while self.in_flight < self.max_in_flight:
+            queue = next((queue for queue in self._queues if queue), None)
+            if queue is None:
+                return
+            device, waiters = next(iter(queue.items()))
+            future = waiters.popleft()
+            # rotate, the device goes to the back of the line
+            del queue[device]
+            if waiters:
+                queue[device] = waiters
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
@@ -0,0 +1,277 @@
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import configparser
+import contextlib
+import dataclasses
+import logging
+import math
+import time
+import typing
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Type
+
+import logitechd.protocol.engine
+import logitechd.protocol.hidpp20
+
+from logitechd.protocol.features import AdjustableDpi, BatteryStatus, ReportRate, UnifiedBattery
+from logitechd.protocol.scheduler import Priority
+
+
+if typing.TYPE_CHECKING:
+    import logitechd.protocol
+    import logitechd.protocol.report
+    import logitechd.protocol.scheduler
+
+
+@dataclasses.dataclass(frozen=True)
+class Attribute(object):
+    '''
+    Cached device attribute
+
+    Read with ``function`` of ``feature``, called with ``request``, and
+    cached for ``ttl`` seconds. The ``events`` of the feature carry the new
+    value, in the same format as the response, and update the cache directly.
+    '''
+    name: str
+    feature: Type[logitechd.protocol.hidpp20.Feature]
+    function: Type[logitechd.protocol.hidpp20.Function]
+    ttl: float
+    request: Tuple[Any, ...] = ()
+    events: Tuple[Type[logitechd.protocol.hidpp20.Event], ...] = ()
+
+
+ATTRIBUTES = {
+    attribute.name: attribute
+    for attribute in (
+        # the battery features notify changes, the TTL only bounds how stale a missed notification leaves us
+        Attribute('battery', BatteryStatus, BatteryStatus.GetBatteryLevelStatus, 600.0,
+                  events=(BatteryStatus.BatteryStatusEvent,)),
+        Attribute('unified_battery', UnifiedBattery, UnifiedBattery.GetStatus, 600.0,
+                  events=(UnifiedBattery.BatteryInfoEvent,)),
+        Attribute('dpi', AdjustableDpi, AdjustableDpi.GetSensorDpi, 60.0, request=(0,)),
+        Attribute('report_rate', ReportRate, ReportRate.GetReportRate, 60.0),
+    )
+}
+
+_NOT_CACHED = object()
+
+
+class DeviceState(object):
+    '''
+    Per-device attribute cache
+
+    Reads of fresh values, see ``ATTRIBUTES`` for the TTLs, are served from
+    memory, ``peek`` does not even need the event loop. Concurrent reads of a
+    stale value share a single request. Notifications carrying a new value
+    update the cache, and the whole state is dropped when the device
+    (dis)connects. Attributes of features the device does not support read
+    as ``None``.
+
+    ``on_change`` callbacks only run when a value actually changes.
+    '''
+
+    def __init__(self, device: logitechd.protocol.Device, *, clock: Callable[[], float] = time.monotonic) -> None:
+        self._device = device
+        self._clock = clock
+        self._values: Dict[str, Tuple[float, Any]] = {}  # name -> (expiry, value)
+        self._events: Dict[Tuple[int, int], Tuple[Attribute, logitechd.protocol.hidpp20.Codec]] = {}
+        self._callbacks: List[Callable[[logitechd.protocol.Device, str, Any], None]] = []
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, name: str) -> bool:
+        '''Whether there is a fresh value for ``name``'''
+        entry = self._values.get(name)
+        return entry is not None and entry[0] > self._clock()
+
+    def peek(self, name: str, default: Any = None) -> Any:
+        '''Fresh cached value of ``name``, or ``default``, without touching the device'''
+        entry = self._values.get(name)
+        if entry is None or entry[0] <= self._clock():
+            return default
+        return entry[1]
+
+    async def get(self, name: str, *, priority: int = Priority.INTERACTIVE) -> Any:
+        '''Value of ``name``, from the cache if fresh'''
+        value = self.peek(name, _NOT_CACHED)
+        if value is not _NOT_CACHED:
+            self.hits += 1
+            return value
+        attribute = ATTRIBUTES.get(name)
+        if attribute is None:
+            raise KeyError(f'Unknown attribute `{name}`')
+        self.misses += 1
+        return await self._device._once(('state', name), lambda: self._fetch(attribute, priority))
+
+    async def _fetch(self, attribute: Attribute, priority: int) -> Any:
+        index = await self._device.feature_index(attribute.feature)
+        if not index:
+            self._store(attribute, None, math.inf)  # not supported, until the device reconnects
+            return None
+        for event in attribute.events:
+            self._events[index, event.id] = attribute, event.data_codec
+        value = await self._device.call(index, attribute.function, *attribute.request, priority=priority)
+        self._store(attribute, value)
+        return value
+
+    def _store(self, attribute: Attribute, value: Any, ttl: Optional[float] = None) -> None:
+        previous = self._values.get(attribute.name)
+        self._values[attribute.name] = (self._clock() + (attribute.ttl if ttl is None else ttl), value)
+        if previous is None or previous[1] != value:
+            for callback in self._callbacks:
+                callback(self._device, attribute.name, value)
+
+    def feed(self, report: logitechd.protocol.report.Report) -> None:
+        '''Update the cache from a notification report, called by the device'''
+        if not self._events:
+            return
+        entry = self._events.get((report.feature_index, report.function))
+        if entry is None:
+            return
+        attribute, codec = entry
+        if len(report.payload) >= codec.size:
+            self._store(attribute, codec.unpack_from(report.raw))
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        '''Drop the cached value of ``name``, or all of them'''
+        if name is None:
+            self._values.clear()
+            self._events.clear()  # feature indexes may have changed
+        else:
+            self._values.pop(name, None)
+
+    def on_change(self, callback: Callable[[logitechd.protocol.Device, str, Any], None]) -> None:
+        '''Call ``callback(device, name, value)`` when a value changes'''
+        self._callbacks.append(callback)
+
+
+class StatePoller(object):
+    '''
+    Adaptive background refresh of the device state
+
+    Every device gets its ``attributes`` read at most every ``interval``
+    seconds, at background priority, and values still fresh in the cache
+    (eg. updated by a notification) are not read at all. A device whose
+    values did not change, or that failed to answer, is polled half as often
+    next time, down to every ``max_interval`` seconds, and goes back to
+    ``interval`` as soon as something changes. Devices their receiver reports
+    as disconnected (asleep) are not polled, and are polled right away when
+    they wake up.
+
+    Polls of the devices on the same receiver are batched: when one is due,
+    the others due within ``batch_window`` seconds are polled with it, so the
+    receiver wakes up the radio once for all of them.
+    '''
+
+    def __init__(
+        self,
+        devices: Callable[[], Iterable[logitechd.protocol.Device]],
+        attributes: Sequence[str] = ('battery', 'unified_battery'),
+        *,
+        interval: float = 60.0,
+        max_interval: float = 900.0,
+        batch_window: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        unknown = set(attributes) - set(ATTRIBUTES)
+        if unknown:
+            raise ValueError(f'Unknown attributes: {", ".join(sorted(unknown))}')
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._devices = devices
+        self.attributes = tuple(attributes)
+        self.interval = interval
+        self.max_interval = max_interval
+        self.batch_window = batch_window
+        self._clock = clock
+        self._schedule: Dict[logitechd.protocol.Device, Tuple[float, float]] = {}  # device -> (next poll, interval)
+        self._values: Dict[logitechd.protocol.Device, List[Any]] = {}  # last polled values
+        self._asleep: Set[logitechd.protocol.Device] = set()
+        self._watched: Set[logitechd.protocol.Device] = set()  # devices we get the connection events of
+        self._wakeup: Optional[asyncio.Event] = None  # set when a device wakes up, see ``run``
+        self.polls = 0
+
+    @classmethod
+    def from_config(
+        cls,
+        devices: Callable[[], Iterable[logitechd.protocol.Device]],
+        config: configparser.ConfigParser,
+    ) -> Optional[StatePoller]:
+        '''Poller from the ``state`` section of the configuration, ``None`` if polling is disabled'''
+        attributes = config.get('state', 'poll', fallback='battery unified_battery').split()
+        if not attributes:
+            return None
+        return cls(
+            devices,
+            attributes,
+            interval=config.getfloat('state', 'interval', fallback=60.0),
+            max_interval=config.getfloat('state', 'max_interval', fallback=900.0),
+        )
+
+    def _next(self, device: logitechd.protocol.Device) -> float:
+        return self._schedule[device][0] if device in self._schedule else -math.inf
+
+    def _due(self) -> List[logitechd.protocol.Device]:
+        '''Devices to poll now, with the ones on the same receiver due soon'''
+        now = self._clock()
+        groups: Dict[Optional[logitechd.protocol.scheduler.ReceiverScheduler], List[logitechd.protocol.Device]]
+        groups = collections.defaultdict(list)
+        for device in self._devices():
+            if device.connected is False:
+                self._asleep.add(device)
+                continue
+            if device in self._asleep:  # woke up
+                self._asleep.discard(device)
+                self._schedule.pop(device, None)
+            groups[device.scheduler].append(device)
+        due: List[logitechd.protocol.Device] = []
+        for devices in groups.values():
+            if any(self._next(device) <= now for device in devices):
+                due.extend(device for device in devices if self._next(device) <= now + self.batch_window)
+        return due
+
+    async def _poll(self, device: logitechd.protocol.Device) -> None:
+        _, interval = self._schedule.get(device, (0.0, self.interval))
+        try:
+            values = [await device.state.get(name, priority=Priority.BACKGROUND) for name in self.attributes]
+        except (asyncio.TimeoutError, logitechd.protocol.engine.HIDPPError, OSError) as e:
+            self._logger.debug(f'Could not poll `{device.io.name}`: {e!r}')
+            values = self._values.get(device, [])
+        self.polls += 1
+        changed = values != self._values.get(device)
+        self._values[device] = values
+        interval = self.interval if changed else min(interval * 2, self.max_interval)
+        self._schedule[device] = (self._clock() + interval, interval)
+
+    async def poll(self) -> float:
+        '''Poll the due devices, returns the time until the next device is due'''
+        await asyncio.gather(*(self._poll(device) for device in self._due()))
+        devices = set(self._devices())
+        for device in set(self._schedule) - devices:  # removed
+            del self._schedule[device]
+            self._values.pop(device, None)
+        self._asleep &= devices
+        for device in devices - self._watched:
+            device.on_connection(self._connection)
+        self._watched = devices
+        pending = [self._next(device) for device in devices if device.connected is not False]
+        return max(0.0, min(pending, default=math.inf) - self._clock())
+
+    def _connection(self, device: logitechd.protocol.Device, connected: bool) -> None:
+        if connected and device in self._watched:
+            self._schedule.pop(device, None)  # due right away
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    async def run(self) -> None:
+        '''Poll forever'''
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            # poll again at least every interval, to pick up new devices
+            delay = min(await self.poll(), self.interval)
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), delay)  # or as soon as a device wakes up
@@ -0,0 +1,198 @@
+# SPDX-License-Identifier: MIT
+'''
+HID report descriptor parser
+
+You can find the documentation in items 5 (Operational Mode) and 6
+(Descriptors) of the Device Class Definition for HID.
+'''
+
+from __future__ import annotations
+
+import dataclasses
+import functools
+
+from typing import Dict, FrozenSet, List, Mapping, Sequence, Set, Tuple
+
+
+class Type(object):
+    MAIN = 0
+    GLOBAL = 1
+    LOCAL = 2
+    RESERVED = 3
+
+
+class TagMain(object):
+    INPUT = 0b1000
+    OUTPUT = 0b1001
+    COLLECTION = 0b1010
+    FEATURE = 0b1011
+    END_COLLECTION = 0b1100
+
+
+class TagGlobal(object):
+    USAGE_PAGE = 0b0000
+    LOGICAL_MINIMUM = 0b0001
+    LOGICAL_MAXIMUM = 0b0010
+    PHYSICAL_MINIMUM = 0b0011
+    PHYSICAL_MAXIMUM = 0b0100
+    UNIT_EXPONENT = 0b0101
+    UNIT = 0b0110
+    REPORT_SIZE = 0b0111
+    REPORT_ID = 0b1000
+    REPORT_COUNT = 0b1001
+    PUSH = 0b1010
+    POP = 0b1011
+
+
+class TagLocal(object):
+    USAGE = 0b0000
+
+
+LONG_ITEM = 0b11111110
+
+VENDOR_PAGES = range(0xff00, 0x10000)
+
+HIDPP_REPORT_IDS = (0x10, 0x11, 0x12)
+
+
+# (type, tag, data size) for every prefix byte, see 6.2.2.2
+_PREFIXES: Tuple[Tuple[int, int, int], ...] = tuple(
+    ((prefix >> 2) & 0b11, prefix >> 4, (0, 1, 2, 4)[prefix & 0b11])
+    for prefix in range(0x100)
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class Report(object):
+    '''Report sizes in bytes, including the report ID byte'''
+    id: int
+    input_size: int = 0
+    output_size: int = 0
+    feature_size: int = 0
+
+
+@dataclasses.dataclass(frozen=True)
+class Collection(object):
+    type: int
+    usage_page: int
+    usage: int
+
+
+@dataclasses.dataclass(frozen=True)
+class ReportDescriptor(object):
+    usage_pages: FrozenSet[int]
+    reports: Mapping[int, Report]
+    collections: Tuple[Collection, ...]
+
+    @property
+    def vendor(self) -> bool:
+        '''Whether or not the descriptor contains a vendor page'''
+        return any(page in VENDOR_PAGES for page in self.usage_pages)
+
+    @property
+    def hidpp_reports(self) -> Dict[int, int]:
+        '''HID++ report IDs (short, long and very long) supported by the device and their length'''
+        return {
+            report.id: max(report.input_size, report.output_size)
+            for report in self.reports.values()
+            if report.id in HIDPP_REPORT_IDS
+        }
+
+
+def parse(rdesc: Sequence[int]) -> ReportDescriptor:
+    '''
+    Parse a report descriptor
+
+    Results are cached per descriptor, so devices of the same model are only
+    parsed once.
+    '''
+    return _parse(bytes(rdesc))
+
+
+@functools.lru_cache(maxsize=64)
+def _parse(rdesc: bytes) -> ReportDescriptor:
+    parser = _Parser()
+    items = {
+        Type.MAIN: parser.main,
+        Type.GLOBAL: parser.global_,
+        Type.LOCAL: parser.local,
+        Type.RESERVED: parser.reserved,
+    }
+
+    i = 0
+    end = len(rdesc)
+    while i < end:
+        prefix = rdesc[i]
+        if prefix == LONG_ITEM:  # 6.2.2.3, no long items are defined, skip them
+            if i + 1 >= end:
+                break
+            i += rdesc[i + 1] + 3
+            continue
+
+        typ, tag, size = _PREFIXES[prefix]
+        if i + 1 + size > end:  # truncated item
+            break
+        items[typ](tag, size, int.from_bytes(rdesc[i + 1:i + 1 + size], 'little'))
+        i += size + 1
+
+    return parser.result()
+
+
+class _Parser(object):
+    _GLOBALS = {
+        TagGlobal.USAGE_PAGE: 'usage_page',
+        TagGlobal.REPORT_SIZE: 'report_size',
+        TagGlobal.REPORT_COUNT: 'report_count',
+        TagGlobal.REPORT_ID: 'report_id',
+    }
+    _MAIN_REPORTS = {
+        TagMain.INPUT: 'input_size',
+        TagMain.OUTPUT: 'output_size',
+        TagMain.FEATURE: 'feature_size',
+    }
+
+    def __init__(self) -> None:
+        self.usage_pages: Set[int] = set()
+        self.collections: List[Collection] = []
+        self.sizes: Dict[Tuple[int, str], int] = {}  # (report ID, report field) -> bits
+        # global state
+        self.usage_page = self.report_size = self.report_count = self.report_id = 0
+        self.stack: List[Tuple[int, int, int, int]] = []
+        # local state
+        self.usages: List[int] = []
+
+    def main(self, tag: int, size: int, value: int) -> None:
+        if tag in self._MAIN_REPORTS:
+            key = (self.report_id, self._MAIN_REPORTS[tag])
+            self.sizes[key] = self.sizes.get(key, 0) + self.report_size * self.report_count
+        elif tag == TagMain.COLLECTION:
+            usage = self.usages[0] if self.usages else 0
+            page = usage >> 16 if usage > 0xffff else self.usage_page
+            self.collections.append(Collection(value, page, usage & 0xffff))
+        self.usages = []
+
+    def global_(self, tag: int, size: int, value: int) -> None:
+        if tag in self._GLOBALS:
+            setattr(self, self._GLOBALS[tag], value)
+            if tag == TagGlobal.USAGE_PAGE:
+                self.usage_pages.add(value)
+        elif tag == TagGlobal.PUSH:
+            self.stack.append((self.usage_page, self.report_size, self.report_count, self.report_id))
+        elif tag == TagGlobal.POP and self.stack:
+            self.usage_page, self.report_size, self.report_count, self.report_id = self.stack.pop()
+
+    def local(self, tag: int, size: int, value: int) -> None:
+        if tag == TagLocal.USAGE:
+            if size == 4:  # extended usage, includes the usage page
+                self.usage_pages.add(value >> 16)
+            self.usages.append(value)
+
+    def reserved(self, tag: int, size: int, value: int) -> None:
+        pass
+
+    def result(self) -> ReportDescriptor:
+        reports: Dict[int, Report] = {}
+        for (report_id, field), bits in self.sizes.items():
+            length = (bits + 7) // 8 + (1 if report_id else 0)
+            reports[report_id] = dataclasses.replace(reports.get(report_id, Report(report_id)), **{field: length})
+        return ReportDescriptor(frozenset(self.usage_pages), reports, tuple(self.collections))
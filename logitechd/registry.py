@@ -0,0 +1,161 @@
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import threading
+
+from typing import AbstractSet, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+import logitechd.protocol
+
+
+class RegistryEntry(object):
+    '''Registered device and its place in the receiver/paired device hierarchy'''
+    __slots__ = ('device', 'path', 'name', 'vid', 'pid', 'device_index', 'serial', 'parent', 'children')
+
+    def __init__(
+        self,
+        device: logitechd.protocol.Device,
+        path: str,
+        name: str,
+        vid: int,
+        pid: int,
+        device_index: int,
+        serial: Optional[str],
+        parent: Optional[RegistryEntry],
+    ) -> None:
+        self.device = device
+        self.path = path
+        self.name = name
+        self.vid = vid
+        self.pid = pid
+        self.device_index = device_index
+        self.serial = serial
+        self.parent = parent
+        self.children: Tuple[RegistryEntry, ...] = ()
+
+    def __repr__(self) -> str:
+        return f'RegistryEntry({self.path}, {self.name!r})'
+
+
+class DeviceRegistry(object):
+    '''
+    Indexed device registry
+
+    Devices are indexed by node path, by ``Device`` object, by (VID, PID), by
+    receiver and device index, and by serial number. Mutations are serialized
+    by a lock, but readers never take it: the indexes are only ever updated with immutable
+    values, and a new snapshot of the device set is published after each
+    mutation, so reading ``devices`` does not allocate.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._by_path: Dict[str, RegistryEntry] = {}
+        self._by_device: Dict[logitechd.protocol.Device, RegistryEntry] = {}
+        self._by_id: Dict[Tuple[int, int], Tuple[RegistryEntry, ...]] = {}
+        self._by_receiver: Dict[Tuple[str, int], RegistryEntry] = {}
+        self._by_serial: Dict[str, RegistryEntry] = {}
+        self._entries: Tuple[RegistryEntry, ...] = ()
+        self._devices: FrozenSet[logitechd.protocol.Device] = frozenset()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[RegistryEntry]:
+        return iter(self._entries)
+
+    def __contains__(self, path: object) -> bool:
+        return path in self._by_path
+
+    @property
+    def devices(self) -> AbstractSet[logitechd.protocol.Device]:
+        '''Read-only snapshot of the registered devices'''
+        return self._devices
+
+    @property
+    def roots(self) -> Tuple[RegistryEntry, ...]:
+        '''Entries without a parent (receivers and directly connected devices)'''
+        return tuple(entry for entry in self._entries if entry.parent is None)
+
+    def get(self, path: str) -> Optional[RegistryEntry]:
+        return self._by_path.get(path)
+
+    def by_device(self, device: logitechd.protocol.Device) -> Optional[RegistryEntry]:
+        return self._by_device.get(device)
+
+    def by_id(self, vid: int, pid: int) -> Tuple[RegistryEntry, ...]:
+        return self._by_id.get((vid, pid), ())
+
+    def by_receiver(self, receiver: str, device_index: int) -> Optional[RegistryEntry]:
+        return self._by_receiver.get((receiver, device_index))
+
+    def by_serial(self, serial: str) -> Optional[RegistryEntry]:
+        return self._by_serial.get(serial)
+
+    def add(
+        self,
+        device: logitechd.protocol.Device,
+        path: str,
+        *,
+        name: str = '',
+        parent: Optional[str] = None,
+        serial: Optional[str] = None,
+    ) -> RegistryEntry:
+        '''Register a device, ``parent`` is the path of its receiver'''
+        _, vid, pid = device.io.info
+        with self._lock:
+            if path in self._by_path:
+                raise KeyError(f'Device `{path}` already registered')
+            parent_entry = self._by_path[parent] if parent else None
+
+            entry = RegistryEntry(device, path, name, vid, pid, device.device_index, serial or None, parent_entry)
+            self._by_path[path] = entry
+            self._by_device[device] = entry
+            self._by_id[vid, pid] = self._by_id.get((vid, pid), ()) + (entry,)
+            if parent_entry:
+                parent_entry.children += (entry,)
+                self._by_receiver[parent_entry.path, entry.device_index] = entry
+            if entry.serial:
+                self._by_serial[entry.serial] = entry
+            self._publish(self._entries + (entry,))
+        return entry
+
+    def remove(self, path: str) -> List[RegistryEntry]:
+        '''Unregister a device and the devices paired to it, returns the removed entries'''
+        with self._lock:
+            entry = self._by_path.get(path)
+            if entry is None:
+                return []
+            removed = [entry, *entry.children]
+
+            if entry.parent:
+                entry.parent.children = tuple(child for child in entry.parent.children if child is not entry)
+            for item in removed:
+                del self._by_path[item.path]
+                del self._by_device[item.device]
+                siblings = tuple(other for other in self._by_id[item.vid, item.pid] if other is not item)
+                if siblings:
+                    self._by_id[item.vid, item.pid] = siblings
+                else:
+                    del self._by_id[item.vid, item.pid]
+                if item.parent:
+                    self._by_receiver.pop((item.parent.path, item.device_index), None)
+                if item.serial and self._by_serial.get(item.serial) is item:
+                    del self._by_serial[item.serial]
+            self._publish(tuple(other for other in self._entries if other not in removed))
+        return removed
+
+    def _publish(self, entries: Tuple[RegistryEntry, ...]) -> None:
+        self._entries = entries
+        self._devices = frozenset(entry.device for entry in entries)
+
+    def format(self) -> List[str]:
+        '''Human readable device tree'''
+        lines = []
+        for root in self.roots:
+            lines.append(f'{root.name} ({root.path})')
+            for i, child in enumerate(root.children):
+                branch = '└──' if i == len(root.children) - 1 else '├──'
+                lines.append(f'{branch} {child.name} ({child.path}, index {child.device_index})')
+        return lines
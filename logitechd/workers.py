@@ -0,0 +1,306 @@
+# SPDX-License-Identifier: MIT
+'''
+Sharding of the devices across worker processes
+
+With many receivers (eg. lighting rigs driving several keyboards), a single
+event loop ends up bound by a single core. In the sharded mode, the USB
+devices are spread over worker processes, each running its own backend and
+event loop, and owning the hidraw nodes, the protocol state and the state
+poller of its shard. The main process only keeps track of which worker owns
+which device, and routes the IPC calls of the clients to it.
+
+The workers are forked before the main event loop starts, and talk to the
+main process over a Unix socket pair, with the IPC protocol (see
+``logitechd.ipc``). A worker exits when the main process hangs up.
+'''
+
+from __future__ import annotations
+
+import asyncio
+import configparser
+import contextlib
+import dataclasses
+import logging
+import multiprocessing
+import signal
+import socket
+import zlib
+
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple,
+)
+
+import logitechd.backend
+import logitechd.config
+import logitechd.ipc
+import logitechd.metrics
+import logitechd.protocol.cache
+import logitechd.protocol.state
+
+
+@dataclasses.dataclass(frozen=True)
+class Shard(object):
+    '''
+    Devices of a worker process, called with the sys path of a USB device
+
+    The devices plugged in at startup are ``assigned`` round-robin, so that
+    they are spread evenly. The ones plugged in later go to the worker their
+    sys path hashes to, which all the workers agree on without talking to
+    each other.
+    '''
+    index: int
+    count: int
+    assigned: Mapping[str, int] = dataclasses.field(default_factory=dict)
+
+    def __call__(self, key: str) -> bool:
+        return self.assigned.get(key, zlib.crc32(key.encode()) % self.count) == self.index
+
+
+def shards(keys: Iterable[str], count: int) -> List[Shard]:
+    '''Split the USB devices ``keys`` (sys paths) in ``count`` shards'''
+    if count < 1:
+        raise ValueError(f'Expected a positive number of shards but got `{count}`')
+    assigned = {key: i % count for i, key in enumerate(sorted(keys))}
+    return [Shard(index, count, assigned) for index in range(count)]
+
+
+def shard_config(config: configparser.ConfigParser, shard: Shard) -> configparser.ConfigParser:
+    '''
+    Configuration of the worker of ``shard``
+
+    Workers do not share files: each keeps its own feature cache, and records
+    its traffic to its own capture file, the configured paths suffixed with
+    the shard index.
+    '''
+    copy = logitechd.config.parser()
+    copy.read_dict({section: dict(config.items(section, raw=True)) for section in config.sections()})
+    cache = config.get('discovery', 'cache', fallback=None) or logitechd.protocol.cache.default_path()
+    copy.read_dict({'discovery': {'cache': f'{cache}.{shard.index}'}})
+    capture = config.get('capture', 'path', fallback=None)
+    if capture:
+        copy.set('capture', 'path', f'{capture}.{shard.index}')
+    return copy
+
+
+async def _serve(backend: logitechd.backend.Backend, sock: socket.socket, config: configparser.ConfigParser) -> None:
+    backend.attach(asyncio.get_running_loop())
+    poller = logitechd.protocol.state.StatePoller.from_config(lambda: backend.devices, config)
+    polling = asyncio.ensure_future(poller.run()) if poller else None
+    try:
+        reader, writer = await asyncio.open_unix_connection(sock=sock)
+        await logitechd.ipc.Server(backend)._serve(reader, writer)  # until the main process hangs up
+    finally:
+        if polling:
+            polling.cancel()
+        backend.close()
+
+
+def _worker(
+    backend: Callable[[Shard], logitechd.backend.Backend],
+    shard: Shard,
+    sock: socket.socket,
+    inherited: Sequence[socket.socket],
+    config: configparser.ConfigParser,
+) -> None:
+    for other in inherited:  # the other workers' sockets, they would keep them from seeing the hang up
+        other.close()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the main process handles it, and hangs up
+    logitechd.metrics.REGISTRY.labels['worker'] = str(shard.index)
+    asyncio.run(_serve(backend(shard), sock, config))
+
+
+class WorkerPool(object):
+    '''
+    Worker processes, one per shard
+
+    ``backend`` builds the backend of a shard, in its worker process, and
+    the workers poll the device state as configured in ``config``.
+    '''
+
+    def __init__(
+        self,
+        shards: Sequence[Shard],
+        backend: Callable[[Shard], logitechd.backend.Backend],
+        config: Optional[configparser.ConfigParser] = None,
+    ) -> None:
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.shards = shards
+        self._backend = backend
+        self._config = config if config is not None else logitechd.config.load()
+        self._processes: List[multiprocessing.process.BaseProcess] = []
+        self._sockets: List[socket.socket] = []
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser) -> Optional[WorkerPool]:
+        '''
+        Pool sharding the hidraw backend over ``count`` workers (in the
+        ``workers`` section of the configuration), ``None`` for less than two
+        '''
+        count = config.getint('workers', 'count', fallback=0)
+        if count < 2:
+            return None
+        import logitechd.backend.hidraw
+
+        return cls(
+            shards(logitechd.backend.hidraw.target_usb_devices(config), count),
+            lambda shard: logitechd.backend.hidraw.HidrawBackend(shard=shard, config=shard_config(config, shard)),
+            config,
+        )
+
+    def start(self) -> None:
+        '''Fork the workers, must be called before starting the event loop'''
+        context = multiprocessing.get_context('fork')
+        for shard in self.shards:
+            ours, theirs = socket.socketpair()
+            process = context.Process(
+                target=_worker,
+                args=(self._backend, shard, theirs, tuple(self._sockets) + (ours,), self._config),
+                name=f'logitechd-worker-{shard.index}',
+                daemon=True,
+            )
+            process.start()
+            theirs.close()
+            self._processes.append(process)
+            self._sockets.append(ours)
+        self._logger.info(f'Started {len(self._processes)} workers')
+
+    async def connect(self) -> List[logitechd.ipc.Client]:
+        '''IPC clients of the workers, in shard order'''
+        clients = []
+        for sock in self._sockets:
+            reader, writer = await asyncio.open_unix_connection(sock=sock)
+            clients.append(logitechd.ipc.Client(reader, writer))
+        return clients
+
+    def close(self, timeout: float = 5.0) -> None:
+        '''Hang up on the workers and wait for them to exit, killing the ones that do not'''
+        for sock in self._sockets:
+            sock.close()
+        self._sockets.clear()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                self._logger.warning(f'Worker `{process.name}` did not exit, terminating it')
+                process.terminate()
+                process.join()
+
+    @property
+    def exitcodes(self) -> List[Optional[int]]:
+        '''Exit codes of the workers, ``None`` for the ones still running'''
+        return [process.exitcode for process in self._processes]
+
+
+class Router(logitechd.ipc.BaseServer):
+    '''
+    IPC server of the main process, in the sharded mode
+
+    Serves the same methods as ``logitechd.ipc.Server``. Calls on a device
+    are forwarded to the worker owning it, and the devices, metrics and
+    notifications of the workers are merged. Devices are routed by the last
+    device list, it is refreshed when a device is not found in it.
+    '''
+
+    def __init__(self, workers: Sequence[logitechd.ipc.Client], path: Optional[str] = None) -> None:
+        super().__init__(path)
+        self._workers = list(workers)
+        self._routes: Dict[str, int] = {}  # device path -> worker
+        self._relays: Dict[Tuple[int, int], asyncio.Queue[Dict[str, Any]]] = {}  # (worker, its subscription) -> queue
+        self._relaying: List[asyncio.Task[None]] = []
+        self._hanging_up: Set[asyncio.Task[None]] = set()
+        self._methods = {
+            'devices': self._devices,
+            'metrics': self._metrics,
+            'request': self._forward('request'),
+            'state': self._forward('state'),
+            'write': self._forward('write'),
+            'subscribe': self._subscribe,
+            'unsubscribe': self._unsubscribe,
+        }
+
+    async def start(self) -> None:
+        self._relaying = [asyncio.ensure_future(self._relay(index)) for index in range(len(self._workers))]
+        await super().start()
+
+    async def close(self) -> None:
+        await super().close()
+        for task in self._relaying:
+            task.cancel()
+        for worker in self._workers:
+            await worker.close()
+
+    async def _relay(self, index: int) -> None:
+        '''Pass the notifications of a worker to the subscriptions of our clients'''
+        async for subscription, notification in self._workers[index].notifications():
+            queue = self._relays.get((index, subscription))
+            if queue is None:  # unsubscribed
+                continue
+            if queue.full():  # drop the oldest, like the subscriptions of the workers
+                queue.get_nowait()
+            queue.put_nowait(notification)
+
+    async def _refresh(self) -> List[List[Dict[str, Any]]]:
+        listings: List[List[Dict[str, Any]]] = await asyncio.gather(*(worker.call('devices') for worker in self._workers))
+        self._routes = {entry['path']: index for index, entries in enumerate(listings) for entry in entries}
+        return listings
+
+    async def _route(self, device: str) -> int:
+        if device not in self._routes:
+            await self._refresh()  # plugged in since
+        index = self._routes.get(device)
+        if index is None:
+            raise KeyError(f'Unknown device `{device}`')
+        return index
+
+    # methods
+
+    async def _devices(self, connection: logitechd.ipc._Connection) -> List[Dict[str, Any]]:
+        return [entry for entries in await self._refresh() for entry in entries]
+
+    async def _metrics(self, connection: logitechd.ipc._Connection) -> str:
+        '''Metrics of the main process and of the workers, labeled by worker'''
+        texts = await asyncio.gather(*(worker.call('metrics') for worker in self._workers))
+        return logitechd.metrics.merge([logitechd.metrics.REGISTRY.expose(), *texts])
+
+    def _forward(self, method: str) -> Callable[..., Awaitable[Any]]:
+        async def forward(connection: logitechd.ipc._Connection, device: str, **params: Any) -> Any:
+            return await self._workers[await self._route(device)].call(method, device=device, **params)
+        return forward
+
+    async def _subscribe(
+        self,
+        connection: logitechd.ipc._Connection,
+        device: Optional[str] = None,
+        feature: Optional[int] = None,
+        event: Optional[int] = None,
+        maxsize: int = 64,
+    ) -> int:
+        workers = [await self._route(device)] if device else list(range(len(self._workers)))
+        subscriptions = await asyncio.gather(*(
+            self._workers[index].call('subscribe', device=device, feature=feature, event=event, maxsize=maxsize)
+            for index in workers
+        ))
+        keys = list(zip(workers, subscriptions))
+        queue: asyncio.Queue[Dict[str, Any]] = asyncio.Queue(maxsize)
+        for key in keys:
+            self._relays[key] = queue
+
+        def close() -> None:
+            for index, subscription in keys:
+                del self._relays[index, subscription]
+                task = asyncio.ensure_future(self._hang_up(index, subscription))
+                self._hanging_up.add(task)  # the loop only keeps weak references to tasks
+                task.add_done_callback(self._hanging_up.discard)
+
+        return connection.subscribe(self._drain(queue), close)
+
+    async def _hang_up(self, index: int, subscription: int) -> None:
+        with contextlib.suppress(logitechd.ipc.IPCError, ConnectionError):
+            await self._workers[index].call('unsubscribe', subscription=subscription)
+
+    @staticmethod
+    async def _drain(queue: asyncio.Queue[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        while True:
+            yield await queue.get()
+
+    async def _unsubscribe(self, connection: logitechd.ipc._Connection, subscription: int) -> None:
+        connection.unsubscribe(subscription)
@@ -1,7 +1,93 @@
 # SPDX-License-Identifier: MIT
 
+import asyncio
+
 import pytest
 
+import logitechd.backend
+import logitechd.protocol
+import logitechd.protocol.report
+
+
+class StubInterface(logitechd.backend.IODeviceInterface):
+    '''
+    Records the written requests, and answers them with ``respond``
+
+    ``respond`` is called with each request and returns the parameters of the
+    reply, or ``None`` to leave it unanswered. The replies are long reports,
+    handed to the device on the next loop iteration, or after ``delay``.
+    '''
+
+    def __init__(self, io, respond=None, delay=None):
+        self.io = io
+        self.respond = respond
+        self.delay = delay
+        self.written = []
+
+    def read(self):
+        raise BlockingIOError
+
+    def read_into(self, buffer):
+        raise BlockingIOError
+
+    def write(self, data):
+        request = bytes(data)
+        self.written.append(request)
+        params = self.respond(request) if self.respond else None
+        if params is None:
+            return
+        reply = bytearray(20)
+        reply[:4] = b'\x11' + request[1:4]
+        reply[4:4 + len(params[:16])] = params[:16]
+        report = logitechd.protocol.report.Report.from_bytes(reply)
+        loop = asyncio.get_running_loop()
+        if self.delay is None:
+            loop.call_soon(self.io.device.handle_report, report)
+        else:
+            loop.call_later(self.delay, self.io.device.handle_report, report)
+
+
+class StubDevice(logitechd.backend.IODevice):
+    '''IO device of the tests, ``device`` is the protocol device built over it'''
+
+    def __init__(self, respond=None, *, name='Stub Device', info=(0x03, 0x046d, 0xc33f), delay=None):
+        self.device = None
+        self.interface = StubInterface(self, respond, delay)
+        self._name = name
+        self._info = info
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def info(self):
+        return self._info
+
+    def fileno(self):
+        return -1
+
+    def __enter__(self):
+        return self.interface
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+@pytest.fixture
+def stub():
+    '''
+    Builds a device over a ``StubDevice``
+
+    Takes the arguments of ``StubDevice``, and the ones of
+    ``logitechd.protocol.construct_device`` as keywords.
+    '''
+    def stub(respond=None, *, device_index=0xff, notifications=None, scheduler=None, **kwargs):
+        io = StubDevice(respond, **kwargs)
+        io.device = logitechd.protocol.construct_device(io, device_index, notifications, scheduler)
+        return io.device
+    return stub
+
 
 @pytest.fixture
 def vendor_rdesc():
@@ -0,0 +1,106 @@
+# SPDX-License-Identifier: MIT
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import logitechd.backend
+import logitechd.backend.hidraw
+import logitechd.backend.simulator
+import logitechd.config
+
+
+def config(text=''):
+    parser = logitechd.config.parser()
+    parser.read_string(text)
+    return parser
+
+
+class UdevDevice(object):
+    def __init__(self, product=None, tags=()):
+        self.properties = {'PRODUCT': product} if product else {}
+        self.tags = tags
+
+
+def test_available():
+    backends = logitechd.backend.available_backends()
+    assert {'hidraw', 'rawfd', 'simulator', 'replay'} <= set(backends)
+    assert backends['simulator'] == 'logitechd.backend.simulator:SimulatorBackend.from_config'
+
+
+def test_construct():
+    backend = logitechd.backend.construct_backend(config=config('[backend]\nname = simulator\n[simulator]\ndevices = 3'))
+    try:
+        assert isinstance(backend, logitechd.backend.simulator.SimulatorBackend)
+        assert [entry.path for entry in backend.registry] == ['sim/0', 'sim/1', 'sim/2']
+    finally:
+        backend.close()
+
+
+def test_target_devices(tmp_path):
+    path = tmp_path / 'logitechd.conf'
+    path.write_text('[devices]\n046d:c339 = G Pro\nc339 = invalid\n')
+    targets = logitechd.backend._target_devices(logitechd.config.load(str(path)))
+    assert targets[0x046d, 0xc339].as_tuple == (0x03, 0x046d, 0xc339)
+    assert (0x046d, 0xc52b) in targets  # built-in
+    assert len(targets) == len(logitechd.backend._TARGET_DEVICES) + 1
+
+
+def test_match():
+    targets = logitechd.backend._target_devices(config('[devices]\n046d:c339 = G Pro'))
+    match = logitechd.backend.hidraw._match
+    assert match(UdevDevice('46d/c339/1201'), targets, None) is targets[0x046d, 0xc339]
+    assert match(UdevDevice('46d/c52b/1201'), targets, None) is targets[0x046d, 0xc52b]
+    assert match(UdevDevice('46d/c077/7200'), targets, None) is None  # not a target
+    assert match(UdevDevice('invalid'), targets, None) is None
+    assert match(UdevDevice(), targets, None) is None  # no PRODUCT
+    assert match(UdevDevice('46d/c52b/1201'), targets, 'logitechd') is None
+    assert match(UdevDevice('46d/c52b/1201', ('logitechd',)), targets, 'logitechd') is targets[0x046d, 0xc52b]
+
+
+def test_hidraw_config():
+    backend = logitechd.backend.hidraw.HidrawBackend(
+        config=config('[discovery]\nlazy = no\nconcurrency = 2\nstartup_deadline = 0.5'),
+    )
+    assert (backend.lazy, backend.discovery_concurrency, backend.startup_deadline) == (False, 2, 0.5)
+    backend = logitechd.backend.hidraw.HidrawBackend(startup_deadline=1.0, config=config())
+    assert (backend.lazy, backend.discovery_concurrency, backend.startup_deadline) == (True, 8, 1.0)
+
+
+def test_construct_errors(tmp_path):
+    with pytest.raises(ValueError, match='Unknown backend `missing`'):
+        logitechd.backend.construct_backend('missing', config())
+    with pytest.raises(ValueError, match='Missing capture file'):
+        logitechd.backend.construct_backend('replay', config())
+    with pytest.raises(FileNotFoundError):
+        logitechd.backend.construct_backend('replay', config(f'[replay]\npath = {tmp_path / "missing.cap"}'))
+
+
+def test_lazy_import():
+    script = (
+        'import configparser, sys, logitechd.backend\n'
+        'config = configparser.ConfigParser()\n'
+        'logitechd.backend.construct_backend("simulator", config).close()\n'
+        'print(" ".join(sorted(name for name in ("pyudev", "ioctl", "logitechd.backend.hidraw") if name in sys.modules)))\n'
+    )
+    root = os.path.dirname(os.path.dirname(logitechd.backend.__file__))
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=os.path.dirname(root), check=True, stdout=subprocess.PIPE, text=True,
+    ).stdout
+    assert output.strip() == ''
+
+
+@pytest.mark.parametrize('module', ['logitechd.backend', 'logitechd.__main__'])
+def test_light_import(module):
+    script = (
+        f'import sys, {module}\n'
+        'heavy = ("asyncio", "multiprocessing", "logitechd.protocol")\n'
+        'print(" ".join(sorted(name for name in heavy if name in sys.modules)))\n'
+    )
+    root = os.path.dirname(os.path.dirname(logitechd.backend.__file__))
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=os.path.dirname(root), check=True, stdout=subprocess.PIPE, text=True,
+    ).stdout
+    assert output.strip() == ''
@@ -0,0 +1,122 @@
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import math
+
+import pytest
+
+import logitechd.backend.replay
+import logitechd.backend.simulator
+import logitechd.capture
+
+
+def run(backend, func):
+    async def main():
+        backend.attach(asyncio.get_running_loop())
+        try:
+            return await asyncio.wait_for(func(backend), 5)
+        finally:
+            backend.detach()
+
+    try:
+        return asyncio.run(main())
+    finally:
+        backend.close()
+
+
+def record(capture, io, **description):
+    number = capture.register(
+        path=description.pop('path'), name=io.name, info=io.info, report_lengths=dict(io.report_lengths), **description,
+    )
+    io._interface = logitechd.capture.RecordingInterface(io._interface, capture, number)
+
+
+def test_ring(tmp_path):
+    path = str(tmp_path / 'ring.cap')
+    with logitechd.capture.CaptureFile(path, capacity=4) as capture:
+        device = capture.register(path='/dev/hidraw0', name='Keyboard')
+        for i in range(6):
+            capture.record(device, logitechd.capture.READ, bytes((0x10, 0xff, i, 0, 0, 0, 0)))
+        assert len(capture) == 4
+        assert [record.report[2] for record in capture] == [2, 3, 4, 5]
+
+    with logitechd.capture.CaptureFile(path) as capture:
+        assert capture.capacity == 4
+        assert capture.devices == [{'path': '/dev/hidraw0', 'name': 'Keyboard'}]
+        capture.record(0, logitechd.capture.WRITE, b'\x10\xff\x06')
+        records = list(capture)
+        assert [record.report[2] for record in records] == [3, 4, 5, 6]
+        assert records[-1] == (records[-1].timestamp, 0, logitechd.capture.WRITE, b'\x10\xff\x06')
+        assert all(a.timestamp <= b.timestamp for a, b in zip(records, records[1:]))
+
+
+def test_register(tmp_path):
+    path = str(tmp_path / 'table.cap')
+    device = {'path': '/dev/hidraw0', 'name': 'Keyboard', 'info': (0x03, 0x046d, 0xc33f)}
+    with logitechd.capture.CaptureFile(path, capacity=4) as capture:
+        assert capture.register(**device) == 0
+        assert capture.register(**device) == 0
+    for _ in range(64):  # restarts, or the device coming and going
+        with logitechd.capture.CaptureFile(path) as capture:
+            assert capture.register(**device) == 0
+            assert capture.register(**dict(device, path='/dev/hidraw1')) == 1
+    assert len(capture.devices) == 2
+
+    with logitechd.capture.CaptureFile(path) as capture:
+        with pytest.raises(ValueError, match='table full'):
+            for i in range(1000):
+                capture.register(path=f'/dev/hidraw{i}', name='Keyboard')
+
+
+def test_invalid(tmp_path):
+    path = tmp_path / 'invalid.cap'
+    path.write_bytes(b'\x00' * logitechd.capture.HEADER_SIZE)
+    with pytest.raises(ValueError):
+        logitechd.capture.CaptureFile(str(path))
+    with pytest.raises(ValueError):
+        logitechd.capture.CaptureFile(str(tmp_path / 'empty.cap'), capacity=0)
+
+
+def test_replay(tmp_path):
+    path = str(tmp_path / 'session.cap')
+    receiver = logitechd.backend.simulator.SimulatedReceiver()
+    mouse = logitechd.backend.simulator.SimulatedDevice('Mouse', 0x407f, features=[0x1000], latency=0.002)
+    receiver.pair(mouse, 2)
+    backend = logitechd.backend.simulator.SimulatorBackend([receiver])
+
+    async def session(backend):
+        await backend.registry.get('sim/0/2').device.discover()
+        await asyncio.sleep(0.01)
+        mouse.notify(0x1000, 0, b'\x42')
+        await asyncio.sleep(0.01)
+
+    with logitechd.capture.CaptureFile(path) as capture:
+        record(capture, receiver, path='sim/0', device_index=0xff, parent=None)
+        record(capture, mouse, path='sim/0/2', device_index=2, parent='sim/0')
+        run(backend, session)
+        captured = len(capture)
+
+    for speed in (0, -1.0, math.nan):
+        with pytest.raises(ValueError):
+            logitechd.backend.replay.ReplayBackend(path, speed=speed)
+    replay = logitechd.backend.replay.ReplayBackend(path, speed=math.inf)
+
+    async def func(backend):
+        device = backend.registry.get('sim/0/2').device
+        subscription = backend.notifications.subscribe(device)
+        await backend.playback
+        notification = await subscription.get()
+        await device.discover()
+        device.engine.timeout, device.engine.retries = 0.01, 0
+        with pytest.raises(asyncio.TimeoutError):
+            await device.request(0, 1, b'\x12\x34\x56')  # never captured
+        return device, notification
+
+    device, notification = run(replay, func)
+    assert captured > 0
+    assert replay.registry.by_receiver('sim/0', 2).name == 'Mouse'
+    assert device.protocol_version == (4, 2)
+    assert device.features == {0x0000: 0, 0x0001: 1, 0x0003: 2, 0x1000: 3}
+    assert (notification.feature_index, notification.payload[:1]) == (3, b'\x42')
+    assert replay.played == 1
+    assert device.io.unmatched > 0
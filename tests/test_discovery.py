@@ -0,0 +1,151 @@
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import json
+
+import pytest
+
+import logitechd.protocol
+import logitechd.protocol.cache
+import logitechd.protocol.report
+
+
+FEATURES = [0x0000, 0x0001, 0x0003, 0x0005, 0x1004, 0x8071]
+
+
+def respond(request):
+    feature, function, params = FEATURES[request[2]], request[3] >> 4, request[4:]
+    ret = bytearray(16)
+    if feature == 0x0000 and function == 0:  # GetFeature
+        feature_id = int.from_bytes(params[:2], 'big')
+        ret[0] = FEATURES.index(feature_id) if feature_id in FEATURES else 0
+    elif feature == 0x0000 and function == 1:  # Ping
+        ret[:3] = bytes([4, 2, params[2]])
+    elif feature == 0x0001 and function == 0:  # GetCount
+        ret[0] = len(FEATURES) - 1
+    elif feature == 0x0001 and function == 1:  # GetFeatureID
+        ret[:2] = FEATURES[params[0]].to_bytes(2, 'big')
+    elif feature == 0x0003 and function == 0:  # GetDeviceInfo
+        ret[1:5] = b'\xde\xad\xbe\xef'
+    elif feature == 0x0003 and function == 1:  # GetFwInfo
+        ret[1:7] = b'U1\x00\x12\x04\x00'
+    return ret
+
+
+@pytest.fixture()
+def device(stub):
+    return stub(respond)
+
+
+@pytest.fixture()
+def cache(tmp_path):
+    return logitechd.protocol.cache.FeatureCache(str(tmp_path / 'features.json'))
+
+
+def test_discover(device):
+    asyncio.run(device.discover())
+
+    assert device.protocol_version == (4, 2)
+    assert device.features == {feature: i for i, feature in enumerate(FEATURES)}
+    assert device.identity == (0x046d, 0xc33f, 'deadbeef', 'U1\x0012.04.0000')
+
+
+def test_discover_cache(device, cache, tmp_path):
+    asyncio.run(device.discover(cache))
+    assert (cache.hits, cache.misses) == (0, 1)
+    uncached = len(device.io.interface.written)
+    assert not (tmp_path / 'features.json').exists()
+    cache.flush()
+
+    # reload from disk
+    cache = logitechd.protocol.cache.FeatureCache(str(tmp_path / 'features.json'))
+    device.io.interface.written.clear()
+    asyncio.run(device.discover(cache))
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert device.features == {feature: i for i, feature in enumerate(FEATURES)}
+    assert len(device.io.interface.written) < uncached
+
+    # a hit only updates when the entry was seen, which is written on flush
+    saved = (tmp_path / 'features.json').read_text()
+    cache._entries[device.identity.key]['seen'] = 0
+    asyncio.run(device.discover(cache))
+    assert cache.dirty and (tmp_path / 'features.json').read_text() == saved
+    cache.flush()
+    assert not cache.dirty and (tmp_path / 'features.json').read_text() != saved
+
+
+def test_cache_stale_firmware(device, cache):
+    asyncio.run(device.discover(cache))
+    assert len(cache) == 1
+
+    identity = device.identity._replace(firmware='U1\x0013.00.0000')
+    assert cache.get(identity) is None
+    assert len(cache) == 0
+
+
+def test_cache_validation(device, cache):
+    asyncio.run(device.discover())
+    cache.put(device.identity, {0x0000: 0, 0x0001: 1})  # wrong feature count
+
+    asyncio.run(device.discover(cache))
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert len(device.features) == len(FEATURES)
+
+
+def test_cache_eviction(device, cache, tmp_path):
+    asyncio.run(device.discover(cache))
+    cache.max_entries = 2
+    other = device.identity._replace(unit_id='cafecafe')
+    cache.put(other, device.features)
+
+    asyncio.run(device.discover(cache))  # hit, now the most recently seen
+    cache.put(device.identity._replace(unit_id='f00df00d'), device.features)
+    assert cache.get(other) is None
+    assert cache.get(device.identity) is not None
+
+
+def test_cache_invalid_entries(device, tmp_path):
+    asyncio.run(device.discover())
+    path = tmp_path / 'features.json'
+    path.write_text(json.dumps({
+        device.identity.key: {'firmware': device.identity.firmware, 'features': {'0000': 0}},
+        '046d:c33f:00000001': {'features': {'0000': 0}},
+        '046d:c33f:00000002': {'firmware': 'U1', 'features': ['0000']},
+        '046d:c33f:00000003': {'firmware': 'U1', 'features': {'root': 0}},
+        '046d:c33f:00000004': {'firmware': 'U1', 'features': {'0000': '0'}},
+        '046d:c33f:00000005': [],
+    }))
+    cache = logitechd.protocol.cache.FeatureCache(str(path))
+    assert len(cache) == 1
+    assert cache.get(device.identity) == {0x0000: 0}
+
+
+def test_lazy(device):
+    assert device.protocol_version is None
+    assert len(device.io.interface.written) == 0
+
+    async def main():
+        indexes = await asyncio.gather(*(device.feature_index(0x8071) for _ in range(4)))
+        assert indexes == [FEATURES.index(0x8071)] * 4
+        assert await device.feature_index(0x2201) == 0
+
+    asyncio.run(main())
+    assert device.protocol_version == (4, 2)
+    assert device.features == {0x0000: 0, 0x8071: FEATURES.index(0x8071), 0x2201: 0}
+    assert len(device.io.interface.written) == 3  # ping, and one GetFeature per feature
+
+    asyncio.run(device.feature_index(0x8071))
+    assert len(device.io.interface.written) == 3
+
+
+def test_connection_notification(device):
+    device._device_index = 1
+    events = []
+    device.on_connection(lambda device, connected: events.append(connected))
+
+    for flags in (0x40, 0x00):
+        report = bytes([0x10, 0x01, logitechd.protocol.DEVICE_CONNECTION, 0x04, flags, 0x6a, 0x40])
+        device.handle_report(logitechd.protocol.report.Report.from_bytes(report))
+
+    assert events == [False, True]
+    assert device.connected is True
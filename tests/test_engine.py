@@ -0,0 +1,138 @@
+# SPDX-License-Identifier: MIT
+
+import asyncio
+
+import pytest
+
+import logitechd.backend
+import logitechd.protocol.engine
+import logitechd.protocol.report
+
+
+def reply(request, *data):
+    return logitechd.protocol.report.Report.from_bytes(request[:4] + bytes(data) + bytes(3 - len(data)))
+
+
+def test_pack_report():
+    assert logitechd.protocol.engine.pack_report(0xff, 0x01, 0x2, 0x3, b'\x04') == bytes([
+        0x10, 0xff, 0x01, 0x23, 0x04, 0x00, 0x00,
+    ])
+    assert len(logitechd.protocol.engine.pack_report(0x01, 0x01, 0x2, 0x3, bytes(4))) == 20
+    with pytest.raises(ValueError):
+        logitechd.protocol.engine.pack_report(0x01, 0x01, 0x2, 0x3, bytes(61))
+    # device without short reports
+    assert len(logitechd.protocol.engine.pack_report(0x01, 0x01, 0x2, 0x3, b'', {0x11: 20})) == 20
+
+
+def test_out_of_order(stub):
+    io = stub().io
+    engine = logitechd.protocol.engine.RequestEngine(io)
+
+    async def run():
+        first = asyncio.ensure_future(engine.request(0x01, 0x02, 0x1))
+        second = asyncio.ensure_future(engine.request(0x01, 0x02, 0x1))
+        await asyncio.sleep(0)
+
+        assert engine.in_flight == 2
+        first_request, second_request = io.interface.written
+        assert first_request[3] != second_request[3]  # different software IDs
+
+        assert engine.feed(reply(second_request, 0xbb))
+        assert engine.feed(reply(first_request, 0xaa))
+        assert not engine.feed(reply(first_request, 0xaa))  # already completed
+
+        return await first, await second
+
+    first, second = asyncio.run(run())
+    assert first[0] == 0xaa
+    assert second[0] == 0xbb
+    assert engine.in_flight == 0
+
+
+def test_error(stub):
+    io = stub().io
+    engine = logitechd.protocol.engine.RequestEngine(io)
+
+    async def run():
+        request = asyncio.ensure_future(engine.request(0x01, 0x02, 0x1))
+        await asyncio.sleep(0)
+        written = io.interface.written[0]
+        engine.feed(logitechd.protocol.report.Report.from_bytes(bytes([0x11, 0x01, 0xff, 0x02, written[3], 0x05]) + bytes(14)))
+        await request
+
+    with pytest.raises(logitechd.protocol.engine.HIDPPError) as e:
+        asyncio.run(run())
+    assert e.value.code == 0x05
+    assert not e.value.hidpp10
+
+
+def test_timeout_retry(stub):
+    io = stub().io
+    engine = logitechd.protocol.engine.RequestEngine(io, timeout=0.01, retries=2)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(engine.request(0x01, 0x02, 0x1))
+    assert len(io.interface.written) == 3
+    assert engine.in_flight == 0
+
+
+def test_retry_success(stub):
+    io = stub().io
+    engine = logitechd.protocol.engine.RequestEngine(io, timeout=0.01, retries=2)
+
+    async def run():
+        request = asyncio.ensure_future(engine.request(0x01, 0x02, 0x1))
+        while len(io.interface.written) < 2:
+            await asyncio.sleep(0.001)
+        engine.feed(reply(io.interface.written[1], 0xcc))
+        return await request
+
+    assert asyncio.run(run())[0] == 0xcc
+
+
+class QueueInterface(logitechd.backend.IODeviceInterface):
+    def __init__(self, *reports):
+        self.reports = list(reports)
+
+    def read(self):
+        raise BlockingIOError
+
+    def read_into(self, buffer):
+        if not self.reports:
+            raise BlockingIOError
+        data = self.reports.pop(0)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        pass
+
+
+def test_report_reader():
+    interface = QueueInterface(
+        bytes([0x11, 0x02, 0x04, 0x1a, 0x55]) + bytes(15),
+        bytes([0x20, 0x01, 0x02]),  # DJ report
+        bytes([0x10, 0xff, 0x00, 0x10]),  # short read
+        bytes([0x10, 0xff, 0x00, 0x10, 0x01, 0x02, 0x03]),
+    )
+    reader = logitechd.protocol.report.ReportReader(interface, {0x10: 7, 0x11: 20})
+    assert reader.size == 20
+
+    report = reader.read()
+    assert (report.report_id, report.device_index, report.feature_index, report.function, report.sw_id) == (
+        0x11, 0x02, 0x04, 0x1, 0xa,
+    )
+    assert len(report.raw) == 20
+    assert report.payload[0] == 0x55
+    report.release()
+
+    assert reader.read() is None
+    assert reader.read() is None
+
+    short = reader.read()
+    assert short is report  # buffers are reused
+    assert bytes(short.payload) == b'\x01\x02\x03'
+    short.release()
+
+    with pytest.raises(BlockingIOError):
+        reader.read()
@@ -0,0 +1,61 @@
+# SPDX-License-Identifier: MIT
+
+import os
+
+import pytest
+
+import logitechd.backend.hidraw
+
+
+@pytest.fixture()
+def pool():
+    pool = logitechd.backend.hidraw.HandlePool()
+    yield pool
+    for path in pool.leaks():
+        pool.release(path)
+
+
+@pytest.fixture()
+def node(tmp_path):
+    path = tmp_path / 'hidraw0'
+    path.write_bytes(b'')
+    return str(path)
+
+
+def is_open(fd):
+    try:
+        os.fstat(fd)
+    except OSError:
+        return False
+    return True
+
+
+def test_shared(pool, node):
+    probe = pool.open(node)
+    assert pool.open(node) is probe
+    assert len(pool) == 1 and node in pool
+
+    owner = object()
+    pool.claim(node, owner)
+    pool.claim(node, owner)
+    with pytest.raises(KeyError, match='already open'):
+        pool.claim(node, object())
+    assert pool.leaks() == {node: owner}
+
+    pool.release(node)
+    assert not is_open(probe.fd)
+    assert len(pool) == 0 and pool.leaks() == {}
+    with pytest.raises(KeyError, match='not open'):
+        pool.claim(node, owner)
+
+
+def test_stale(pool, node, tmp_path):
+    hidraw = pool.open(node)
+    replacement = tmp_path / 'new'
+    replacement.write_bytes(b'')
+    os.replace(replacement, node)  # the node went away and came back, without us noticing
+
+    reopened = pool.open(node)
+    assert reopened is not hidraw
+    assert os.fstat(reopened.fd).st_ino == os.stat(node).st_ino
+    assert len(pool) == 1
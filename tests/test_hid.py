@@ -5,12 +5,15 @@ import threading
 
 import ioctl.hidraw
 import pytest
-import uhid
 
-import logitechd.hid
+import logitechd.backend.hidraw
 
 
-def find_hidraw(device: uhid.AsyncUHIDDevice) -> ioctl.hidraw.Hidraw:
+uhid = pytest.importorskip('uhid')
+pytestmark = pytest.mark.skipif(not os.path.exists('/dev/uhid'), reason='needs /dev/uhid')
+
+
+def find_hidraw(device: 'uhid.AsyncUHIDDevice') -> str:
     visited = set()
 
     while True:
@@ -50,7 +53,8 @@ def device(vendor_rdesc):
 
 @pytest.fixture()
 def hidraw(device):
-    return logitechd.hid.Hidraw(find_hidraw(device))
+    with logitechd.backend.hidraw.HidrawDevice(find_hidraw(device), blocking=True) as interface:
+        yield interface
 
 
 @pytest.mark.timeout(1)
@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: MIT
+
+import pytest
+
+import logitechd.protocol.features
+import logitechd.protocol.hidpp20
+
+
+class GetFeature(logitechd.protocol.hidpp20.Function):
+    id = 0
+    request = {'feature': 'H'}
+    response = {'index': 'B', 'type': 'B', 'version': 'B'}
+
+
+class Changed(logitechd.protocol.hidpp20.Event):
+    id = 0
+    data = {'level': 'B', 'reserved': 'x', 'status': 'B'}
+
+
+def test_function_codec():
+    buffer = bytearray(7)
+    GetFeature.request_codec.pack_into(buffer, 4, 0x1000)
+    assert buffer[4:6] == b'\x10\x00'
+
+    response = GetFeature.response_codec.unpack_from(bytes([0x10, 0xff, 0x00, 0x01, 0x06, 0x00, 0x02]))
+    assert response == (0x06, 0x00, 0x02)
+    assert response.index == 0x06
+    assert response.version == 0x02
+
+
+def test_event_codec():
+    assert Changed.data_codec.fields == ('level', 'status')
+    assert Changed.data_codec.size == 3
+    data = Changed.data_codec.unpack_from(memoryview(bytes([0x11, 0x01, 0x04, 0x00, 0x50, 0xee, 0x01])))
+    assert data.level == 0x50
+    assert data.status == 0x01
+
+
+@pytest.mark.parametrize('data', [
+    {'value': 1},
+    {'value': 'Z'},
+    {'value': '61s'},
+    {'value': '2H'},
+    {'value': 'HB'},
+    {'value': '<H'},
+])
+def test_invalid_format(data):
+    with pytest.raises(ValueError):
+        type('Invalid', (logitechd.protocol.hidpp20.Event,), {'id': 0, 'data': data})
+
+
+def test_feature_tables():
+    feature = logitechd.protocol.features.OnboardProfiles
+    assert logitechd.protocol.hidpp20.FEATURES[0x8100] is feature
+    assert len(feature.functions) == len(feature.events) == 16
+    assert feature.functions[11] is feature.GetCurrentDpiIndex
+    assert feature.functions[9] is None
+    assert feature.events[:3] == (feature.CurrentProfileChanged, feature.CurrentDpiIndexChanged, None)
+
+
+@pytest.mark.parametrize('members', [
+    {'id': 0x10000},
+    {'id': 0x1234, 'First': GetFeature, 'Second': type('Second', (logitechd.protocol.hidpp20.Function,), {
+        'id': 0, 'response': {'value': 'B'},
+    })},
+    {'id': 0x1234, 'value': 1},
+    {'id': 0x8100},  # OnboardProfiles
+])
+def test_invalid_feature(members):
+    with pytest.raises(ValueError):
+        type('Invalid', (logitechd.protocol.hidpp20.Feature,), members)
+    assert 0x1234 not in logitechd.protocol.hidpp20.FEATURES
+    assert logitechd.protocol.hidpp20.FEATURES[0x8100] is logitechd.protocol.features.OnboardProfiles
+
+
+def test_invalid_function():
+    with pytest.raises(ValueError):
+        type('Invalid', (logitechd.protocol.hidpp20.Function,), {'id': 16, 'request': {}})
+
+
+def test_lazy_tuple():
+    codec = logitechd.protocol.hidpp20.Codec('Lazy', {'value': 'B', 'reserved': 'x'})
+    assert codec._tuple is None
+    assert codec.unpack_from(b'\x2a\x00', 0).value == 0x2a
+    assert codec.tuple is codec._tuple
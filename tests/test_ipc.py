@@ -0,0 +1,209 @@
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import socket
+
+import pytest
+
+import logitechd.backend
+import logitechd.ipc
+import logitechd.protocol.notifications
+import logitechd.protocol.report
+import logitechd.registry
+
+
+def echo(request):
+    '''Replies with the request parameters incremented by one'''
+    if request[2] == 0:  # IRoot: answer pings, every other feature is unsupported
+        return bytes([4, 2, request[6]]) if request[3] >> 4 == 1 else b''
+    return bytes((byte + 1) & 0xff for byte in request[4:])
+
+
+class DummyBackend(logitechd.backend.Backend):
+    def __init__(self, stub):
+        self._registry = logitechd.registry.DeviceRegistry()
+        self._notifications = logitechd.protocol.notifications.NotificationBus()
+        device = stub(echo, name='Echo Device', delay=0.001, notifications=self._notifications)
+        device._set_features({0x0000: 0, 0x8071: 4})
+        self._registry.add(device, '/dev/hidraw0', name=device.io.name)
+
+    @property
+    def devices(self):
+        return self._registry.devices
+
+    @property
+    def registry(self):
+        return self._registry
+
+    @property
+    def notifications(self):
+        return self._notifications
+
+    def attach(self, loop):
+        pass
+
+    def detach(self):
+        pass
+
+
+@pytest.fixture()
+def backend(stub):
+    return DummyBackend(stub)
+
+
+def run(backend, tmp_path, client_func):
+    async def main():
+        server = logitechd.ipc.Server(backend, str(tmp_path / 'logitechd.sock'))
+        await server.start()
+        try:
+            async with await logitechd.ipc.Client.connect(server.path) as client:
+                return await asyncio.wait_for(client_func(client), 1)
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_devices(backend, tmp_path):
+    devices = run(backend, tmp_path, lambda client: client.call('devices'))
+    assert devices == [{
+        'path': '/dev/hidraw0',
+        'name': 'Echo Device',
+        'vid': 0x046d,
+        'pid': 0xc33f,
+        'device_index': 0xff,
+        'serial': None,
+        'parent': None,
+        'protocol': None,
+        'features': {'0000': 0, '8071': 4},
+    }]
+
+
+def test_request(backend, tmp_path):
+    async def func(client):
+        return await asyncio.gather(
+            client.call('request', device='/dev/hidraw0', feature=0x8071, function=1, data='0102'),
+            client.call('request', device='/dev/hidraw0', feature_index=4, function=2, data='10'),
+        )
+
+    first, second = run(backend, tmp_path, func)
+    assert first.startswith('0203')
+    assert second.startswith('11')
+
+
+def test_batch(backend, tmp_path):
+    async def func(client):
+        return await client.batch([
+            ('request', {'device': '/dev/hidraw0', 'feature': 0x8071, 'function': 1, 'data': f'{zone:02x}ff0000'})
+            for zone in range(8)
+        ])
+
+    results = run(backend, tmp_path, func)
+    assert [result[:2] for result in results] == [f'{zone + 1:02x}' for zone in range(8)]
+
+
+def test_errors(backend, tmp_path):
+    async def func(client):
+        errors = []
+        for params in (
+            {'device': '/dev/hidraw9', 'feature': 0x8071, 'function': 1},
+            {'device': '/dev/hidraw0', 'feature': 0x1234, 'function': 1},
+        ):
+            with pytest.raises(logitechd.ipc.IPCError) as e:
+                await client.call('request', **params)
+            errors.append(e.value.type)
+        with pytest.raises(logitechd.ipc.IPCError) as e:
+            await client.call('nonexistent')
+        errors.append(e.value.type)
+        return errors
+
+    assert run(backend, tmp_path, func) == ['KeyError', 'KeyError', 'ValueError']
+
+
+def test_notifications(backend, tmp_path):
+    device, = backend.devices
+
+    async def func(client):
+        subscription = await client.call('subscribe', device='/dev/hidraw0', feature=0x8071)
+        report = bytes([0x11, 0xff, 0x04, 0x00, 0x2a]) + bytes(15)
+        device.handle_report(logitechd.protocol.report.Report.from_bytes(report))
+        async for pushed in client.notifications():
+            return subscription, pushed
+
+    subscription, (pushed_subscription, notification) = run(backend, tmp_path, func)
+    assert subscription == pushed_subscription
+    assert notification['device'] == '/dev/hidraw0'
+    assert notification['feature'] == 0x8071
+    assert notification['payload'].startswith('2a')
+
+
+def test_client_disconnect():
+    async def main():
+        ours, theirs = socket.socketpair()
+        client = logitechd.ipc.Client(*await asyncio.open_unix_connection(sock=ours), max_notifications=2)
+        peer_reader, peer_writer = await asyncio.open_unix_connection(sock=theirs)
+        calls = asyncio.gather(
+            client.call('devices'), client.batch([('devices', {}), ('metrics', {})]), return_exceptions=True,
+        )
+        for value in range(3):
+            peer_writer.write(logitechd.ipc._encode_message({'subscription': 1, 'notification': value}))
+        await peer_reader.readexactly(1)  # the calls went out
+        peer_writer.close()
+        results = await asyncio.wait_for(calls, 1)
+        notifications = client.notifications()
+        pushed = [await notifications.__anext__() for _ in range(2)]
+        await client.close()
+        return results, pushed, client.dropped
+
+    results, pushed, dropped = asyncio.run(main())
+    assert [type(result) for result in results] == [ConnectionError, ConnectionError]
+    assert pushed == [(1, 1), (1, 2)]
+    assert dropped == 1
+
+
+def test_client_cancel():
+    async def main():
+        ours, theirs = socket.socketpair()
+        client = logitechd.ipc.Client(*await asyncio.open_unix_connection(sock=ours))
+        peer_reader, peer_writer = await asyncio.open_unix_connection(sock=theirs)
+
+        async def reply(result):
+            request = await logitechd.ipc._read_message(peer_reader)
+            responses = [{'id': call['id'], 'result': result} for call in request] if isinstance(request, list) else {
+                'id': request['id'], 'result': result,
+            }
+            return logitechd.ipc._encode_message(responses)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.call('devices'), 0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.batch([('devices', {})]), 0.01)
+        peer_writer.write(await reply('late') + await reply(['late']))  # replies to the cancelled calls
+
+        call = asyncio.ensure_future(client.call('devices'))
+        peer_writer.write(await reply('on time'))
+        result = await asyncio.wait_for(call, 1)
+        peer_writer.close()
+        await client.close()
+        return result
+
+    assert asyncio.run(main()) == 'on time'
+
+
+def test_write(backend, tmp_path):
+    device, = backend.devices
+
+    async def func(client):
+        return await client.batch([
+            ('write', {'device': '/dev/hidraw0', 'feature': 0x8071, 'function': 1, 'data': f'00{value:02x}', 'target': 1})
+            for value in range(4)
+        ])
+
+    assert run(backend, tmp_path, func) == [None] * 4
+    assert device.writes.sent == 1
+    assert device.writes.coalesced == 3
+
+
+def test_metrics(backend, tmp_path):
+    text = run(backend, tmp_path, lambda client: client.call('metrics'))
+    assert '# TYPE logitechd_requests_total counter' in text
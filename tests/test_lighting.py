@@ -0,0 +1,133 @@
+# SPDX-License-Identifier: MIT
+
+import array
+import asyncio
+
+import pytest
+
+import logitechd.lighting
+
+from logitechd.protocol.features import PerKeyLighting
+
+
+ZONES = 16
+
+
+class Keyboard(object):
+    '''Keeps the zone colors, applying them on FrameEnd'''
+
+    def __init__(self):
+        self.staged = {}
+        self.zones = {}
+
+    def respond(self, request):
+        index, function, params = request[2], request[3] >> 4, request[4:]
+        if index == 0:  # IRoot.GetFeature
+            return bytes([1 if params[:2] == PerKeyLighting.id.to_bytes(2, 'big') else 0])
+        self.apply(function, params)
+        return params
+
+    def apply(self, function, params):
+        if function == PerKeyLighting.SetIndividualRgbZones.id:
+            updates = [([params[i]], params[i + 1:i + 4]) for i in range(0, 16, 4)]
+        elif function == PerKeyLighting.SetRangeRgbZones.id:
+            updates = [(range(params[i], params[i + 1] + 1), params[i + 2:i + 5]) for i in range(0, 15, 5)]
+        elif function == PerKeyLighting.SetRgbZonesSingleValue.id:
+            updates = [(params[3:16], params[:3])]
+        elif function == PerKeyLighting.FrameEnd.id:
+            self.zones.update(self.staged)
+            self.staged.clear()
+            return
+        for zones, color in updates:
+            self.staged.update({zone: color for zone in zones if zone != 0xff})
+
+    def frame(self):
+        return b''.join(self.zones.get(zone, b'\x00\x00\x00') for zone in range(ZONES))
+
+
+@pytest.fixture()
+def keyboard():
+    return Keyboard()
+
+
+@pytest.fixture()
+def device(stub, keyboard):
+    return stub(keyboard.respond)
+
+
+def solid(color, zones=ZONES):
+    return bytes(color) * zones
+
+
+def test_packer_unchanged():
+    packer = logitechd.lighting.FramePacker(ZONES)
+    packer.commit(solid((1, 2, 3)))
+    assert packer.pack(solid((1, 2, 3))) == []
+
+
+def test_packer_solid():
+    packer = logitechd.lighting.FramePacker(ZONES)
+    requests = packer.pack(solid((1, 2, 3)))
+    assert requests == [(PerKeyLighting.SetRangeRgbZones, bytes([0, ZONES - 1, 1, 2, 3]) + b'\xff' * 10)]
+
+
+def test_packer_diff():
+    packer = logitechd.lighting.FramePacker(ZONES)
+    packer.commit(solid((0, 0, 0)))
+    frame = bytearray(solid((0, 0, 0)))
+    frame[3:6] = b'\x01\x01\x01'
+    frame[30:33] = b'\x02\x02\x02'
+    assert packer.pack(frame) == [
+        (PerKeyLighting.SetIndividualRgbZones, b'\x01\x01\x01\x01\x0a\x02\x02\x02' + b'\xff' * 8),
+    ]
+
+
+def test_packer_single_value():
+    packer = logitechd.lighting.FramePacker(ZONES)
+    packer.commit(solid((0, 0, 0)))
+    frame = bytearray(solid((0, 0, 0)))
+    for zone in range(0, ZONES, 2):
+        frame[zone * 3:zone * 3 + 3] = b'\x07\x07\x07'
+    assert packer.pack(frame) == [
+        (PerKeyLighting.SetRgbZonesSingleValue, b'\x07\x07\x07' + bytes(range(0, ZONES, 2)) + b'\xff' * 5),
+    ]
+
+
+def test_packer_frame_size():
+    packer = logitechd.lighting.FramePacker(ZONES)
+    with pytest.raises(ValueError):
+        packer.pack(bytes(ZONES * 3 - 1))
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_render(device, keyboard, seed):
+    import random
+
+    rng = random.Random(seed)
+    pipeline = logitechd.lighting.FramePipeline(device, ZONES)
+
+    async def main():
+        for _ in range(8):
+            frame = array.array('B', (rng.choice((0, 0x80, 0xff)) for _ in range(ZONES * 3)))
+            await pipeline.render(frame)
+            assert keyboard.frame() == frame.tobytes()
+
+    asyncio.run(main())
+    assert pipeline.frames <= 8
+
+
+def test_drop(device, keyboard):
+    pipeline = logitechd.lighting.FramePipeline(device, ZONES, fps=1000)
+
+    async def main():
+        task = asyncio.ensure_future(pipeline.run())
+        for value in range(1, 6):
+            pipeline.submit(solid((value, value, value)))
+        for _ in range(10):
+            await asyncio.sleep(0.005)
+        task.cancel()
+
+    asyncio.run(main())
+    assert pipeline.dropped == 4
+    assert pipeline.frames == 1
+    assert keyboard.frame() == solid((5, 5, 5))
@@ -0,0 +1,108 @@
+# SPDX-License-Identifier: MIT
+
+import asyncio
+
+import pytest
+
+import logitechd.backend.simulator
+import logitechd.metrics
+import logitechd.protocol.engine
+
+
+def test_histogram():
+    histogram = logitechd.metrics.Histogram((0.001, 0.01))
+    for value in (0.0005, 0.001, 0.005, 1):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(1.0065)
+
+
+def test_registry():
+    registry = logitechd.metrics.Registry()
+    counter = registry.counter('events_total', 'Events', kind='a')
+    assert registry.counter('events_total', 'Events', kind='a') is counter
+    assert registry.counter('events_total', 'Events', kind='b') is not counter
+    assert registry.device('/dev/hidraw0') is registry.device('/dev/hidraw0')
+    with pytest.raises(ValueError):
+        registry.histogram('events_total', 'Events')
+
+
+def test_remove_device():
+    registry = logitechd.metrics.Registry()
+    registry.device('/dev/hidraw0').requests.inc()
+    registry.device('/dev/hidraw1').requests.inc()
+    registry.counter('events_total', 'Events').inc()
+
+    registry.remove_device('/dev/hidraw0')
+    exposed = registry.expose()
+    assert '/dev/hidraw0' not in exposed
+    assert 'logitechd_requests_total{device="/dev/hidraw1"} 1' in exposed
+    assert 'events_total 1' in exposed
+    assert registry.device('/dev/hidraw0').requests.value == 0  # plugged in again
+
+
+def test_expose():
+    registry = logitechd.metrics.Registry()
+    registry.counter('events_total', 'Events', kind='a"b').inc(3)
+    histogram = registry.histogram('latency_seconds', 'Latency')
+    histogram.observe(0.0007)
+    histogram.observe(5)
+
+    lines = registry.expose().splitlines()
+    assert lines[:3] == [
+        '# HELP events_total Events',
+        '# TYPE events_total counter',
+        'events_total{kind="a\\"b"} 3',
+    ]
+    assert lines[3:5] == ['# HELP latency_seconds Latency', '# TYPE latency_seconds histogram']
+    assert 'latency_seconds_bucket{le="0.0005"} 0' in lines
+    assert 'latency_seconds_bucket{le="0.001"} 1' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in lines
+    assert lines[-1] == 'latency_seconds_count 2'
+
+
+def test_merge():
+    registries = [logitechd.metrics.Registry() for _ in range(2)]
+    for worker, registry in enumerate(registries):
+        registry.labels['worker'] = str(worker)
+        registry.counter('events_total', 'Events').inc(worker + 1)
+    registries[1].counter('errors_total', 'Errors').inc()
+
+    assert logitechd.metrics.merge(registry.expose() for registry in registries).splitlines() == [
+        '# HELP errors_total Errors',
+        '# TYPE errors_total counter',
+        'errors_total{worker="1"} 1',
+        '# HELP events_total Events',
+        '# TYPE events_total counter',
+        'events_total{worker="0"} 1',
+        'events_total{worker="1"} 2',
+    ]
+
+
+def test_engine_metrics():
+    io = logitechd.backend.simulator.SimulatedDevice('Metrics Device', drop_rate=0.3, seed=3)
+    backend = logitechd.backend.simulator.SimulatorBackend([io])
+    device, = backend.devices
+    device.engine.timeout = 0.005
+    device.engine.retries = 8
+
+    async def main():
+        backend.attach(asyncio.get_running_loop())
+        await asyncio.gather(*(device.request(0, 1, b'\x00\x00\x5a') for _ in range(10)))
+        with pytest.raises(logitechd.protocol.engine.HIDPPError):
+            await device.request(9, 0)
+
+    try:
+        asyncio.run(main())
+    finally:
+        backend.close()
+
+    metrics = io.metrics
+    assert metrics.requests.value == 11
+    assert metrics.retries.value == io.dropped
+    assert metrics.errors.value == 1
+    assert metrics.request_latency.count == 10
+    assert metrics.reports_written.value == io.requests
+    assert metrics.reports_read.value == io.requests - io.dropped
+    assert metrics.bytes_read.value == 20 * metrics.reports_read.value
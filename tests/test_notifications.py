@@ -0,0 +1,142 @@
+# SPDX-License-Identifier: MIT
+
+import asyncio
+
+import pytest
+
+import logitechd.metrics
+import logitechd.protocol
+import logitechd.protocol.notifications
+import logitechd.protocol.report
+
+
+Policy = logitechd.protocol.notifications.Policy
+
+
+class StubIO(object):
+    name = 'Stub Device'
+    report_lengths = {0x10: 7, 0x11: 20}
+    metrics = logitechd.metrics.Registry().device(name)
+
+
+@pytest.fixture()
+def bus():
+    return logitechd.protocol.notifications.NotificationBus()
+
+
+@pytest.fixture()
+def device(bus):
+    device = logitechd.protocol.Device(StubIO(), 0x01, bus)
+    device._set_features({0x0000: 0, 0x0001: 1, 0x1000: 2})
+    return device
+
+
+def notify(device, feature_index, event, *data):
+    report = bytes([0x11, device.device_index, feature_index, event << 4, *data])
+    device.handle_report(logitechd.protocol.report.Report.from_bytes(report + bytes(20 - len(report))))
+
+
+def test_decode(bus, device):
+    subscription = bus.subscribe()
+    notify(device, 0x02, 0x0, 0x50, 0x32, 0x01)
+
+    notification = subscription.get_nowait()
+    assert notification.device is device
+    assert notification.feature_id == 0x1000
+    assert notification.data == (0x50, 0x32, 0x01)
+    assert notification.data.level == 0x50
+
+
+def test_dispatch(bus, device):
+    device._set_features({0x0000: 0, 0x8100: 3, 0x1234: 4})  # OnboardProfiles, and a feature not in the catalog
+    subscription = bus.subscribe()
+    notify(device, 0x03, 0x1, 0x02)
+    notify(device, 0x03, 0x5, 0x02)  # not an event of the feature
+    notify(device, 0x04, 0x0, 0x02)
+    notify(device, 0x02, 0x0, 0x50)  # no longer known
+
+    notifications = [subscription.get_nowait() for _ in range(4)]
+    assert [notification.feature_id for notification in notifications] == [0x8100, 0x8100, 0x1234, None]
+    assert notifications[0].data.index == 0x02
+    assert [notification.data for notification in notifications[1:]] == [None, None, None]
+
+
+def test_filter(bus, device):
+    other = logitechd.protocol.Device(StubIO(), 0x02, bus)
+    everything = bus.subscribe()
+    by_device = bus.subscribe(device)
+    by_feature = bus.subscribe(feature=0x1000)
+    by_event = bus.subscribe(device, 0x1000, 0x1)
+
+    notify(device, 0x02, 0x0, 0x50)
+    notify(other, 0x02, 0x0, 0x50)  # unknown feature for this device
+
+    assert len(everything) == 2
+    assert len(by_device) == 1
+    assert len(by_feature) == 1
+    assert len(by_event) == 0
+
+    by_device.close()
+    assert len(bus) == 3
+    notify(device, 0x02, 0x0, 0x50)
+    assert len(by_device) == 1
+
+
+def test_drop_oldest(bus, device):
+    subscription = bus.subscribe(maxsize=2)
+    for level in range(4):
+        notify(device, 0x02, 0x0, level)
+
+    assert subscription.dropped == 2
+    assert [subscription.get_nowait().data.level for _ in range(2)] == [2, 3]
+    with pytest.raises(IndexError):
+        subscription.get_nowait()
+
+
+def test_coalesce(bus, device):
+    subscription = bus.subscribe(maxsize=2, policy=Policy.COALESCE)
+    notify(device, 0x02, 0x0, 0x10)
+    notify(device, 0x02, 0x1, 0x20)
+    notify(device, 0x02, 0x0, 0x30)
+
+    assert len(subscription) == 2
+    assert [(n.event, n.payload[0]) for n in (subscription.get_nowait(), subscription.get_nowait())] == [
+        (0x1, 0x20),
+        (0x0, 0x30),
+    ]
+
+
+def test_get(bus, device):
+    subscription = bus.subscribe(device)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        loop.call_soon(notify, device, 0x02, 0x0, 0x42)
+        async for notification in subscription:
+            return notification
+
+    assert asyncio.run(run()).data.level == 0x42
+
+
+def test_concurrent_get(bus, device):
+    subscription = bus.subscribe(device)
+
+    async def run():
+        getters = [asyncio.ensure_future(subscription.get()) for _ in range(3)]
+        await asyncio.sleep(0)
+        getters[0].cancel()  # skipped, without losing a notification
+        await asyncio.sleep(0)
+        notify(device, 0x02, 0x0, 0x10)
+        notify(device, 0x02, 0x0, 0x20)
+        done, _ = await asyncio.wait(getters[1:], timeout=1)
+        return [getter.result().data.level for getter in getters[1:] if getter in done]
+
+    assert asyncio.run(run()) == [0x10, 0x20]
+
+
+def test_replies_not_published(bus, device):
+    subscription = bus.subscribe()
+    notify(device, 0x02, 0x0, 0x50)
+    report = bytes([0x11, 0x01, 0x02, 0x05]) + bytes(16)  # software ID set, reply to someone else
+    device.handle_report(logitechd.protocol.report.Report.from_bytes(report))
+    assert len(subscription) == 1
@@ -0,0 +1,76 @@
+# SPDX-License-Identifier: MIT
+
+import logitechd.rdesc
+
+
+HIDPP_RDESC = [
+    0x06, 0x00, 0xff,   # Usage Page (Vendor Page)
+    0x09, 0x01,         # Usage (Vendor Usage 1)
+    0xa1, 0x01,         # Collection (Application)
+    0x85, 0x10,         # .Report ID (0x10)
+    0x75, 0x08,         # .Report Size (8)
+    0x95, 0x06,         # .Report Count (6)
+    0x15, 0x00,         # .Logical Minimum (0)
+    0x26, 0xff, 0x00,   # .Logical Maximum (255)
+    0x09, 0x01,         # .Usage (Vendor Usage 1)
+    0x81, 0x00,         # .Input (Data,Arr,Abs)
+    0x09, 0x01,         # .Usage (Vendor Usage 1)
+    0x91, 0x00,         # .Output (Data,Arr,Abs)
+    0xc0,               # End Collection
+    0x06, 0x00, 0xff,   # Usage Page (Vendor Page)
+    0x09, 0x02,         # Usage (Vendor Usage 2)
+    0xa1, 0x01,         # Collection (Application)
+    0x85, 0x11,         # .Report ID (0x11)
+    0x75, 0x08,         # .Report Size (8)
+    0x95, 0x13,         # .Report Count (19)
+    0x15, 0x00,         # .Logical Minimum (0)
+    0x26, 0xff, 0x00,   # .Logical Maximum (255)
+    0x09, 0x02,         # .Usage (Vendor Usage 2)
+    0x81, 0x00,         # .Input (Data,Arr,Abs)
+    0x09, 0x02,         # .Usage (Vendor Usage 2)
+    0x91, 0x00,         # .Output (Data,Arr,Abs)
+    0xc0,               # End Collection
+]
+
+MOUSE_RDESC = [
+    0x05, 0x01,         # Usage Page (Generic Desktop)
+    0x09, 0x02,         # Usage (Mouse)
+    0xa1, 0x01,         # Collection (Application)
+    0x05, 0x09,         # .Usage Page (Button)
+    0x75, 0x01,         # .Report Size (1)
+    0x95, 0x05,         # .Report Count (5)
+    0x81, 0x02,         # .Input (Data,Var,Abs)
+    0x95, 0x03,         # .Report Count (3)
+    0x81, 0x01,         # .Input (Cnst,Arr,Abs)
+    0xc0,               # End Collection
+]
+
+
+def test_vendor(vendor_rdesc):
+    rdesc = logitechd.rdesc.parse(vendor_rdesc)
+    assert rdesc.vendor
+    assert rdesc.usage_pages == {0xff00}
+    assert rdesc.reports == {0x20: logitechd.rdesc.Report(0x20, input_size=9, output_size=9)}
+    assert rdesc.collections == (logitechd.rdesc.Collection(0x01, 0xff00, 0x00),)
+    assert rdesc.hidpp_reports == {}
+
+
+def test_hidpp():
+    rdesc = logitechd.rdesc.parse(HIDPP_RDESC)
+    assert rdesc.vendor
+    assert rdesc.hidpp_reports == {0x10: 7, 0x11: 20}
+
+
+def test_mouse():
+    rdesc = logitechd.rdesc.parse(MOUSE_RDESC)
+    assert not rdesc.vendor
+    assert rdesc.reports == {0: logitechd.rdesc.Report(0, input_size=1)}
+
+
+def test_cached(vendor_rdesc):
+    assert logitechd.rdesc.parse(vendor_rdesc) is logitechd.rdesc.parse(list(vendor_rdesc))
+
+
+def test_truncated(vendor_rdesc):
+    assert logitechd.rdesc.parse(vendor_rdesc[:2]).usage_pages == set()
+    assert logitechd.rdesc.parse([0xfe]).reports == {}
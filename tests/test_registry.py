@@ -0,0 +1,69 @@
+# SPDX-License-Identifier: MIT
+
+import pytest
+
+import logitechd.metrics
+import logitechd.protocol
+import logitechd.registry
+
+
+class StubIO(object):
+    def __init__(self, name, pid):
+        self.name = name
+        self.info = (0x03, 0x046d, pid)
+        self.metrics = logitechd.metrics.Registry().device(name)
+
+
+def device(name, pid, device_index=0xff):
+    return logitechd.protocol.Device(StubIO(name, pid), device_index)
+
+
+@pytest.fixture()
+def registry():
+    registry = logitechd.registry.DeviceRegistry()
+    registry.add(device('Receiver', 0xc539), '/dev/hidraw0', name='Receiver')
+    registry.add(device('Mouse', 0x4079, 1), '/dev/hidraw1', name='Mouse', parent='/dev/hidraw0', serial='1234')
+    registry.add(device('Keyboard', 0x407c, 2), '/dev/hidraw2', name='Keyboard', parent='/dev/hidraw0')
+    registry.add(device('G815', 0xc33f), '/dev/hidraw3', name='G815')
+    return registry
+
+
+def test_indexes(registry):
+    assert len(registry) == 4
+    assert '/dev/hidraw1' in registry
+    assert registry.get('/dev/hidraw1').name == 'Mouse'
+    assert [entry.path for entry in registry.by_id(0x046d, 0xc33f)] == ['/dev/hidraw3']
+    assert registry.by_receiver('/dev/hidraw0', 2).name == 'Keyboard'
+    assert registry.by_serial('1234').path == '/dev/hidraw1'
+    assert [entry.name for entry in registry.roots] == ['Receiver', 'G815']
+    assert [entry.name for entry in registry.get('/dev/hidraw0').children] == ['Mouse', 'Keyboard']
+
+
+def test_snapshot(registry):
+    snapshot = registry.devices
+    assert registry.devices is snapshot  # no allocation per access
+    assert len(snapshot) == 4
+
+    registry.remove('/dev/hidraw3')
+    assert len(snapshot) == 4  # old snapshots are not mutated
+    assert len(registry.devices) == 3
+
+
+def test_remove_subtree(registry):
+    removed = registry.remove('/dev/hidraw0')
+    assert {entry.name for entry in removed} == {'Receiver', 'Mouse', 'Keyboard'}
+    assert len(registry) == 1
+    assert registry.by_receiver('/dev/hidraw0', 1) is None
+    assert registry.by_serial('1234') is None
+    assert registry.remove('/dev/hidraw0') == []
+
+
+def test_remove_child(registry):
+    registry.remove('/dev/hidraw1')
+    assert [entry.name for entry in registry.get('/dev/hidraw0').children] == ['Keyboard']
+    assert registry.by_id(0x046d, 0x4079) == ()
+
+
+def test_duplicate(registry):
+    with pytest.raises(KeyError):
+        registry.add(device('G815', 0xc33f), '/dev/hidraw3')
@@ -0,0 +1,170 @@
+# SPDX-License-Identifier: MIT
+
+import asyncio
+
+import pytest
+
+import logitechd.protocol.scheduler
+
+
+def ack(request):
+    return b''
+
+
+@pytest.fixture()
+def device(stub):
+    return stub(ack, info=(0x03, 0x046d, 0xc53f), delay=0.001)
+
+
+def writes(device):
+    return [(request[2], request[3] >> 4, request[4:].rstrip(b'\x00')) for request in device.io.interface.written]
+
+
+def test_coalesce(device):
+    async def main():
+        await asyncio.gather(*(
+            device.write(4, 2, bytes([0, dpi >> 8, dpi & 0xff]), target=1)
+            for dpi in (400, 800, 1600)
+        ))
+
+    asyncio.run(main())
+    assert writes(device) == [(4, 2, bytes([0, 1600 >> 8, 1600 & 0xff]))]
+    assert device.writes.coalesced == 2
+    assert device.writes.sent == 1
+
+
+def test_send_tasks(stub):
+    device = stub()  # never acks
+
+    async def main():
+        asyncio.ensure_future(device.write(4, 2, b'\x00\x01', target=1))
+        while not device.writes.sent:
+            await asyncio.sleep(0.001)
+        return len(device.writes._sending)
+
+    assert asyncio.run(main()) == 1
+    assert not device.writes._sending
+
+
+def test_targets(device):
+    async def main():
+        await asyncio.gather(
+            device.write(4, 2, b'\x00\x01', target=1),
+            device.write(4, 2, b'\x01\x02', target=1),
+            device.write(4, 3, b'\x00\x03', target=1),
+            device.write(5, 2, b'\x00\x04', target=1),
+        )
+
+    asyncio.run(main())
+    assert sorted(writes(device)) == [(4, 2, b'\x00\x01'), (4, 2, b'\x01\x02'), (4, 3, b'\x00\x03'), (5, 2, b'\x00\x04')]
+
+
+def test_skip_current_value(device):
+    async def main():
+        await device.write(4, 2, b'\x00\x01', target=1)
+        await device.write(4, 2, b'\x00\x01', target=1)
+        device.writes.invalidate(5)
+        await device.write(4, 2, b'\x00\x01', target=1)
+        device.writes.invalidate(4)
+        await device.write(4, 2, b'\x00\x01', target=1)
+
+    asyncio.run(main())
+    assert writes(device) == [(4, 2, b'\x00\x01')] * 2
+    assert device.writes.skipped == 2
+
+
+def test_set_back_while_held(device):
+    async def main():
+        await device.write(4, 2, b'\x00\x01', target=1)
+        await asyncio.gather(
+            device.write(4, 2, b'\x00\x02', target=1),
+            device.write(4, 2, b'\x00\x01', target=1),
+        )
+
+    asyncio.run(main())
+    assert writes(device) == [(4, 2, b'\x00\x01')]
+
+
+def test_window(device):
+    device.writes.window = 0.05
+
+    async def main():
+        task = asyncio.ensure_future(device.write(4, 2, b'\x01'))
+        await asyncio.sleep(0.01)
+        assert writes(device) == []
+        await task
+        assert writes(device) == [(4, 2, b'\x01')]
+
+    asyncio.run(main())
+
+
+def test_receiver_in_flight_limit():
+    scheduler = logitechd.protocol.scheduler.ReceiverScheduler(2)
+    peak = 0
+
+    async def request(device):
+        nonlocal peak
+        async with scheduler.slot(device):
+            peak = max(peak, scheduler.in_flight)
+            await asyncio.sleep(0.001)
+
+    async def main():
+        await asyncio.gather(*(request(i % 3) for i in range(12)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert scheduler.in_flight == 0
+    assert len(scheduler) == 0
+
+
+def test_receiver_round_robin():
+    scheduler = logitechd.protocol.scheduler.ReceiverScheduler(1)
+    order = []
+
+    async def request(device, priority=logitechd.protocol.scheduler.Priority.INTERACTIVE):
+        async with scheduler.slot(device, priority):
+            order.append(device)
+            await asyncio.sleep(0)
+
+    async def main():
+        # the keyboard queues up a burst before the mouse gets a chance
+        await asyncio.gather(
+            *(request('keyboard', logitechd.protocol.scheduler.Priority.BACKGROUND) for _ in range(4)),
+            *(request('keyboard') for _ in range(4)),
+            *(request('mouse') for _ in range(2)),
+        )
+
+    asyncio.run(main())
+    assert order == [
+        'keyboard',  # got the free slot right away
+        'keyboard', 'mouse', 'keyboard', 'mouse', 'keyboard', 'keyboard',
+        'keyboard', 'keyboard', 'keyboard',
+    ]
+
+
+def test_receiver_cancel():
+    scheduler = logitechd.protocol.scheduler.ReceiverScheduler(1)
+
+    async def main():
+        async with scheduler.slot('mouse'):
+            waiter = asyncio.ensure_future(scheduler._acquire('keyboard', 0))
+            await asyncio.sleep(0)
+            assert len(scheduler) == 1
+            waiter.cancel()
+            await asyncio.sleep(0)
+            assert len(scheduler) == 0
+        assert scheduler.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_device_scheduler(stub):
+    scheduler = logitechd.protocol.scheduler.ReceiverScheduler(1)
+    devices = [stub(ack, delay=0.001, device_index=index, scheduler=scheduler) for index in (1, 2)]
+
+    async def main():
+        await asyncio.gather(*(device.request(4, 1) for device in devices for _ in range(3)))
+
+    asyncio.run(main())
+    assert scheduler.in_flight == 0
+    assert all(len(device.io.interface.written) == 3 for device in devices)
@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: MIT
+
+import asyncio
+
+import pytest
+
+import logitechd.backend.simulator
+import logitechd.protocol.engine
+
+
+@pytest.fixture()
+def run():
+    backends = []
+
+    def run(backend, func):
+        backends.append(backend)
+
+        async def main():
+            backend.attach(asyncio.get_running_loop())
+            try:
+                return await asyncio.wait_for(func(backend), 5)
+            finally:
+                backend.detach()
+
+        return asyncio.run(main())
+
+    yield run
+    for backend in backends:
+        backend.close()
+
+
+def entry(backend, path):
+    return backend.registry.get(path).device
+
+
+def test_discover(run):
+    io = logitechd.backend.simulator.SimulatedDevice('Keyboard', features=[0x1b04, 0x8081], latency=0.001)
+    backend = logitechd.backend.simulator.SimulatorBackend([io])
+
+    async def func(backend):
+        device = entry(backend, 'sim/0')
+        await device.discover()
+        return device
+
+    device = run(backend, func)
+    assert device.protocol_version == (4, 2)
+    assert device.features == {0x0000: 0, 0x0001: 1, 0x0003: 2, 0x1b04: 3, 0x8081: 4}
+    assert device.identity.firmware == 'SIM01.00.0000'
+
+
+def test_errors(run):
+    backend = logitechd.backend.simulator.SimulatorBackend([logitechd.backend.simulator.SimulatedDevice()])
+
+    async def func(backend):
+        device = entry(backend, 'sim/0')
+        errors = []
+        for index, function in ((9, 0), (0, 9)):
+            with pytest.raises(logitechd.protocol.engine.HIDPPError) as e:
+                await device.request(index, function)
+            errors.append(e.value.code)
+        return errors
+
+    assert run(backend, func) == [
+        logitechd.backend.simulator.ERR_INVALID_FEATURE_INDEX,
+        logitechd.backend.simulator.ERR_INVALID_FUNCTION_ID,
+    ]
+
+
+def test_drop(run):
+    io = logitechd.backend.simulator.SimulatedDevice(drop_rate=0.5, seed=1)
+    backend = logitechd.backend.simulator.SimulatorBackend([io])
+
+    async def func(backend):
+        device = entry(backend, 'sim/0')
+        device.engine.timeout = 0.01
+        device.engine.retries = 10
+        await asyncio.gather(*(device.request(0, 1, b'\x00\x00\x5a') for _ in range(10)))
+
+    run(backend, func)
+    assert io.dropped > 0
+    assert io.requests == 10 + io.dropped
+
+
+def test_handlers_and_notifications(run):
+    io = logitechd.backend.simulator.SimulatedDevice(
+        features=[0x1000],
+        handlers={(0x1000, 0): lambda params: b'\x50\x20'},
+    )
+    backend = logitechd.backend.simulator.SimulatorBackend([io])
+
+    async def func(backend):
+        device = entry(backend, 'sim/0')
+        subscription = backend.notifications.subscribe(device)
+        index = await device.feature_index(0x1000)
+        reply = await device.request(index, 0)
+        io.notify(0x1000, 0, b'\x10')
+        notification = await subscription.get()
+        return reply[:2], notification.feature_id, notification.payload[:1]
+
+    assert run(backend, func) == (b'\x50\x20', 0x1000, b'\x10')
+
+
+def test_receiver(run):
+    receiver = logitechd.backend.simulator.SimulatedReceiver()
+    mouse = logitechd.backend.simulator.SimulatedDevice('Mouse', 0x407f)
+    keyboard = logitechd.backend.simulator.SimulatedDevice('Keyboard', 0x408e)
+    receiver.pair(mouse)
+    receiver.pair(keyboard, 3)
+    backend = logitechd.backend.simulator.SimulatorBackend([receiver])
+
+    async def func(backend):
+        events = []
+        entry(backend, 'sim/0/3').on_connection(lambda device, connected: events.append(connected))
+        receiver.set_connected(3, False)
+        await asyncio.sleep(0.01)
+        assert not keyboard.online
+
+        receiver.set_connected(3, True)
+        await asyncio.sleep(0.01)
+        versions = await asyncio.gather(*(device.resolve_protocol() for device in backend.devices))
+        return events, sorted(versions)
+
+    events, versions = run(backend, func)
+    assert [entry.path for entry in backend.registry] == ['sim/0', 'sim/0/1', 'sim/0/3']
+    assert backend.registry.by_receiver('sim/0', 3).name == 'Keyboard'
+    assert events == [False, True]
+    assert versions == [(1, 0), (4, 2), (4, 2)]
+
+
+def test_receiver_slots():
+    receiver = logitechd.backend.simulator.SimulatedReceiver()
+    devices = [logitechd.backend.simulator.SimulatedDevice(f'Device {i}') for i in range(7)]
+    assert receiver.pair(devices[0], 2) == 2
+    assert [receiver.pair(device) for device in devices[1:6]] == [1, 3, 4, 5, 6]
+    with pytest.raises(KeyError):
+        receiver.pair(devices[6])
+    with pytest.raises(KeyError):
+        receiver.pair(devices[6], 2)
+    assert devices[6].device_index == 0xff
+    for device in (receiver, *devices):
+        device.close()
@@ -0,0 +1,170 @@
+# SPDX-License-Identifier: MIT
+
+import asyncio
+
+import pytest
+
+import logitechd.backend.simulator
+import logitechd.protocol.state
+
+
+@pytest.fixture()
+def run():
+    backends = []
+
+    def run(backend, func):
+        backends.append(backend)
+
+        async def main():
+            backend.attach(asyncio.get_running_loop())
+            try:
+                return await asyncio.wait_for(func(backend), 5)
+            finally:
+                backend.detach()
+
+        return asyncio.run(main())
+
+    yield run
+    for backend in backends:
+        backend.close()
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def battery(level):
+    return {(0x1000, 0): lambda params: bytes((level, 0, 0))}
+
+
+def test_cache(run):
+    clock = Clock()
+    io = logitechd.backend.simulator.SimulatedDevice(features=[0x1000], handlers=battery(80))
+    backend = logitechd.backend.simulator.SimulatorBackend([io])
+
+    async def func(backend):
+        device, = backend.devices
+        device.state._clock = clock
+        values = await asyncio.gather(*(device.state.get('battery') for _ in range(3)))
+        requests = io.requests
+        assert await device.state.get('battery') == values[0]
+        assert io.requests == requests  # served from the cache
+
+        clock.now += logitechd.protocol.state.ATTRIBUTES['battery'].ttl
+        assert device.state.peek('battery') is None
+        await device.state.get('battery')
+        assert io.requests == requests + 1
+        return values, device.state
+
+    values, state = run(backend, func)
+    assert [value.level for value in values] == [80, 80, 80]
+    assert (state.hits, state.misses) == (1, 4)
+
+
+def test_unsupported(run):
+    io = logitechd.backend.simulator.SimulatedDevice()
+    backend = logitechd.backend.simulator.SimulatorBackend([io])
+
+    async def func(backend):
+        device, = backend.devices
+        assert await device.state.get('dpi') is None
+        requests = io.requests
+        assert await device.state.get('dpi') is None
+        assert io.requests == requests
+        with pytest.raises(KeyError):
+            await device.state.get('color')
+
+    run(backend, func)
+
+
+def test_notifications(run):
+    io = logitechd.backend.simulator.SimulatedDevice(features=[0x1000], handlers=battery(80))
+    backend = logitechd.backend.simulator.SimulatorBackend([io])
+
+    async def func(backend):
+        device, = backend.devices
+        changes = []
+        device.state.on_change(lambda device, name, value: changes.append((name, value.level)))
+        await device.state.get('battery')
+        requests = io.requests
+        io.notify(0x1000, 0, b'\x4b\x32\x00')
+        io.notify(0x1000, 0, b'\x4b\x32\x00')  # no change
+        await asyncio.sleep(0.01)
+        assert device.state.peek('battery').level == 0x4b
+        assert io.requests == requests
+        return changes
+
+    assert run(backend, func) == [('battery', 80), ('battery', 0x4b)]
+
+
+def test_poller(run):
+    clock = Clock()
+    receiver = logitechd.backend.simulator.SimulatedReceiver()
+    mouse = logitechd.backend.simulator.SimulatedDevice('Mouse', 0x407f, features=[0x1000], handlers=battery(80))
+    keyboard = logitechd.backend.simulator.SimulatedDevice('Keyboard', 0x408e, features=[0x1000], handlers=battery(60))
+    receiver.pair(mouse, 1)
+    receiver.pair(keyboard, 2)
+    backend = logitechd.backend.simulator.SimulatorBackend([receiver])
+
+    async def func(backend):
+        devices = [backend.registry.get(path).device for path in ('sim/0/1', 'sim/0/2')]
+        for device in devices:
+            device.state._clock = clock
+        poller = logitechd.protocol.state.StatePoller(
+            lambda: devices, ['battery'], interval=10, max_interval=40, batch_window=10, clock=clock,
+        )
+        delays = []
+
+        async def poll(now):
+            clock.now = now
+            delays.append(await poller.poll())
+            return poller.polls
+
+        assert await poll(0) == 2
+        requests = mouse.requests
+        assert await poll(10) == 4  # unchanged, backing off
+        assert mouse.requests == requests  # still fresh in the cache
+
+        mouse.notify(0x1000, 0, b'\x4b\x00\x00')
+        await asyncio.sleep(0.01)
+        assert await poll(30) == 6  # the mouse changed, the keyboard backs off further
+        assert await poll(40) == 7  # the keyboard is not due for a while
+        assert await poll(60) == 9  # the keyboard is due soon, batched with the mouse
+
+        receiver.set_connected(1, False)
+        await asyncio.sleep(0.01)
+        assert await poll(200) == 10  # asleep
+        receiver.set_connected(1, True)
+        await asyncio.sleep(0.01)
+        assert await poll(201) == 11  # polled as it wakes up
+        return delays
+
+    assert run(backend, func)[:5] == [10, 20, 10, 20, 40]
+
+
+def test_poller_wakeup(run):
+    receiver = logitechd.backend.simulator.SimulatedReceiver()
+    mouse = logitechd.backend.simulator.SimulatedDevice('Mouse', 0x407f, features=[0x1000], handlers=battery(80))
+    receiver.pair(mouse, 1)
+    backend = logitechd.backend.simulator.SimulatorBackend([receiver])
+
+    async def func(backend):
+        device = backend.registry.get('sim/0/1').device
+        receiver.set_connected(1, False)
+        await asyncio.sleep(0.01)
+        poller = logitechd.protocol.state.StatePoller(lambda: [device], ['battery'], interval=60)
+        task = asyncio.ensure_future(poller.run())
+        await asyncio.sleep(0.01)
+        asleep = poller.polls
+
+        receiver.set_connected(1, True)
+        while not poller.polls:  # well before the interval
+            await asyncio.sleep(0.001)
+        task.cancel()
+        return asleep, poller.polls
+
+    assert run(backend, func) == (0, 1)
@@ -0,0 +1,132 @@
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import configparser
+import socket
+
+import pytest
+
+import logitechd.backend.simulator
+import logitechd.config
+import logitechd.ipc
+import logitechd.protocol.cache
+import logitechd.workers
+
+
+def battery(level):
+    return {(0x1000, 0): lambda params: bytes((level, 0, 0))}
+
+
+def simulated(shard):
+    io = logitechd.backend.simulator.SimulatedDevice(
+        f'Device {shard.index}', features=[0x1000], handlers=battery(50 + shard.index),
+    )
+    return logitechd.backend.simulator.SimulatorBackend([io], prefix=f'worker{shard.index}')
+
+
+def test_shards():
+    keys = [f'/sys/devices/usb1/1-{port}' for port in range(5)]
+    shards = logitechd.workers.shards(keys, 2)
+    assert [sum(shard(key) for key in keys) for shard in shards] == [3, 2]
+    for key in keys + ['/sys/devices/usb2/2-1', '/sys/devices/usb2/2-2']:  # plugged in later
+        assert sum(shard(key) for shard in shards) == 1
+    with pytest.raises(ValueError):
+        logitechd.workers.shards(keys, 0)
+
+
+def test_shard_config():
+    config = logitechd.config.parser()
+    config.read_string('[capture]\npath = /var/tmp/logitechd.cap\nrecords = 16\n[scheduler]\nin_flight = 2')
+    first, second = (logitechd.workers.shard_config(config, shard) for shard in logitechd.workers.shards([], 2))
+    assert [shard.get('capture', 'path') for shard in (first, second)] == [
+        '/var/tmp/logitechd.cap.0', '/var/tmp/logitechd.cap.1',
+    ]
+    assert second.getint('capture', 'records') == 16
+    assert second.getint('scheduler', 'in_flight') == 2
+    assert config.get('capture', 'path') == '/var/tmp/logitechd.cap'
+
+    assert [shard.get('discovery', 'cache') for shard in (first, second)] == [
+        f'{logitechd.protocol.cache.default_path()}.0', f'{logitechd.protocol.cache.default_path()}.1',
+    ]
+
+    config = logitechd.config.parser()
+    config.read_string('[discovery]\ncache = /var/cache/logitechd/features.json')
+    shard = logitechd.workers.shard_config(config, logitechd.workers.shards([], 1)[0])
+    assert shard.get('discovery', 'cache') == '/var/cache/logitechd/features.json.0'
+    assert not shard.has_option('capture', 'path')
+
+
+def test_router(tmp_path):
+    backends = [simulated(shard) for shard in logitechd.workers.shards([], 2)]
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        workers, serving = [], []
+        for backend in backends:  # in process workers, so that we can drive the simulated devices
+            backend.attach(loop)
+            ours, theirs = socket.socketpair()
+            reader, writer = await asyncio.open_unix_connection(sock=theirs)
+            serving.append(asyncio.ensure_future(logitechd.ipc.Server(backend)._serve(reader, writer)))
+            workers.append(logitechd.ipc.Client(*await asyncio.open_unix_connection(sock=ours)))
+
+        router = logitechd.workers.Router(workers, str(tmp_path / 'logitechd.sock'))
+        await router.start()
+        try:
+            async with await logitechd.ipc.Client.connect(router.path) as client:
+                result = await asyncio.wait_for(func(client), 1)
+            hanging_up = len(router._hanging_up)
+            while router._hanging_up:
+                await asyncio.sleep(0.001)
+            return result, hanging_up, sum(len(backend.notifications) for backend in backends)
+        finally:
+            await router.close()
+            for task in serving:
+                task.cancel()
+            for backend in backends:
+                backend.close()
+
+    async def func(client):
+        devices = [device['path'] for device in await client.call('devices')]
+        states = await asyncio.gather(*(client.call('state', device=path, name='battery') for path in devices))
+        with pytest.raises(logitechd.ipc.IPCError) as e:
+            await client.call('state', device='worker9/0', name='battery')
+        assert e.value.type == 'KeyError'
+
+        subscription = await client.call('subscribe', feature=0x1000)
+        backends[1]._simulated[0].notify(0x1000, 0, b'\x20\x00\x00')
+        async for pushed, notification in client.notifications():
+            await client.call('unsubscribe', subscription=subscription)
+            return devices, [state['level'] for state in states], (pushed == subscription, notification)
+
+    (devices, levels, (pushed, notification)), hanging_up, subscriptions = asyncio.run(main())
+    assert (hanging_up, subscriptions) == (2, 0)  # unsubscribed from both workers
+    assert devices == ['worker0/0', 'worker1/0']
+    assert levels == [50, 51]
+    assert pushed
+    assert notification['device'] == 'worker1/0'
+    assert notification['data']['level'] == 0x20
+
+
+def test_pool(tmp_path):
+    pool = logitechd.workers.WorkerPool(logitechd.workers.shards([], 2), simulated, configparser.ConfigParser())
+    pool.start()
+
+    async def main():
+        router = logitechd.workers.Router(await pool.connect(), str(tmp_path / 'logitechd.sock'))
+        await router.start()
+        try:
+            async with await logitechd.ipc.Client.connect(router.path) as client:
+                return await asyncio.wait_for(asyncio.gather(
+                    client.call('state', device='worker1/0', name='battery'),
+                    client.call('metrics'),
+                ), 5)
+        finally:
+            await router.close()
+
+    try:
+        state, metrics = asyncio.run(main())
+    finally:
+        pool.close()
+    assert state['level'] == 51
+    assert 'logitechd_requests_total{worker="1",device="Device 1"' in metrics
+    assert pool.exitcodes == [0, 0]